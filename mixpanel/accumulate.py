@@ -0,0 +1,217 @@
+"""Local pre-aggregation of People ``add`` increments"""
+from __future__ import absolute_import, unicode_literals
+
+import atexit
+import logging
+import os
+import sqlite3
+import threading
+
+from celery import signals
+
+from .conf import settings as mp_settings
+from .tasks import people_tracker
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryStore(object):
+    """
+    Keeps the pending sums of a single process in memory.
+    """
+
+    def __init__(self):
+        self._sums = {}
+        self._lock = threading.Lock()
+
+    def add(self, token, distinct_id, deltas):
+        """
+        Adds ``deltas`` to the pending sums of a profile and returns the
+        number of pending sums.
+        """
+        with self._lock:
+            for prop, delta in deltas.items():
+                key = (token, distinct_id, prop)
+                self._sums[key] = self._sums.get(key, 0) + delta
+            return len(self._sums)
+
+    def take(self):
+        """
+        Removes and returns every pending ``(token, distinct_id, property,
+        sum)``.
+        """
+        with self._lock:
+            sums, self._sums = self._sums, {}
+        return [key + (total,) for key, total in sums.items()]
+
+
+class SQLiteStore(object):
+    """
+    Keeps pending sums in the SQLite database at ``path``, so the worker
+    processes of a machine can share them.
+
+    Sums are taken out in a single transaction, so every increment is
+    flushed by exactly one process. Tokens, distinct ids and property names
+    come back with the types they were added with, like ``MemoryStore``.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        if self._conn is None or self._pid != os.getpid():
+            # Connections must not be shared with forked children.
+            self._conn = sqlite3.connect(self.path, timeout=30,
+                                         isolation_level=None,
+                                         check_same_thread=False)
+            # No column types, so SQLite keeps every value as it's given
+            # rather than turning numbers into text. ``add`` looks rows up
+            # with ``IS``, which matches NULL tokens too.
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS mixpanel_add ('
+                'token, distinct_id, property, delta)'
+            )
+            self._pid = os.getpid()
+        return self._conn
+
+    def add(self, token, distinct_id, deltas):
+        with self._lock:
+            conn = self._connection()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                for prop, delta in deltas.items():
+                    key = (token, distinct_id, prop)
+                    updated = conn.execute(
+                        'UPDATE mixpanel_add SET delta = delta + ? '
+                        'WHERE token IS ? AND distinct_id IS ? '
+                        'AND property IS ?', (delta,) + key,
+                    ).rowcount
+                    if not updated:
+                        conn.execute(
+                            'INSERT INTO mixpanel_add '
+                            '(token, distinct_id, property, delta) '
+                            'VALUES (?, ?, ?, ?)', key + (delta,),
+                        )
+                count, = conn.execute(
+                    'SELECT COUNT(*) FROM mixpanel_add'
+                ).fetchone()
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+            return count
+
+    def take(self):
+        with self._lock:
+            conn = self._connection()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                rows = conn.execute(
+                    'SELECT token, distinct_id, property, delta '
+                    'FROM mixpanel_add'
+                ).fetchall()
+                conn.execute('DELETE FROM mixpanel_add')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+        return [tuple(row) for row in rows]
+
+
+class AddAccumulator(object):
+    """
+    Sums the People ``add`` increments of each profile and property, and
+    queues the totals, one update per profile, as a ``PeopleBatchTracker``
+    task.
+
+    Totals are queued every ``interval`` seconds, or as soon as ``max_keys``
+    profile properties are pending. ``store`` keeps the pending sums, in
+    memory by default. Arguments left out default to the matching
+    ``MIXPANEL_ADD_*`` settings.
+
+    Pending sums are also queued when the process exits or a celery worker
+    shuts down. If queueing them fails, they're added back to ``store`` and
+    queued again ``interval`` seconds later. Accumulators are thread-safe.
+    """
+
+    def __init__(self, interval=None, max_keys=None, store=None):
+        self.interval = interval or mp_settings.MIXPANEL_ADD_FLUSH_INTERVAL
+        self.max_keys = max_keys or mp_settings.MIXPANEL_ADD_MAX_KEYS
+        if store is None:
+            if mp_settings.MIXPANEL_ADD_STORE:
+                store = SQLiteStore(mp_settings.MIXPANEL_ADD_STORE)
+            else:
+                store = MemoryStore()
+        self.store = store
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def add(self, properties, distinct_id, token=None):
+        """
+        Adds the numeric ``properties`` of an ``add`` update to the pending
+        sums of ``distinct_id``.
+        """
+        pending = self.store.add(token, distinct_id, properties)
+        if pending >= self.max_keys:
+            self.flush()
+            return
+        self._schedule()
+
+    def flush(self):
+        """
+        Queues the pending sums as one batch of ``add`` updates.
+        """
+        with self._lock:
+            timer, self._timer = self._timer, None
+        if timer is not None:
+            timer.cancel()
+
+        profiles = {}
+        for token, distinct_id, prop, total in self.store.take():
+            profiles.setdefault((token, distinct_id), {})[prop] = total
+        updates = []
+        for (token, distinct_id), sums in profiles.items():
+            kwargs = {'distinct_id': distinct_id}
+            if token is not None:
+                kwargs['token'] = token
+            updates.append(('add', sums, kwargs))
+        if not updates:
+            return
+        try:
+            people_tracker.batch(updates)
+        except Exception:
+            # Nothing was queued, so put the sums back rather than lose
+            # them, merged with any increments added in the meantime.
+            logger.exception("Queueing %d People add updates failed" %
+                             len(updates))
+            for (token, distinct_id), sums in profiles.items():
+                self.store.add(token, distinct_id, sums)
+            self._schedule()
+
+    def _schedule(self):
+        with self._lock:
+            if self._timer is None:
+                self._timer = threading.Timer(self.interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+
+#: The accumulator used by :func:`add`.
+add_accumulator = AddAccumulator()
+
+
+@atexit.register
+@signals.worker_process_shutdown.connect
+@signals.worker_shutdown.connect
+def _flush_on_shutdown(*args, **kwargs):
+    add_accumulator.flush()
+
+
+def add(properties, distinct_id, token=None):
+    """
+    Adds a People increment to the default :data:`add_accumulator`.
+    """
+    add_accumulator.add(properties, distinct_id, token=token)
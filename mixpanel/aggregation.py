@@ -0,0 +1,239 @@
+"""
+Worker-side batching of individually queued ``EventTracker`` messages.
+
+With :data:`mixpanel.conf.settings.MIXPANEL_AGGREGATE_EVENTS` turned on, the
+worker buffers ``mixpanel.tasks.EventTracker`` messages instead of running
+them one at a time. Buffered messages are grouped by token and sent as
+batched ``/track/`` requests, then acknowledged, or individually queued again
+with a countdown if their batch failed.
+"""
+from __future__ import absolute_import, unicode_literals
+
+from collections import OrderedDict
+
+from celery import current_app
+from celery.utils.log import get_task_logger
+from celery.worker.strategy import default as default_strategy
+
+try:
+    from celery_batches import Batches, SimpleRequest, apply_batches_task
+except ImportError:
+    # Celery < 4 shipped this as a contrib module.
+    from celery.contrib.batches import (
+        Batches,
+        SimpleRequest,
+        apply_batches_task,
+    )
+
+from . import deadletter, metrics
+from .batching import encode_params, split
+from .conf import settings as mp_settings
+from .dedupe import get_insert_id, recently_sent
+from .encoding import Encoded
+from .spool import get_spool
+from .tasks import (
+    EventTracker,
+    _unpack,
+    batch_event_tracker,
+    event_tracker,
+)
+
+logger = get_task_logger(__name__)
+
+
+class AggregatedRequest(SimpleRequest):
+    """
+    A buffered ``EventTracker`` message, including how often it was retried.
+    """
+    retries = 0
+
+    @classmethod
+    def from_request(cls, request):
+        simple = super(AggregatedRequest, cls).from_request(request)
+        simple.retries = request.request_dict.get('retries') or 0
+        return simple
+
+
+class EventAggregator(Batches):
+    """
+    Sends the buffered ``EventTracker`` messages of a worker in batches.
+    """
+    name = "mixpanel.aggregation.EventAggregator"
+    flush_every = mp_settings.MIXPANEL_AGGREGATE_FLUSH_EVERY
+    flush_interval = mp_settings.MIXPANEL_AGGREGATE_FLUSH_INTERVAL
+
+    def run(self, requests):
+        """
+        Sends the events of ``requests``, a list of buffered ``EventTracker``
+        messages, and queues the ones that couldn't be sent again.
+
+        Messages whose event can't be built are logged and dropped rather
+        than failing the rest of the buffer.
+        """
+        if mp_settings.MIXPANEL_DISABLE:
+            logger.info(
+                "Mixpanel disabled; not recording %d events" % len(requests),
+            )
+            return False
+
+        groups = OrderedDict()
+        for request in requests:
+            try:
+                key, params = self._prepare(request)
+            except Exception:
+                logger.exception(
+                    "Dropping malformed event message: <%r, %r>" %
+                    (request.args, request.kwargs),
+                )
+                continue
+            if get_insert_id(params) in recently_sent:
+                continue
+            groups.setdefault(key, []).append((request, params))
+
+        chunks = []
+        for (token, test), pending in groups.items():
+            batches = split(pending, lambda item: item[1].size)
+            for chunk, oversized in batches:
+                if oversized:
+                    request, params = chunk[0]
+                    metrics.incr('mixpanel.events.oversized')
+                    deadletter.send(EventTracker.name, params, "Event too "
+                                    "large to send: %d bytes" % params.size)
+                    continue
+                chunks.append((chunk, test))
+
+        try:
+            outcomes = batch_event_tracker._send_batches([
+                ([params for request, params in chunk], test)
+                for chunk, test in chunks
+            ])
+        except Exception:
+            # Some chunks may have been sent already, so handing the
+            # messages back to the broker would send them twice.
+            logger.exception("Sending %d aggregated events failed" %
+                             sum(len(chunk) for chunk, test in chunks))
+            return False
+        for (chunk, test), outcome in zip(chunks, outcomes):
+            self._handle_outcome(chunk, outcome, test)
+
+        return True
+
+    def _prepare(self, request):
+        """
+        Returns the ``(token, test)`` key of the batch the event of
+        ``request`` goes in, and its encoded params.
+        """
+        event_name, properties, test, kwargs = _unpack(
+            *request.args, **request.kwargs
+        )
+        if kwargs.pop('encoded', False):
+            # The token is inside the encoded event. Batches may mix
+            # tokens, so these are only kept apart by ``test``.
+            return (None, test), Encoded(*properties)
+        built = event_tracker._build_params(event_name, properties, **kwargs)
+        return (built['properties']['token'], test), encode_params(built)
+
+    def _handle_outcome(self, chunk, outcome, test):
+        """
+        Acts on the ``outcome`` of sending ``chunk`` with the ``test`` flag:
+        the result of ``_send_batch`` or the ``FailedEventRequest`` it
+        raised.
+        """
+        if isinstance(outcome, EventTracker.PartiallyRejected):
+            logger.info("Mixpanel refused %d of %d events" %
+                        (len(outcome.failed), len(chunk)))
+            recently_sent.add(
+                get_insert_id(params) for params in
+                event_tracker._dead_letter_refused(
+                    [params for request, params in chunk], outcome,
+                )
+            )
+        elif isinstance(outcome, EventTracker.FailedEventRequest):
+            logger.info(
+                "Batch failed. Retrying %d events: %s" % (len(chunk), outcome),
+            )
+            for request, params in chunk:
+                try:
+                    self._retry(request, params, outcome, test)
+                except Exception:
+                    logger.exception("Couldn't retry event: <%s>" %
+                                     request.args[0])
+        else:
+            recently_sent.add(
+                get_insert_id(params) for request, params in chunk
+            )
+            logger.info("Events recorded/logged: %d" % len(chunk))
+
+    def _retry(self, request, params, exc, test):
+        if not event_tracker.retry_policy.should_retry(exc):
+            deadletter.send(EventTracker.name, params, str(exc))
+            return
+        spool = get_spool()
+        if spool is not None and (
+                isinstance(exc, EventTracker.CircuitOpen) or
+                request.retries >= event_tracker.max_retries):
+            if isinstance(params, Encoded):
+                params = params.decode()
+            spool.write(EventTracker.name, [params], test)
+            return
+        if request.retries >= event_tracker.max_retries:
+            deadletter.send(EventTracker.name, params, str(exc))
+            return
+        event_tracker.apply_async(
+            args=request.args,
+            kwargs=request.kwargs,
+            task_id=request.id,
+            retries=request.retries + 1,
+            countdown=event_tracker.retry_policy.countdown(
+                request.retries, exc.retry_after,
+            ),
+        )
+
+    def flush(self, requests):
+        return self.apply_buffer(requests, (
+            [AggregatedRequest.from_request(r) for r in requests],
+        ))
+
+    def apply_buffer(self, requests, args=(), kwargs={}):
+        # Unlike Batches, always acknowledge once the batch is done: failed
+        # events have been queued again by then. ``run`` only crashes
+        # before sending anything, so hand the messages back to the broker
+        # then.
+        def on_return(result):
+            for request in requests:
+                if result is None:
+                    request.reject(requeue=True)
+                else:
+                    request.acknowledge()
+
+        return self._pool.apply_async(
+            apply_batches_task,
+            (self, args, 0, None),
+            callback=on_return,
+        )
+
+
+def _register(app):
+    # Mirror how celery registers old-style task classes, so worker pool
+    # processes can unpickle the aggregator by name.
+    tasks = app._tasks
+    if EventAggregator.name not in tasks:
+        tasks.register(EventAggregator())
+    instance = tasks[EventAggregator.name]
+    instance.bind(app)
+    return instance
+
+
+event_aggregator = _register(current_app._get_current_object())
+
+
+def strategy(task, app, consumer, **kwargs):
+    """
+    Worker strategy that hands ``EventTracker`` messages to the aggregator.
+
+    Set as ``EventTracker.Strategy`` when ``MIXPANEL_AGGREGATE_EVENTS`` is
+    on. Subclasses of ``EventTracker`` keep the default strategy.
+    """
+    if task.name != EventTracker.name:
+        return default_strategy(task, app, consumer, **kwargs)
+    return event_aggregator.Strategy(task, app, consumer)
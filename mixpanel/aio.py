@@ -0,0 +1,322 @@
+"""
+Sending many batches to Mixpanel concurrently from a single process.
+
+Uses asyncio streams to keep up to
+`:data:mixpanel.conf.settings.MIXPANEL_ASYNC_CONCURRENCY` requests in flight
+over as many keep-alive connections, instead of blocking the process on each
+round trip. The connections are kept open between calls on an event loop
+each process runs in a thread of its own. Requires python 3.5 or later, so
+it's only imported when
+`:data:mixpanel.conf.settings.MIXPANEL_ASYNC_TRANSPORT` is on.
+"""
+from __future__ import absolute_import, unicode_literals
+
+import asyncio
+import os
+import threading
+import time
+
+from . import concurrency
+from .conf import settings as mp_settings
+
+#: Errors that mean the server closed a kept-alive connection before it
+#: answered our request.
+STALE_ERRORS = (
+    BrokenPipeError,
+    ConnectionAbortedError,
+    ConnectionResetError,
+    asyncio.IncompleteReadError,
+)
+
+
+class HTTPError(Exception):
+    """
+    The server's response couldn't be understood.
+    """
+
+
+class Response(object):
+    """
+    A response from the api server, with the parts of the interface of
+    ``http.client.HTTPResponse`` that ``EventTracker`` relies on.
+    """
+
+    def __init__(self, status, reason, headers, body, will_close):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+        self.will_close = will_close
+
+    def getheader(self, name, default=None):
+        return self.headers.get(name.lower(), default)
+
+    def read(self):
+        return self.body
+
+
+class Connection(object):
+    """
+    A keep-alive HTTP/1.1 connection to ``host``, which may include a port.
+
+    Connecting and each read from the server are limited by the
+    ``MIXPANEL_API_CONNECT_TIMEOUT`` and ``MIXPANEL_API_READ_TIMEOUT``
+    settings.
+    """
+
+    def __init__(self, host):
+        self.host = host
+        name, _, port = host.rpartition(':')
+        if port.isdigit():
+            self._address = (name, int(port))
+        else:
+            self._address = (host, 80)
+        self._reader = self._writer = None
+
+    @property
+    def connected(self):
+        return self._writer is not None
+
+    async def request(self, method, url, body, headers):
+        """
+        Sends a request and returns its ``Response``.
+        """
+        if not self.connected:
+            self._reader, self._writer = await asyncio.wait_for(
+                asyncio.open_connection(*self._address),
+                mp_settings.MIXPANEL_API_CONNECT_TIMEOUT,
+            )
+        if isinstance(body, str):
+            body = body.encode('ascii')
+        lines = [
+            '%s %s HTTP/1.1' % (method, url),
+            'Host: %s' % self.host,
+            'Content-Length: %d' % len(body or b''),
+        ]
+        lines.extend('%s: %s' % header for header in headers.items())
+        head = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+        self._writer.write(head + (body or b''))
+        await self._writer.drain()
+        return await self._read_response()
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def _read_response(self):
+        status_line = await self._read(self._reader.readline())
+        if not status_line:
+            raise asyncio.IncompleteReadError(b'', None)
+        try:
+            version, status, reason = (
+                status_line.decode('latin-1').rstrip('\r\n').split(' ', 2)
+            )
+            status = int(status)
+        except ValueError:
+            raise HTTPError("Bad status line: %r" % status_line)
+
+        headers = {}
+        while True:
+            line = await self._read(self._reader.readline())
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        will_close = headers.get('connection', '').lower() == 'close'
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            body = await self._read_chunked()
+        elif 'content-length' in headers:
+            body = await self._read(
+                self._reader.readexactly(int(headers['content-length'])),
+            )
+        else:
+            body = await self._read(self._reader.read())
+            will_close = True
+        return Response(status, reason, headers, body, will_close)
+
+    async def _read_chunked(self):
+        chunks = []
+        while True:
+            size_line = await self._read(self._reader.readline())
+            try:
+                size = int(size_line.split(b';', 1)[0], 16)
+            except ValueError:
+                raise HTTPError("Bad chunk size: %r" % size_line)
+            if size == 0:
+                # Skip the trailers.
+                while await self._read(self._reader.readline()) not in (
+                        b'\r\n', b'\n', b''):
+                    pass
+                return b''.join(chunks)
+            chunks.append(await self._read(self._reader.readexactly(size)))
+            await self._read(self._reader.readline())
+
+    def _read(self, read):
+        return asyncio.wait_for(read, mp_settings.MIXPANEL_API_READ_TIMEOUT)
+
+
+class Sender(object):
+    """
+    Sends batches to ``host`` with at most
+    `:data:mixpanel.conf.settings.MIXPANEL_ASYNC_CONCURRENCY` requests in
+    flight, or fewer when the adaptive limit of :mod:`mixpanel.concurrency`
+    is lower, reusing idle connections for up to
+    `:data:mixpanel.conf.settings.MIXPANEL_CONNECTION_IDLE_TIMEOUT` seconds.
+
+    Must be created, and used, inside the event loop it belongs to.
+    """
+
+    def __init__(self, host):
+        self.host = host
+        self._gate = asyncio.Condition()
+        self._in_flight = 0
+        self._idle = []
+
+    async def send(self, task, params, test):
+        """
+        The coroutine version of ``task._send_batch``, including the
+        circuit breaker of ``task._send_request``.
+        """
+        async with self._gate:
+            await self._gate.wait_for(
+                lambda: self._in_flight < concurrency.get_limit(
+                    mp_settings.MIXPANEL_ASYNC_CONCURRENCY,
+                ),
+            )
+            self._in_flight += 1
+            sending = self._in_flight
+        started = concurrency.now()
+        failure = None
+        try:
+            with task._circuit_guard():
+                return await self._send(task, params, test)
+        except task.FailedEventRequest as e:
+            failure = e
+            raise
+        finally:
+            async with self._gate:
+                self._in_flight -= 1
+                self._gate.notify_all()
+            concurrency.record(started, failure, sending)
+
+    async def _send(self, task, params, test):
+        body = task._encode_batch(params, test)
+        url, body, headers = task._prepare_request(body, 'POST')
+        conn = self._get_connection()
+        reused = conn.connected
+        try:
+            try:
+                response = await self._request(conn, url, body, headers)
+            except STALE_ERRORS:
+                if not reused:
+                    raise
+                # The server closed the idle connection; try a fresh one.
+                conn.close()
+                conn = Connection(self.host)
+                response = await self._request(conn, url, body, headers)
+        except (OSError, EOFError, asyncio.TimeoutError, HTTPError) as e:
+            conn.close()
+            raise task.FailedEventRequest(
+                "The tracking request failed with a socket error. "
+                "Message: [%s]" % (str(e) or type(e).__name__)
+            )
+        except BaseException:
+            # The request may be half sent; never reuse the connection.
+            conn.close()
+            raise
+
+        if response.will_close:
+            conn.close()
+        else:
+            self._idle.append((conn, time.time()))
+        return task._check_response(response)
+
+    def _get_connection(self):
+        now = time.time()
+        while self._idle:
+            conn, released_at = self._idle.pop()
+            if (now - released_at <
+                    mp_settings.MIXPANEL_CONNECTION_IDLE_TIMEOUT):
+                return conn
+            conn.close()
+        return Connection(self.host)
+
+    async def _request(self, conn, url, body, headers):
+        request = conn.request('POST', url, body, headers)
+        deadline = mp_settings.MIXPANEL_API_DEADLINE
+        if deadline is None:
+            return await request
+        return await asyncio.wait_for(request, deadline)
+
+    def close(self):
+        idle, self._idle = self._idle, []
+        for conn, released_at in idle:
+            conn.close()
+
+
+_loop = None
+_loop_pid = None
+_loop_lock = threading.Lock()
+
+# The senders of the current process's loop by host. Only touched from the
+# loop's thread.
+_senders = {}
+
+
+def get_loop():
+    """
+    Returns the current process's event loop, which runs in a thread of its
+    own so its connections stay open between calls.
+
+    Forked children (such as Celery's prefork pool processes) start a loop
+    of their own rather than sharing their parent's sockets.
+    """
+    global _loop, _loop_pid
+
+    with _loop_lock:
+        if _loop is None or _loop_pid != os.getpid():
+            # The idle connections belong to our parent. Forget them without
+            # closing them so we don't interfere with its requests.
+            _senders.clear()
+            _loop = asyncio.new_event_loop()
+            _loop_pid = os.getpid()
+            thread = threading.Thread(target=_loop.run_forever,
+                                      name='mixpanel-aio')
+            thread.daemon = True
+            thread.start()
+        return _loop
+
+
+def send_batches(task, batches):
+    """
+    Sends each ``(params, test)`` batch with ``task`` concurrently and
+    returns, in order, the result of ``task._send_batch`` for it or the
+    ``FailedEventRequest`` it raised.
+
+    The batches are sent from the loop of :func:`get_loop`, so this blocks
+    until they're done, even when called from inside another event loop.
+    """
+    if not batches:
+        return []
+    future = asyncio.run_coroutine_threadsafe(
+        _send_batches(task, batches), get_loop(),
+    )
+    outcomes = future.result()
+    for outcome in outcomes:
+        if (isinstance(outcome, BaseException) and
+                not isinstance(outcome, task.FailedEventRequest)):
+            raise outcome
+    return outcomes
+
+
+async def _send_batches(task, batches):
+    host = mp_settings.MIXPANEL_API_SERVER
+    sender = _senders.get(host)
+    if sender is None:
+        sender = _senders[host] = Sender(host)
+    return await asyncio.gather(
+        *[sender.send(task, params, test) for params, test in batches],
+        return_exceptions=True
+    )
@@ -0,0 +1,56 @@
+"""Splitting events into batches small enough for a single request"""
+from __future__ import absolute_import, unicode_literals
+
+from .conf import settings as mp_settings
+from .dedupe import get_insert_id
+from .encoding import Encoded
+
+
+def encode_params(params):
+    """
+    Returns built ``params`` as :class:`mixpanel.encoding.Encoded`, so
+    their size is known and they aren't encoded again when sent.
+    """
+    if isinstance(params, Encoded):
+        return params
+    return Encoded.from_params(params, get_insert_id(params))
+
+
+def split(items, size, max_events=None, max_bytes=None):
+    """
+    Splits ``items`` greedily into batches of at most ``max_events`` items
+    whose JSON array takes at most ``max_bytes`` bytes, given the ``size``
+    function returning the encoded size of an item. The limits default to
+    the ``MIXPANEL_BATCH_SIZE`` and ``MIXPANEL_BATCH_MAX_BYTES`` settings.
+
+    Yields ``(batch, oversized)`` pairs. An item too large to be sent even
+    on its own is yielded in a batch of its own with ``oversized`` set, so
+    it can be rejected without holding up the rest.
+
+    ``items`` is consumed lazily, so it can be a stream.
+    """
+    if max_events is None:
+        max_events = mp_settings.MIXPANEL_BATCH_SIZE
+    if max_bytes is None:
+        max_bytes = mp_settings.MIXPANEL_BATCH_MAX_BYTES
+
+    batch = []
+    # The brackets of the JSON array.
+    total = 2
+    for item in items:
+        item_size = size(item)
+        if item_size + 2 > max_bytes:
+            if batch:
+                yield batch, False
+                batch, total = [], 2
+            yield [item], True
+            continue
+        # Plus a comma between items.
+        if batch and (len(batch) >= max_events or
+                      total + 1 + item_size > max_bytes):
+            yield batch, False
+            batch, total = [], 2
+        total += item_size + (1 if batch else 0)
+        batch.append(item)
+    if batch:
+        yield batch, False
@@ -0,0 +1,86 @@
+"""Producer-side buffering of events into batched tasks"""
+from __future__ import absolute_import, unicode_literals
+
+import atexit
+import threading
+
+from . import encoding
+from .conf import settings as mp_settings
+from .tasks import batch_event_tracker
+
+
+class EventBuffer(object):
+    """
+    Collects events in the producer process and queues them as a single
+    ``BatchEventTracker`` task, so that many events only cost one broker
+    message.
+
+    The buffer is flushed once it holds ``max_events`` events or
+    ``max_bytes`` bytes of JSON-encoded events, or once its oldest event is
+    ``max_age`` seconds old. Any argument left out defaults to the matching
+    ``MIXPANEL_BUFFER_*`` setting.
+
+    Buffers are thread-safe.
+    """
+
+    def __init__(self, max_events=None, max_bytes=None, max_age=None):
+        self.max_events = max_events or mp_settings.MIXPANEL_BUFFER_MAX_EVENTS
+        self.max_bytes = max_bytes or mp_settings.MIXPANEL_BUFFER_MAX_BYTES
+        self.max_age = max_age or mp_settings.MIXPANEL_BUFFER_MAX_AGE
+        self._events = []
+        self._bytes = 0
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def track(self, event_name, properties=None, token=None):
+        """
+        Buffers an event, with the same arguments as ``EventTracker``.
+        """
+        properties = dict(properties or {})
+        if token:
+            # Each event carries its own token, so one batch can mix them.
+            properties['token'] = token
+        size = len(encoding.dumps([event_name, properties]))
+
+        with self._lock:
+            self._events.append((event_name, properties))
+            self._bytes += size
+            full = (len(self._events) >= self.max_events or
+                    self._bytes >= self.max_bytes)
+            if not full and self._timer is None:
+                self._timer = threading.Timer(self.max_age, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if full:
+            self.flush()
+
+    def flush(self):
+        """
+        Queues every buffered event as a single batch task.
+
+        Returns the task's ``AsyncResult``, or ``None`` if the buffer was
+        empty.
+        """
+        with self._lock:
+            events, self._events, self._bytes = self._events, [], 0
+            timer, self._timer = self._timer, None
+        if timer is not None:
+            timer.cancel()
+        if not events:
+            return None
+        return batch_event_tracker.delay(events)
+
+    def __len__(self):
+        return len(self._events)
+
+
+#: The buffer used by :func:`track`, flushed when the process exits.
+event_buffer = EventBuffer()
+atexit.register(event_buffer.flush)
+
+
+def track(event_name, properties=None, token=None):
+    """
+    Buffers an event in the default :data:`event_buffer`.
+    """
+    event_buffer.track(event_name, properties, token=token)
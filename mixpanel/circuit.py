@@ -0,0 +1,150 @@
+"""A circuit breaker for requests to the Mixpanel api"""
+from __future__ import absolute_import, unicode_literals
+
+import logging
+import threading
+import time
+from collections import deque
+
+from . import metrics
+from .conf import settings as mp_settings
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+#: Values of the ``mixpanel.circuit.state`` gauge.
+STATE_GAUGE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+_now = getattr(time, 'monotonic', time.time)
+
+
+class CircuitBreaker(object):
+    """
+    Stops sending requests to a failing server for a while.
+
+    The breaker starts out closed and keeps the outcome of the last
+    ``window`` requests. Requests that fail, or that take longer than
+    ``slow_call`` seconds, count as errors. Once at least ``min_calls``
+    outcomes are known and the share of errors reaches ``error_rate``, the
+    breaker opens: requests aren't allowed for ``reset_timeout`` seconds.
+    After that it is half-open and lets a single trial request through,
+    which either closes it again or keeps it open for another
+    ``reset_timeout`` seconds.
+
+    Arguments left out default to the matching ``MIXPANEL_CIRCUIT_*``
+    settings. Breakers are thread-safe, but each process has its own.
+    """
+
+    def __init__(self, window=None, min_calls=None, error_rate=None,
+                 slow_call=None, reset_timeout=None):
+        self.window = window or mp_settings.MIXPANEL_CIRCUIT_WINDOW
+        self.min_calls = min_calls or mp_settings.MIXPANEL_CIRCUIT_MIN_CALLS
+        self.error_rate = error_rate or mp_settings.MIXPANEL_CIRCUIT_ERROR_RATE
+        self.slow_call = slow_call or mp_settings.MIXPANEL_CIRCUIT_SLOW_CALL
+        self.reset_timeout = (reset_timeout or
+                              mp_settings.MIXPANEL_CIRCUIT_RESET_TIMEOUT)
+        self._outcomes = deque(maxlen=self.window)
+        self._state = CLOSED
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def allow_request(self):
+        """
+        Returns ``True`` if a request may be sent now.
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+        metrics.incr('mixpanel.circuit.rejected')
+        return False
+
+    def retry_in(self):
+        """
+        Returns the number of seconds until the breaker lets a request
+        through again.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return 0
+            return max(0, self._opened_at + self.reset_timeout - _now())
+
+    def record(self, failed, latency=None):
+        """
+        Records the outcome of a request that was allowed through. Every
+        such request must be recorded, or a half-open breaker keeps waiting
+        for the outcome of its trial.
+        """
+        if latency is not None and latency >= self.slow_call:
+            failed = True
+        with self._lock:
+            state = self._current_state()
+            self._trial_running = False
+            if state == HALF_OPEN:
+                if failed:
+                    self._open()
+                else:
+                    self._set_state(CLOSED)
+                    self._opened_at = None
+                    self._outcomes.clear()
+                return
+
+            self._outcomes.append(failed)
+            if (state == CLOSED and len(self._outcomes) >= self.min_calls and
+                    self._failure_rate() >= self.error_rate):
+                self._open()
+
+    def reset(self):
+        """
+        Closes the breaker and forgets every outcome.
+        """
+        with self._lock:
+            self._outcomes.clear()
+            self._opened_at = None
+            self._trial_running = False
+            self._set_state(CLOSED)
+
+    def _failure_rate(self):
+        return float(sum(self._outcomes)) / len(self._outcomes)
+
+    def _current_state(self):
+        if (self._state == OPEN and
+                _now() >= self._opened_at + self.reset_timeout):
+            self._set_state(HALF_OPEN)
+        return self._state
+
+    def _open(self):
+        self._opened_at = _now()
+        self._outcomes.clear()
+        self._set_state(OPEN)
+        metrics.incr('mixpanel.circuit.opened')
+
+    def _set_state(self, state):
+        if state != self._state:
+            logger.warning("Mixpanel circuit breaker is now %s" % state)
+        self._state = state
+        metrics.gauge('mixpanel.circuit.state', STATE_GAUGE[state])
+
+
+def now():
+    """
+    Returns the time to measure the latency passed to
+    ``CircuitBreaker.record`` from, on a clock that never goes backwards.
+    """
+    return _now()
+
+
+#: The breaker guarding every request to the api server from this process.
+circuit_breaker = CircuitBreaker()
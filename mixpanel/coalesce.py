@@ -0,0 +1,181 @@
+"""Producer-side coalescing of People updates"""
+from __future__ import absolute_import, unicode_literals
+
+import atexit
+import threading
+from collections import OrderedDict
+
+from .conf import settings as mp_settings
+from .tasks import people_tracker
+
+#: People operations that can be merged into a single update.
+MERGEABLE = ('set', 'set_once', 'unset', 'union')
+
+# The operations whose result depends on the order they're applied in when
+# they touch the same property.
+_CONFLICTS = {
+    'set': ('unset', 'union'),
+    'set_once': ('unset', 'union'),
+    'unset': ('set', 'set_once', 'union'),
+    'union': ('set', 'set_once', 'unset'),
+}
+
+
+def _keys(event_name, properties):
+    if event_name == 'unset':
+        return set(properties)
+    return set(properties or {})
+
+
+def _merge(event_name, merged, properties):
+    if event_name == 'set':
+        # Last write wins.
+        merged.update(properties)
+    elif event_name == 'set_once':
+        # First write wins, like Mixpanel does.
+        for key, value in properties.items():
+            merged.setdefault(key, value)
+    elif event_name == 'unset':
+        merged.extend(key for key in properties if key not in merged)
+    elif event_name == 'union':
+        for key, values in properties.items():
+            existing = merged.setdefault(key, [])
+            existing.extend(v for v in values if v not in existing)
+
+
+def _empty(event_name):
+    return [] if event_name == 'unset' else {}
+
+
+class _Profile(object):
+    """
+    The pending updates of a single profile, one per operation.
+    """
+
+    def __init__(self):
+        self.updates = OrderedDict()
+
+    def conflicts(self, event_name, properties):
+        # Setting a property that is pending removal, or replacing a list
+        # that is pending a union, depends on the order the updates are
+        # applied in.
+        keys = _keys(event_name, properties)
+        return any(
+            keys & _keys(other, self.updates[other][0])
+            for other in _CONFLICTS[event_name] if other in self.updates
+        )
+
+    def add(self, event_name, properties, kwargs):
+        merged, merged_kwargs = self.updates.setdefault(
+            event_name, (_empty(event_name), {}),
+        )
+        _merge(event_name, merged, properties)
+        # Optional arguments like ``ip`` or ``time`` apply to the whole
+        # update, so the most recent ones are kept.
+        merged_kwargs.update(kwargs)
+
+    def items(self):
+        for event_name, (properties, kwargs) in self.updates.items():
+            yield event_name, properties, kwargs
+
+
+class PeopleCoalescer(object):
+    """
+    Collects People updates in the producer process and merges the
+    ``set``, ``set_once``, ``unset`` and ``union`` updates of each profile,
+    so that a burst of updates to the same person turns into one update per
+    operation. Updates are queued together as a ``PeopleBatchTracker`` task.
+
+    ``set`` keeps the last value of each property and ``set_once`` the
+    first; ``unset`` and ``union`` collect every property or value given.
+    Other updates, such as ``add`` or ``track_charge``, are queued straight
+    away, after the pending updates of their profile so the order is kept.
+
+    Pending updates are queued ``window`` seconds after the first one came
+    in, defaulting to the ``MIXPANEL_PEOPLE_COALESCE_WINDOW`` setting. With
+    a ``window`` of 0 they're only queued by :meth:`flush`.
+
+    Coalescers are thread-safe.
+    """
+
+    def __init__(self, window=None):
+        if window is None:
+            window = mp_settings.MIXPANEL_PEOPLE_COALESCE_WINDOW
+        self.window = window
+        self._profiles = OrderedDict()
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def people(self, event_name, properties=None, **kwargs):
+        """
+        Collects a People update, with the same arguments as
+        ``PeopleTracker``.
+        """
+        if event_name == 'unset':
+            properties = list(properties or [])
+        else:
+            properties = dict(properties or {})
+            if 'distinct_id' in properties:
+                kwargs['distinct_id'] = properties.pop('distinct_id')
+        key = (kwargs.pop('token', None), kwargs.pop('distinct_id', None))
+
+        with self._lock:
+            ready = []
+            profile = self._profiles.get(key)
+            if profile is not None and (
+                    event_name not in MERGEABLE or
+                    profile.conflicts(event_name, properties)):
+                ready.append((key, self._profiles.pop(key)))
+                profile = None
+            if event_name not in MERGEABLE:
+                single = _Profile()
+                single.updates[event_name] = (properties, kwargs)
+                ready.append((key, single))
+            else:
+                if profile is None:
+                    profile = self._profiles[key] = _Profile()
+                profile.add(event_name, properties, kwargs)
+                if self._timer is None and self.window:
+                    self._timer = threading.Timer(self.window, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+        self._queue(ready)
+
+    def flush(self):
+        """
+        Queues every pending update.
+        """
+        with self._lock:
+            profiles, self._profiles = self._profiles, OrderedDict()
+            timer, self._timer = self._timer, None
+        if timer is not None:
+            timer.cancel()
+        self._queue(profiles.items())
+
+    def _queue(self, profiles):
+        updates = []
+        for (token, distinct_id), profile in profiles:
+            for event_name, properties, kwargs in profile.items():
+                kwargs = dict(kwargs)
+                if distinct_id is not None:
+                    kwargs['distinct_id'] = distinct_id
+                if token is not None:
+                    kwargs['token'] = token
+                updates.append((event_name, properties, kwargs))
+        if updates:
+            people_tracker.batch(updates)
+
+    def __len__(self):
+        return sum(len(p.updates) for p in self._profiles.values())
+
+
+#: The coalescer used by :func:`people`, flushed when the process exits.
+people_coalescer = PeopleCoalescer()
+atexit.register(people_coalescer.flush)
+
+
+def people(event_name, properties=None, **kwargs):
+    """
+    Collects a People update in the default :data:`people_coalescer`.
+    """
+    people_coalescer.people(event_name, properties, **kwargs)
@@ -0,0 +1,146 @@
+"""Adapting the number of concurrent requests to how Mixpanel copes"""
+from __future__ import absolute_import, unicode_literals
+
+import logging
+import threading
+import time
+
+from . import metrics
+from .conf import settings as mp_settings
+
+logger = logging.getLogger(__name__)
+
+_now = getattr(time, 'monotonic', time.time)
+
+#: Number of healthy responses needed before latency spikes are detected.
+MIN_LATENCY_SAMPLES = 10
+
+#: Weight of each new healthy response in the average latency.
+LATENCY_SMOOTHING = 0.1
+
+
+class ConcurrencyLimiter(object):
+    """
+    Decides how many requests may be in flight at once with additive
+    increase, multiplicative decrease.
+
+    Each healthy response while the limit is in use raises the limit by
+    ``1 / limit``, so by about one request per round of requests. Rate
+    limiting, server errors, timeouts and responses slower than
+    ``latency_factor`` times the average healthy latency multiply it by
+    ``backoff``, but at most once for the requests in flight at the time,
+    and never below ``minimum``.
+
+    Arguments left out default to the matching ``MIXPANEL_CONCURRENCY_*``
+    settings. Limiters are thread-safe, but each process has its own.
+    """
+
+    def __init__(self, minimum=None, backoff=None, latency_factor=None):
+        self.minimum = minimum or mp_settings.MIXPANEL_CONCURRENCY_MIN
+        self.backoff = backoff or mp_settings.MIXPANEL_CONCURRENCY_BACKOFF
+        self.latency_factor = (latency_factor or
+                               mp_settings.MIXPANEL_CONCURRENCY_LATENCY_FACTOR)
+        self._lock = threading.Lock()
+        self.reset()
+
+    @property
+    def limit(self):
+        """
+        The number of requests that may be in flight right now.
+        """
+        with self._lock:
+            return int(self._limit)
+
+    def record(self, started, overloaded, in_flight):
+        """
+        Records the outcome of a request sent at ``started``, as returned by
+        ``now()``, while ``in_flight`` requests were being sent in all.
+        ``overloaded`` is ``True`` if the request failed in a way that
+        means Mixpanel wants us to slow down.
+        """
+        latency = _now() - started
+        with self._lock:
+            if not overloaded and self._is_spike(latency):
+                overloaded = True
+            if overloaded:
+                # Requests sent before the last decrease have been
+                # accounted for by it.
+                if started >= self._decreased_at:
+                    self._decrease()
+                return
+            self._samples += 1
+            if self._latency is None:
+                self._latency = latency
+            else:
+                self._latency += LATENCY_SMOOTHING * (latency - self._latency)
+            if in_flight >= int(self._limit):
+                self._set_limit(self._limit + 1.0 / self._limit)
+
+    def reset(self):
+        """
+        Goes back to the minimum limit and forgets every latency.
+        """
+        with self._lock:
+            self._limit = float(self.minimum)
+            self._latency = None
+            self._samples = 0
+            self._decreased_at = _now()
+        metrics.gauge('mixpanel.concurrency.limit', int(self.minimum))
+
+    def _is_spike(self, latency):
+        return (self._samples >= MIN_LATENCY_SAMPLES and
+                latency > self.latency_factor * self._latency)
+
+    def _decrease(self):
+        self._decreased_at = _now()
+        self._set_limit(max(self.minimum, self._limit * self.backoff))
+        metrics.incr('mixpanel.concurrency.backoff')
+        logger.info("Mixpanel concurrency limit lowered to %d" %
+                    int(self._limit))
+
+    def _set_limit(self, limit):
+        changed = int(limit) != int(self._limit)
+        self._limit = limit
+        if changed:
+            metrics.gauge('mixpanel.concurrency.limit', int(limit))
+
+
+def now():
+    """
+    Returns the time to pass to ``ConcurrencyLimiter.record`` as the time a
+    request was sent.
+    """
+    return _now()
+
+
+def is_overload(exc):
+    """
+    Returns ``True`` if the failed request ``exc`` means Mixpanel, or the
+    network on the way, is overloaded: rate limiting, server errors, socket
+    errors, timeouts and the circuit breaker being open, which are the
+    failures worth retrying.
+    """
+    return exc is not None and exc.retryable
+
+
+def record(started, failure, in_flight):
+    """
+    Records the outcome of a request sent at ``started`` with the shared
+    limiter, if `:data:mixpanel.conf.settings.MIXPANEL_ADAPTIVE_CONCURRENCY`
+    is on. ``failure`` is the ``FailedEventRequest`` it raised, if any.
+    """
+    if mp_settings.MIXPANEL_ADAPTIVE_CONCURRENCY:
+        concurrency_limiter.record(started, is_overload(failure), in_flight)
+
+
+def get_limit(ceiling):
+    """
+    Returns how many requests may be in flight, out of at most ``ceiling``.
+    """
+    if not mp_settings.MIXPANEL_ADAPTIVE_CONCURRENCY:
+        return ceiling
+    return max(1, min(ceiling, concurrency_limiter.limit))
+
+
+#: The limiter shared by every concurrent transport in this process.
+concurrency_limiter = ConcurrencyLimiter()
@@ -22,14 +22,29 @@ MIXPANEL_API_TOKEN = getattr(settings, 'MIXPANEL_API_TOKEN', None)
 """
 .. data:: MIXPANEL_RETRY_DELAY
 
-    Number of seconds to wait before retrying an event-tracking request that
-    failed because of an invalid server response. These failed responses are
-    usually 502's or 504's because Mixpanel is under increased load.
+    Longest number of seconds to wait before retrying an event-tracking
+    request that failed because of an invalid server response or a network
+    error. These failed responses are usually 502's or 504's because Mixpanel
+    is under increased load. Requests Mixpanel refused with a 4xx response,
+    other than 408 and 429, aren't retried at all.
 
     Defaults to 5 minutes.
 """
 MIXPANEL_RETRY_DELAY = getattr(settings, 'MIXPANEL_RETRY_DELAY', 60*5)
 
+"""
+.. data:: MIXPANEL_RETRY_BACKOFF
+
+    Number of seconds the exponential backoff between retries starts from.
+    Retry number ``n`` waits a random time of up to
+    ``MIXPANEL_RETRY_BACKOFF * 2 ** n`` seconds, capped at
+    ``MIXPANEL_RETRY_DELAY``, or however long a ``Retry-After`` header from
+    Mixpanel asks for.
+
+    Defaults to 10 seconds.
+"""
+MIXPANEL_RETRY_BACKOFF = getattr(settings, 'MIXPANEL_RETRY_BACKOFF', 10)
+
 """
 .. data:: MIXPANEL_DISABLE
 
@@ -52,12 +67,48 @@ MIXPANEL_MAX_RETRIES = getattr(settings, 'MIXPANEL_MAX_RETRIES', 5)
 
     Number of seconds to wait before timing out a request the mixpanel api
     server. The default 30-second timeout can cause your job queue to become
-    swamped.
+    swamped. This is the default for both
+    ``MIXPANEL_API_CONNECT_TIMEOUT`` and ``MIXPANEL_API_READ_TIMEOUT``.
 
     Defaults to 5 seconds.
 """
 MIXPANEL_API_TIMEOUT = getattr(settings, 'MIXPANEL_API_TIMEOUT', 5)
 
+"""
+.. data:: MIXPANEL_API_CONNECT_TIMEOUT
+
+    Number of seconds to wait while connecting to the mixpanel api server.
+    Like all of the api timeouts, this only applies to connections to
+    Mixpanel and leaves other sockets in the process alone.
+
+    Defaults to ``MIXPANEL_API_TIMEOUT``.
+"""
+MIXPANEL_API_CONNECT_TIMEOUT = getattr(settings,
+                                       'MIXPANEL_API_CONNECT_TIMEOUT',
+                                       MIXPANEL_API_TIMEOUT)
+
+"""
+.. data:: MIXPANEL_API_READ_TIMEOUT
+
+    Number of seconds to wait for each read of the mixpanel api server's
+    response.
+
+    Defaults to ``MIXPANEL_API_TIMEOUT``.
+"""
+MIXPANEL_API_READ_TIMEOUT = getattr(settings, 'MIXPANEL_API_READ_TIMEOUT',
+                                    MIXPANEL_API_TIMEOUT)
+
+"""
+.. data:: MIXPANEL_API_DEADLINE
+
+    Total number of seconds a single request to the mixpanel api server may
+    take, from connecting through reading the response. Use this to cap how
+    long a slow Mixpanel can hold on to a worker.
+
+    Defaults to ``None``, which only applies the connect and read timeouts.
+"""
+MIXPANEL_API_DEADLINE = getattr(settings, 'MIXPANEL_API_DEADLINE', None)
+
 """
 .. data:: MIXPANEL_API_SERVER
 
@@ -66,6 +117,256 @@ MIXPANEL_API_TIMEOUT = getattr(settings, 'MIXPANEL_API_TIMEOUT', 5)
 MIXPANEL_API_SERVER = getattr(settings, 'MIXPANEL_API_SERVER',
                                'api.mixpanel.com')
 
+"""
+.. data:: MIXPANEL_CIRCUIT_BREAKER
+
+    Set to ``False`` to turn off the circuit breaker. While the breaker is
+    open, tracking tasks don't contact the mixpanel api server at all and are
+    retried once it is expected to be back, rather than each waiting out a
+    timeout. Its state is reported as the ``mixpanel.circuit.state`` metric.
+"""
+MIXPANEL_CIRCUIT_BREAKER = getattr(settings, 'MIXPANEL_CIRCUIT_BREAKER', True)
+
+"""
+.. data:: MIXPANEL_CIRCUIT_WINDOW
+
+    Number of recent requests whose outcome the circuit breaker considers.
+
+    Defaults to 50 requests.
+"""
+MIXPANEL_CIRCUIT_WINDOW = getattr(settings, 'MIXPANEL_CIRCUIT_WINDOW', 50)
+
+"""
+.. data:: MIXPANEL_CIRCUIT_MIN_CALLS
+
+    Number of request outcomes the circuit breaker needs before it can open.
+
+    Defaults to 20 requests.
+"""
+MIXPANEL_CIRCUIT_MIN_CALLS = getattr(settings, 'MIXPANEL_CIRCUIT_MIN_CALLS',
+                                     20)
+
+"""
+.. data:: MIXPANEL_CIRCUIT_ERROR_RATE
+
+    Share of recent requests that must have failed, or been slow, for the
+    circuit breaker to open.
+
+    Defaults to 0.5.
+"""
+MIXPANEL_CIRCUIT_ERROR_RATE = getattr(settings, 'MIXPANEL_CIRCUIT_ERROR_RATE',
+                                      0.5)
+
+"""
+.. data:: MIXPANEL_CIRCUIT_SLOW_CALL
+
+    Number of seconds after which the circuit breaker counts a request as
+    failed even if it succeeded.
+
+    Defaults to ``MIXPANEL_API_TIMEOUT``.
+"""
+MIXPANEL_CIRCUIT_SLOW_CALL = getattr(settings, 'MIXPANEL_CIRCUIT_SLOW_CALL',
+                                     MIXPANEL_API_TIMEOUT)
+
+"""
+.. data:: MIXPANEL_CIRCUIT_RESET_TIMEOUT
+
+    Number of seconds the circuit breaker stays open before letting a trial
+    request through.
+
+    Defaults to 30 seconds.
+"""
+MIXPANEL_CIRCUIT_RESET_TIMEOUT = getattr(settings,
+                                         'MIXPANEL_CIRCUIT_RESET_TIMEOUT', 30)
+
+"""
+.. data:: MIXPANEL_METRICS_BACKEND
+
+    Callable, or dotted path to one, that is passed ``(kind, name, value)``
+    whenever one of the metrics in :mod:`mixpanel.metrics` changes. ``kind``
+    is ``'counter'`` or ``'gauge'``. Use it to forward the metrics to statsd
+    or similar.
+
+    Defaults to ``None``, which only keeps them in memory.
+"""
+MIXPANEL_METRICS_BACKEND = getattr(settings, 'MIXPANEL_METRICS_BACKEND', None)
+
+"""
+.. data:: MIXPANEL_SEND_THREADS
+
+    Number of threads that send the chunks of a large batch, or of the
+    spool being drained, concurrently. They share the process's pool of
+    keep-alive connections. With 1, chunks are sent one at a time.
+
+    Defaults to 1.
+"""
+MIXPANEL_SEND_THREADS = getattr(settings, 'MIXPANEL_SEND_THREADS', 1)
+
+"""
+.. data:: MIXPANEL_ASYNC_TRANSPORT
+
+    If this value is True, the chunks of a batch, and the batches the
+    worker aggregates, are sent concurrently from a single process with
+    :mod:`mixpanel.aio` instead of one request at a time. Requires python
+    3.5 or later.
+
+    Defaults to False.
+"""
+MIXPANEL_ASYNC_TRANSPORT = getattr(settings, 'MIXPANEL_ASYNC_TRANSPORT', False)
+
+"""
+.. data:: MIXPANEL_ASYNC_CONCURRENCY
+
+    Maximum number of requests :mod:`mixpanel.aio` keeps in flight at once,
+    each over a connection of its own.
+
+    Defaults to 20.
+"""
+MIXPANEL_ASYNC_CONCURRENCY = getattr(settings, 'MIXPANEL_ASYNC_CONCURRENCY',
+                                     20)
+
+"""
+.. data:: MIXPANEL_ADAPTIVE_CONCURRENCY
+
+    If this value is True, the concurrent transports adjust how many
+    requests they keep in flight, up to `:data:MIXPANEL_ASYNC_CONCURRENCY`
+    or `:data:MIXPANEL_SEND_THREADS`: they add one while Mixpanel responds
+    quickly and back off on rate limiting, server errors and latency
+    spikes. The limit is reported as the ``mixpanel.concurrency.limit``
+    metric, and each back off counted as ``mixpanel.concurrency.backoff``.
+
+    Defaults to False.
+"""
+MIXPANEL_ADAPTIVE_CONCURRENCY = getattr(settings,
+                                        'MIXPANEL_ADAPTIVE_CONCURRENCY', False)
+
+"""
+.. data:: MIXPANEL_CONCURRENCY_MIN
+
+    Number of requests the adaptive limit starts at and never goes below.
+
+    Defaults to 1.
+"""
+MIXPANEL_CONCURRENCY_MIN = getattr(settings, 'MIXPANEL_CONCURRENCY_MIN', 1)
+
+"""
+.. data:: MIXPANEL_CONCURRENCY_BACKOFF
+
+    Factor the adaptive limit is multiplied by when Mixpanel is overloaded.
+
+    Defaults to 0.5.
+"""
+MIXPANEL_CONCURRENCY_BACKOFF = getattr(settings,
+                                       'MIXPANEL_CONCURRENCY_BACKOFF', 0.5)
+
+"""
+.. data:: MIXPANEL_CONCURRENCY_LATENCY_FACTOR
+
+    A response slower than this many times the average latency of healthy
+    responses counts as a latency spike, and lowers the adaptive limit.
+
+    Defaults to 3.
+"""
+MIXPANEL_CONCURRENCY_LATENCY_FACTOR = getattr(
+    settings, 'MIXPANEL_CONCURRENCY_LATENCY_FACTOR', 3,
+)
+
+"""
+.. data:: MIXPANEL_VERBOSE_BATCHES
+
+    If this value is True, batches are sent asking Mixpanel for a verbose
+    response, or for strict validation on the import endpoint.
+
+    Only the import endpoint tells which events of a batch it refused.
+    Those events are handed to `:data:MIXPANEL_DEAD_LETTER` and the rest
+    count as recorded, instead of the whole batch being rejected. Other
+    endpoints give a single error for the whole batch, which is logged, and
+    all its events are handed to `:data:MIXPANEL_DEAD_LETTER`.
+
+    Defaults to False.
+"""
+MIXPANEL_VERBOSE_BATCHES = getattr(settings, 'MIXPANEL_VERBOSE_BATCHES', False)
+
+"""
+.. data:: MIXPANEL_DEAD_LETTER
+
+    Callable, or dotted path to one, that is passed ``(task_name, params,
+    error)`` for every event that can never be sent: events Mixpanel
+    refused as invalid and events too large for a request. ``params`` is
+    the built event and ``error`` a message explaining why.
+
+    Defaults to ``None``, which logs these events as errors and drops them.
+"""
+MIXPANEL_DEAD_LETTER = getattr(settings, 'MIXPANEL_DEAD_LETTER', None)
+
+"""
+.. data:: MIXPANEL_SPOOL_DIR
+
+    Directory in which to spool events that couldn't be delivered, because
+    their retries ran out or the circuit breaker is open, instead of
+    dropping them or keeping them queued on the broker. Schedule the
+    ``mixpanel.tasks.SpoolDrainer`` task to replay them.
+
+    Defaults to ``None``, which turns spooling off.
+"""
+MIXPANEL_SPOOL_DIR = getattr(settings, 'MIXPANEL_SPOOL_DIR', None)
+
+"""
+.. data:: MIXPANEL_SPOOL_SEGMENT_SIZE
+
+    Size in bytes after which a spool segment file is sealed and a new one
+    started.
+
+    Defaults to 4MB.
+"""
+MIXPANEL_SPOOL_SEGMENT_SIZE = getattr(settings, 'MIXPANEL_SPOOL_SEGMENT_SIZE',
+                                      4 * 1024 * 1024)
+
+"""
+.. data:: MIXPANEL_SPOOL_SEGMENT_AGE
+
+    Number of seconds after which a spool segment file is sealed, so that
+    ``SpoolDrainer`` can replay it, even if it isn't full.
+
+    Defaults to 60 seconds.
+"""
+MIXPANEL_SPOOL_SEGMENT_AGE = getattr(settings, 'MIXPANEL_SPOOL_SEGMENT_AGE',
+                                     60)
+
+"""
+.. data:: MIXPANEL_SPOOL_FSYNC_EVERY
+
+    Number of spooled events after which the spool is fsynced to disk.
+
+    Defaults to 100 events.
+"""
+MIXPANEL_SPOOL_FSYNC_EVERY = getattr(settings, 'MIXPANEL_SPOOL_FSYNC_EVERY',
+                                     100)
+
+"""
+.. data:: MIXPANEL_CONNECTION_POOL_SIZE
+
+    Maximum number of idle keep-alive connections to the mixpanel api server
+    kept open by each worker process.
+
+    Defaults to 4 connections.
+"""
+MIXPANEL_CONNECTION_POOL_SIZE = getattr(settings,
+                                        'MIXPANEL_CONNECTION_POOL_SIZE', 4)
+
+"""
+.. data:: MIXPANEL_CONNECTION_IDLE_TIMEOUT
+
+    Number of seconds an idle keep-alive connection is kept open for reuse.
+    Connections idle for longer are closed rather than risking a request on
+    a socket the server has already given up on.
+
+    Defaults to 30 seconds.
+"""
+MIXPANEL_CONNECTION_IDLE_TIMEOUT = getattr(settings,
+                                           'MIXPANEL_CONNECTION_IDLE_TIMEOUT',
+                                           30)
+
 """
 .. data:: MIXPANEL_TRACKING_ENDPOINT
 
@@ -87,6 +388,344 @@ MIXPANEL_TRACKING_ENDPOINT = getattr(settings, 'MIXPANEL_TRACKING_ENDPOINT',
 MIXPANEL_PEOPLE_ENDPOINT = getattr(settings, 'MIXPANEL_PEOPLE_ENDPOINT',
                                '/engage/')
 
+"""
+.. data:: MIXPANEL_IMPORT_ENDPOINT
+
+    URL endpoint for importing historical events. defaults to ``/import/``
+
+    Mind the slashes.
+"""
+MIXPANEL_IMPORT_ENDPOINT = getattr(settings, 'MIXPANEL_IMPORT_ENDPOINT',
+                                   '/import/')
+
+"""
+.. data:: MIXPANEL_API_SECRET
+
+    API secret for your Mixpanel project. Only needed to import historical
+    events with ``EventImporter`` or the ``mixpanel_import`` management
+    command.
+"""
+MIXPANEL_API_SECRET = getattr(settings, 'MIXPANEL_API_SECRET', None)
+
+"""
+.. data:: MIXPANEL_IMPORT_WORKERS
+
+    Number of batches the ``mixpanel_import`` management command uploads
+    concurrently.
+
+    Defaults to 8.
+"""
+MIXPANEL_IMPORT_WORKERS = getattr(settings, 'MIXPANEL_IMPORT_WORKERS', 8)
+
+"""
+.. data:: MIXPANEL_INSERT_ID
+
+    If this value is True, events are stamped with a random ``$insert_id``
+    property when they are queued, unless they already have one. Mixpanel
+    ignores events with an ``$insert_id`` it has already recorded, so
+    retrying a request that actually went through doesn't count the event
+    twice.
+"""
+MIXPANEL_INSERT_ID = getattr(settings, 'MIXPANEL_INSERT_ID', True)
+
+"""
+.. data:: MIXPANEL_DEDUPE_CACHE_SIZE
+
+    Number of recently recorded ``$insert_id``\\ s each worker process
+    remembers, to skip events it has already sent without contacting
+    Mixpanel.
+
+    Defaults to 10000.
+"""
+MIXPANEL_DEDUPE_CACHE_SIZE = getattr(settings, 'MIXPANEL_DEDUPE_CACHE_SIZE',
+                                     10000)
+
+"""
+.. data:: MIXPANEL_DEDUPE_TTL
+
+    Number of seconds a worker process remembers a recorded ``$insert_id``.
+
+    Defaults to 1 hour.
+"""
+MIXPANEL_DEDUPE_TTL = getattr(settings, 'MIXPANEL_DEDUPE_TTL', 60*60)
+
+"""
+.. data:: MIXPANEL_SUPER_PROPERTIES
+
+    A dictionary of properties added to every tracked event, unless the
+    event sets them itself. They're encoded once rather than for every
+    event.
+
+    Defaults to no properties.
+"""
+MIXPANEL_SUPER_PROPERTIES = getattr(settings, 'MIXPANEL_SUPER_PROPERTIES',
+                                    {})
+
+"""
+.. data:: MIXPANEL_JSON_BACKEND
+
+    Name of the JSON library used to encode the data sent to Mixpanel:
+    ``'orjson'``, ``'ujson'``, ``'json'``, or the name of another library
+    with the same API as ``json``.
+
+    Defaults to the fastest of ``orjson``, ``ujson`` and ``json`` that is
+    installed.
+"""
+MIXPANEL_JSON_BACKEND = getattr(settings, 'MIXPANEL_JSON_BACKEND', None)
+
+"""
+.. data:: MIXPANEL_PRESERIALIZE
+
+    If this value is True, events and People updates are built and encoded
+    to JSON by the process that queues them, and the task carries the
+    encoded JSON. Workers send it as it is. Values that can't be encoded
+    then raise an error straight away instead of failing in the worker.
+    Funnel events are always encoded by the worker.
+"""
+MIXPANEL_PRESERIALIZE = getattr(settings, 'MIXPANEL_PRESERIALIZE', False)
+
+"""
+.. data:: MIXPANEL_COMPACT_MESSAGES
+
+    If this value is True, tracking tasks are queued with the compact
+    ``mixpanel`` serializer of :mod:`mixpanel.serialization`, and the token
+    is left out of their messages when it's the ``MIXPANEL_API_TOKEN``.
+    Workers put it back, so they need the same token setting, and
+    ``'mixpanel'`` has to be in celery's ``accept_content`` setting.
+"""
+MIXPANEL_COMPACT_MESSAGES = getattr(settings, 'MIXPANEL_COMPACT_MESSAGES',
+                                    False)
+
+"""
+.. data:: MIXPANEL_COMPRESS_MESSAGES_OVER
+
+    Size in bytes over which messages of the compact ``mixpanel``
+    serializer are compressed with zlib. ``None`` turns compression off.
+
+    Defaults to 1KB.
+"""
+MIXPANEL_COMPRESS_MESSAGES_OVER = getattr(
+    settings, 'MIXPANEL_COMPRESS_MESSAGES_OVER', 1024)
+
+"""
+.. data:: MIXPANEL_GZIP_OVER
+
+    Size in bytes over which request bodies POSTed to Mixpanel, such as
+    batches of events, are gzip compressed. ``None`` turns compression off.
+
+    Defaults to ``None``.
+"""
+MIXPANEL_GZIP_OVER = getattr(settings, 'MIXPANEL_GZIP_OVER', None)
+
+"""
+.. data:: MIXPANEL_GZIP_LEVEL
+
+    zlib compression level, from 1 (fastest) to 9 (smallest), of gzip
+    compressed request bodies.
+
+    Defaults to 6.
+"""
+MIXPANEL_GZIP_LEVEL = getattr(settings, 'MIXPANEL_GZIP_LEVEL', 6)
+
+"""
+.. data:: MIXPANEL_BATCH_SIZE
+
+    Maximum number of events sent to Mixpanel in a single request by the
+    batch tracking tasks. Mixpanel won't accept more than 50.
+
+    Defaults to 50 events.
+"""
+MIXPANEL_BATCH_SIZE = getattr(settings, 'MIXPANEL_BATCH_SIZE', 50)
+
+"""
+.. data:: MIXPANEL_QUEUES
+
+    Dictionary mapping the ``'high'``, ``'normal'`` and ``'bulk'`` lanes to
+    the names of the Celery queues their tracking tasks are sent to, such as
+    ``{'high': 'mixpanel.high', 'bulk': 'mixpanel.bulk'}``. Run workers for
+    each of these queues, with ``celery worker -Q``. Lanes that aren't named
+    keep using the default queue.
+
+    Defaults to ``{}``, which sends every task to the default queue.
+"""
+MIXPANEL_QUEUES = getattr(settings, 'MIXPANEL_QUEUES', {})
+
+"""
+.. data:: MIXPANEL_LANES
+
+    Dictionary mapping event names and People operations to their lane.
+    Batches go to the most urgent lane of their events. Other events go to
+    the ``'normal'`` lane, except for imports, which go to ``'bulk'``.
+
+    Defaults to ``{'track_charge': 'high'}``, so revenue isn't held up
+    behind page views.
+"""
+MIXPANEL_LANES = getattr(settings, 'MIXPANEL_LANES', {'track_charge': 'high'})
+
+"""
+.. data:: MIXPANEL_SAMPLE_RATES
+
+    Dictionary mapping event names to the share of their occurrences, from
+    0 to 1, to send to Mixpanel, such as ``{'page_scroll': 0.1}``. The other
+    occurrences are dropped before they're queued, and the ones kept get a
+    ``$sample_rate`` property so reports can scale them back up. Events not
+    listed are all sent.
+
+    Defaults to ``{}``.
+"""
+MIXPANEL_SAMPLE_RATES = getattr(settings, 'MIXPANEL_SAMPLE_RATES', {})
+
+"""
+.. data:: MIXPANEL_RATE_LIMIT
+
+    Maximum number of events a second each process queues for each project
+    token, on average. Events over the limit are dropped before they're
+    queued. People updates and funnel steps are never dropped.
+
+    Defaults to ``None``, for no limit.
+"""
+MIXPANEL_RATE_LIMIT = getattr(settings, 'MIXPANEL_RATE_LIMIT', None)
+
+"""
+.. data:: MIXPANEL_RATE_LIMIT_BURST
+
+    Number of events each process may queue at once for a project token
+    before `:data:MIXPANEL_RATE_LIMIT` applies.
+
+    Defaults to ``None``, which allows bursts of a second's worth of events.
+"""
+MIXPANEL_RATE_LIMIT_BURST = getattr(settings, 'MIXPANEL_RATE_LIMIT_BURST',
+                                    None)
+
+"""
+.. data:: MIXPANEL_BATCH_MAX_BYTES
+
+    Maximum size in bytes of the JSON of the events sent to Mixpanel in a
+    single request, before it's base64 encoded. Batches are split to stay
+    under it, and single events over it are dropped with an error.
+
+    Defaults to 1MB.
+"""
+MIXPANEL_BATCH_MAX_BYTES = getattr(settings, 'MIXPANEL_BATCH_MAX_BYTES',
+                                   1024 * 1024)
+
+"""
+.. data:: MIXPANEL_BUFFER_MAX_EVENTS
+
+    Number of events a :class:`mixpanel.buffer.EventBuffer` collects before
+    queueing them as one batch task.
+
+    Defaults to 500 events.
+"""
+MIXPANEL_BUFFER_MAX_EVENTS = getattr(settings, 'MIXPANEL_BUFFER_MAX_EVENTS',
+                                     500)
+
+"""
+.. data:: MIXPANEL_BUFFER_MAX_BYTES
+
+    Size in bytes of JSON-encoded events a :class:`mixpanel.buffer.EventBuffer`
+    collects before queueing them as one batch task. Keeps broker messages
+    from growing too large.
+
+    Defaults to 256KB.
+"""
+MIXPANEL_BUFFER_MAX_BYTES = getattr(settings, 'MIXPANEL_BUFFER_MAX_BYTES',
+                                    256 * 1024)
+
+"""
+.. data:: MIXPANEL_BUFFER_MAX_AGE
+
+    Number of seconds a :class:`mixpanel.buffer.EventBuffer` holds on to an
+    event before queueing whatever it has collected.
+
+    Defaults to 5 seconds.
+"""
+MIXPANEL_BUFFER_MAX_AGE = getattr(settings, 'MIXPANEL_BUFFER_MAX_AGE', 5)
+
+"""
+.. data:: MIXPANEL_PEOPLE_COALESCE_WINDOW
+
+    Number of seconds a :class:`mixpanel.coalesce.PeopleCoalescer` collects
+    People updates before queueing them, merged per profile.
+
+    Defaults to 1 second.
+"""
+MIXPANEL_PEOPLE_COALESCE_WINDOW = getattr(
+    settings, 'MIXPANEL_PEOPLE_COALESCE_WINDOW', 1)
+
+"""
+.. data:: MIXPANEL_ADD_FLUSH_INTERVAL
+
+    Number of seconds a :class:`mixpanel.accumulate.AddAccumulator` sums
+    People ``add`` increments before queueing the totals.
+
+    Defaults to 10 seconds.
+"""
+MIXPANEL_ADD_FLUSH_INTERVAL = getattr(settings, 'MIXPANEL_ADD_FLUSH_INTERVAL',
+                                      10)
+
+"""
+.. data:: MIXPANEL_ADD_MAX_KEYS
+
+    Number of pending profile properties after which a
+    :class:`mixpanel.accumulate.AddAccumulator` queues its totals straight
+    away.
+
+    Defaults to 1000.
+"""
+MIXPANEL_ADD_MAX_KEYS = getattr(settings, 'MIXPANEL_ADD_MAX_KEYS', 1000)
+
+"""
+.. data:: MIXPANEL_ADD_STORE
+
+    Path of an SQLite database where
+    :class:`mixpanel.accumulate.AddAccumulator` keeps its pending sums,
+    shared by every process on the machine. When not set, each process keeps
+    its own sums in memory.
+"""
+MIXPANEL_ADD_STORE = getattr(settings, 'MIXPANEL_ADD_STORE', None)
+
+"""
+.. data:: MIXPANEL_AGGREGATE_EVENTS
+
+    Set to ``True`` on your workers to have them collect the messages queued
+    by individual ``EventTracker`` calls and send them to Mixpanel in
+    batches. Messages are grouped by token and acknowledged once their batch
+    has been sent, or retried individually if it failed. Callers don't need
+    to change.
+
+    This requires `celery-batches`_ (or ``celery.contrib.batches`` before
+    Celery 4) and a ``worker_prefetch_multiplier`` high enough for the worker
+    to hold ``MIXPANEL_AGGREGATE_FLUSH_EVERY`` messages at once, and is best
+    combined with ``task_acks_late``.
+
+    .. _`celery-batches`: https://pypi.org/project/celery-batches/
+"""
+MIXPANEL_AGGREGATE_EVENTS = getattr(settings, 'MIXPANEL_AGGREGATE_EVENTS',
+                                    False)
+
+"""
+.. data:: MIXPANEL_AGGREGATE_FLUSH_EVERY
+
+    Number of buffered ``EventTracker`` messages that triggers sending them
+    when ``MIXPANEL_AGGREGATE_EVENTS`` is on.
+
+    Defaults to 500 messages.
+"""
+MIXPANEL_AGGREGATE_FLUSH_EVERY = getattr(settings,
+                                         'MIXPANEL_AGGREGATE_FLUSH_EVERY', 500)
+
+"""
+.. data:: MIXPANEL_AGGREGATE_FLUSH_INTERVAL
+
+    Number of seconds after which buffered ``EventTracker`` messages are sent
+    anyway when ``MIXPANEL_AGGREGATE_EVENTS`` is on.
+
+    Defaults to 5 seconds.
+"""
+MIXPANEL_AGGREGATE_FLUSH_INTERVAL = getattr(
+    settings, 'MIXPANEL_AGGREGATE_FLUSH_INTERVAL', 5)
+
 """
 .. data:: MIXPANEL_DATA_VARIABLE
 
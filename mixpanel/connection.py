@@ -0,0 +1,255 @@
+"""Process-local pools of keep-alive connections to the Mixpanel api"""
+from __future__ import absolute_import, unicode_literals
+
+import errno
+import functools
+import io
+import os
+import socket
+import threading
+import time
+
+import six
+from six.moves import http_client
+
+from .conf import settings as mp_settings
+
+#: Socket errors that mean the server closed a kept-alive connection.
+STALE_ERRNOS = (errno.EPIPE, errno.ECONNRESET, errno.ECONNABORTED)
+
+_now = getattr(time, 'monotonic', time.time)
+
+
+class _DeadlineSocket(object):
+    """
+    Wraps the socket a response is read from, so that every ``recv`` waits
+    no longer than ``remaining()`` seconds, however the body trickles in.
+    """
+
+    def __init__(self, sock, remaining):
+        self._sock = sock
+        self._remaining = remaining
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+    def recv(self, *args):
+        self._sock.settimeout(self._remaining())
+        return self._sock.recv(*args)
+
+    def recv_into(self, *args):
+        self._sock.settimeout(self._remaining())
+        return self._sock.recv_into(*args)
+
+    def makefile(self, mode='rb', bufsize=-1):
+        if six.PY2:
+            return socket._fileobject(self, mode, bufsize)
+        # Like socket.makefile(), which would read from the socket itself.
+        self._sock._io_refs += 1
+        return io.BufferedReader(socket.SocketIO(self, mode))
+
+
+class HTTPResponse(http_client.HTTPResponse):
+    """
+    An ``HTTPResponse`` that, given ``remaining``, limits every read from
+    the server to ``remaining()`` seconds.
+    """
+
+    def __init__(self, sock, *args, **kwargs):
+        remaining = kwargs.pop('remaining', None)
+        if remaining is not None:
+            sock = _DeadlineSocket(sock, remaining)
+        http_client.HTTPResponse.__init__(self, sock, *args, **kwargs)
+
+
+class HTTPConnection(http_client.HTTPConnection):
+    """
+    An ``HTTPConnection`` whose timeouts only apply to its own socket.
+
+    ``connect_timeout`` limits how long establishing the connection may take
+    and ``read_timeout`` how long we wait on each read from the server.
+    ``deadline`` is the total number of seconds a single request, from
+    connecting through reading the whole response body, may take, or
+    ``None`` for no overall limit. Running out of time raises
+    ``socket.timeout``.
+    """
+    response_class = HTTPResponse
+
+    def __init__(self, host, connect_timeout=None, read_timeout=None,
+                 deadline=None, **kwargs):
+        # HTTPConnection is an old-style class on python 2, so no super().
+        http_client.HTTPConnection.__init__(self, host,
+                                            timeout=connect_timeout, **kwargs)
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.deadline = deadline
+        self._expires_at = None
+
+    def connect(self):
+        self.timeout = self._remaining(self.connect_timeout)
+        http_client.HTTPConnection.connect(self)
+        self.sock.settimeout(self._remaining(self.read_timeout))
+
+    def request(self, *args, **kwargs):
+        if self.deadline is None:
+            self._expires_at = None
+        else:
+            self._expires_at = _now() + self.deadline
+        self._apply_read_timeout()
+        http_client.HTTPConnection.request(self, *args, **kwargs)
+
+    def getresponse(self, *args, **kwargs):
+        # Check the deadline before every recv, not just before each read:
+        # a single read of the body can wait on the server many times.
+        if self._expires_at is None:
+            self.response_class = HTTPResponse
+        else:
+            self.response_class = functools.partial(
+                HTTPResponse,
+                remaining=lambda: self._remaining(self.read_timeout),
+            )
+        return http_client.HTTPConnection.getresponse(self, *args, **kwargs)
+
+    def _apply_read_timeout(self):
+        if self.sock is not None:
+            self.sock.settimeout(self._remaining(self.read_timeout))
+
+    def _remaining(self, timeout):
+        """
+        Returns ``timeout`` cut short to whatever is left of the deadline.
+        """
+        if self._expires_at is None:
+            return timeout
+        remaining = self._expires_at - _now()
+        if remaining <= 0:
+            raise socket.timeout("Mixpanel request deadline exceeded")
+        if timeout is None:
+            return remaining
+        return min(timeout, remaining)
+
+
+class ConnectionPool(object):
+    """
+    A pool of reusable keep-alive connections to a single api server.
+
+    At most ``size`` idle connections are kept around, and connections that
+    have been idle for longer than ``idle_timeout`` seconds are closed
+    instead of being handed out again.
+
+    Pools are thread-safe, but must not be shared across processes. Use
+    :func:`get_pool` to get the pool belonging to the current process.
+    """
+
+    def __init__(self, host, size, idle_timeout):
+        self.host = host
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def get(self):
+        """
+        Returns an idle connection, or a new one if none are left.
+        """
+        expired = []
+        conn = None
+        now = time.time()
+        with self._lock:
+            while self._idle:
+                candidate, released_at = self._idle.pop()
+                if now - released_at < self.idle_timeout:
+                    conn = candidate
+                    break
+                expired.append(candidate)
+        for candidate in expired:
+            candidate.close()
+        if conn is None:
+            conn = self._new_connection()
+        return conn
+
+    def put(self, conn):
+        """
+        Returns ``conn`` to the pool, closing it if the pool is already full.
+
+        Only connections whose last response was read completely may be put
+        back.
+        """
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append((conn, time.time()))
+                return
+        conn.close()
+
+    def clear(self):
+        """
+        Closes all idle connections.
+        """
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, released_at in idle:
+            conn.close()
+
+    def _new_connection(self):
+        return HTTPConnection(
+            self.host,
+            connect_timeout=mp_settings.MIXPANEL_API_CONNECT_TIMEOUT,
+            read_timeout=mp_settings.MIXPANEL_API_READ_TIMEOUT,
+            deadline=mp_settings.MIXPANEL_API_DEADLINE,
+        )
+
+
+_pools = {}
+_pools_pid = None
+_pools_lock = threading.Lock()
+
+
+def get_pool(host=None):
+    """
+    Returns the current process's pool of connections to ``host``, which
+    defaults to `:data:mixpanel.conf.settings.MIXPANEL_API_SERVER`.
+
+    Forked children (such as Celery's prefork pool processes) get pools of
+    their own rather than sharing their parent's sockets.
+    """
+    global _pools_pid
+
+    host = host or mp_settings.MIXPANEL_API_SERVER
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            # The idle sockets belong to our parent. Forget them without
+            # closing them so we don't interfere with its connections.
+            _pools.clear()
+            _pools_pid = os.getpid()
+        pool = _pools.get(host)
+        if pool is None:
+            pool = _pools[host] = ConnectionPool(
+                host,
+                mp_settings.MIXPANEL_CONNECTION_POOL_SIZE,
+                mp_settings.MIXPANEL_CONNECTION_IDLE_TIMEOUT,
+            )
+        return pool
+
+
+def clear_pools():
+    """
+    Closes every idle connection and discards the current process's pools.
+    """
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.clear()
+
+
+def is_stale_connection_error(exc):
+    """
+    Returns ``True`` if ``exc`` looks like the server closed a kept-alive
+    connection before we sent our request on it.
+    """
+    if isinstance(exc, (http_client.BadStatusLine,
+                        http_client.CannotSendRequest)):
+        return True
+    if isinstance(exc, socket.timeout):
+        return False
+    return (isinstance(exc, socket.error) and
+            getattr(exc, 'errno', None) in STALE_ERRNOS)
@@ -0,0 +1,36 @@
+"""Where events that Mixpanel refused as invalid end up"""
+from __future__ import absolute_import, unicode_literals
+
+import logging
+
+from django.utils.module_loading import import_string
+
+from . import metrics
+from .conf import settings as mp_settings
+from .encoding import Encoded
+
+logger = logging.getLogger(__name__)
+
+
+def send(task_name, params, error):
+    """
+    Hands the built ``params`` of an event that can never be sent to the
+    `:data:mixpanel.conf.settings.MIXPANEL_DEAD_LETTER` sink, along with the
+    name of the task that tried and the ``error`` explaining why.
+
+    Events that couldn't even be built are passed as the list of arguments
+    they were given to the task with instead of params.
+
+    Without a sink, the event is logged as an error and dropped.
+    """
+    if isinstance(params, Encoded):
+        params = params.decode()
+    metrics.incr('mixpanel.events.dead_lettered')
+    sink = mp_settings.MIXPANEL_DEAD_LETTER
+    if sink is None:
+        logger.error("Dropping event refused by Mixpanel (%s): <%r>" %
+                     (error, params))
+        return
+    if not callable(sink):
+        sink = import_string(sink)
+    sink(task_name, params, error)
@@ -0,0 +1,86 @@
+"""Stable event ids and a cache of the ones recently sent to Mixpanel"""
+from __future__ import absolute_import, unicode_literals
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from .conf import settings as mp_settings
+from .encoding import Encoded
+
+INSERT_ID = '$insert_id'
+
+
+def with_insert_id(properties):
+    """
+    Returns a copy of ``properties`` with a new ``$insert_id``, unless it
+    already has one. Mixpanel drops events whose ``$insert_id`` it has
+    already seen, so an event stamped once can be sent again safely.
+    """
+    properties = dict(properties or {})
+    if INSERT_ID not in properties:
+        properties[INSERT_ID] = uuid.uuid4().hex
+    return properties
+
+
+def get_insert_id(params):
+    """
+    Returns the ``$insert_id`` of built event ``params``, if any.
+    """
+    if isinstance(params, Encoded):
+        return params.insert_id
+    return (params.get('properties') or {}).get(INSERT_ID)
+
+
+class DedupeCache(object):
+    """
+    A bounded cache of recently sent ``$insert_id``\\ s.
+
+    Holds at most ``size`` ids, dropping the least recently added first, and
+    forgets ids after ``ttl`` seconds. Arguments left out default to the
+    ``MIXPANEL_DEDUPE_CACHE_SIZE`` and ``MIXPANEL_DEDUPE_TTL`` settings.
+    """
+
+    def __init__(self, size=None, ttl=None):
+        self.size = size or mp_settings.MIXPANEL_DEDUPE_CACHE_SIZE
+        self.ttl = ttl or mp_settings.MIXPANEL_DEDUPE_TTL
+        self._expiry = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, insert_id):
+        if insert_id is None:
+            return False
+        with self._lock:
+            expires_at = self._expiry.get(insert_id)
+            if expires_at is None:
+                return False
+            if expires_at <= time.time():
+                del self._expiry[insert_id]
+                return False
+            return True
+
+    def __len__(self):
+        return len(self._expiry)
+
+    def add(self, insert_ids):
+        """
+        Remembers ``insert_ids`` as sent.
+        """
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            for insert_id in insert_ids:
+                if insert_id is None:
+                    continue
+                self._expiry.pop(insert_id, None)
+                self._expiry[insert_id] = expires_at
+            while len(self._expiry) > self.size:
+                self._expiry.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._expiry.clear()
+
+
+#: The ids of events this process has recently sent.
+recently_sent = DedupeCache()
@@ -0,0 +1,202 @@
+"""
+JSON encoding of the data sent to Mixpanel.
+
+The JSON library is picked once, at import:
+:data:`mixpanel.conf.settings.MIXPANEL_JSON_BACKEND` if it's set, otherwise
+the fastest one installed out of :data:`BACKENDS`. Super-properties, which
+are the same for every event, are encoded once and spliced into single
+events rather than encoded over and over.
+"""
+from __future__ import absolute_import, unicode_literals
+
+import datetime
+import decimal
+import importlib
+import json
+import threading
+import uuid
+
+from .conf import settings as mp_settings
+
+#: JSON libraries to try, fastest first, when no backend is configured.
+BACKENDS = ('orjson', 'ujson', 'json')
+
+
+def default(obj):
+    """
+    Returns a JSON-serializable version of the values JSON has no type for:
+    dates and times become ISO 8601 strings, decimals numbers and UUIDs
+    strings.
+    """
+    if isinstance(obj, (datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    raise TypeError("%r is not JSON serializable" % (obj,))
+
+
+def load_backend(name):
+    """
+    Returns a function that encodes objects to compact UTF-8 JSON bytes with
+    the JSON library ``name``, using :func:`default` for other types. Raises
+    ``ImportError`` if the library isn't installed.
+    """
+    module = importlib.import_module(name)
+    if name == 'orjson':
+        return lambda obj: module.dumps(obj, default=default)
+    if name == 'ujson':
+        return lambda obj: module.dumps(obj, default=default).encode('utf8')
+    # json and API-compatible libraries like simplejson. Reuse an encoder,
+    # dumps() builds a new one for every call with non-default arguments.
+    encoder = module.JSONEncoder(separators=(',', ':'), default=default)
+    return lambda obj: encoder.encode(obj).encode('utf8')
+
+
+def _select_backend(name=None):
+    if name:
+        return name, load_backend(name)
+    for name in BACKENDS:
+        try:
+            return name, load_backend(name)
+        except ImportError:
+            continue
+
+
+#: Name of the JSON library in use.
+#: ``dumps(obj)`` encodes ``obj`` to compact UTF-8 JSON bytes with it.
+backend, dumps = _select_backend(mp_settings.MIXPANEL_JSON_BACKEND)
+
+
+class EventEncoder(object):
+    """
+    Encodes built event params, adding ``super_properties`` to each event's
+    properties unless the event sets them itself.
+
+    The super-properties are encoded once, up front, and spliced into single
+    events. Params that aren't events, such as People updates, are encoded
+    as they are.
+    """
+
+    def __init__(self, super_properties=None):
+        self.super_properties = dict(super_properties or {})
+        self._keys = frozenset(self.super_properties)
+        # The members of the encoded object, without the braces.
+        self._fragment = dumps(self.super_properties)[1:-1]
+        self._prefixes = {}
+
+    def encode(self, params):
+        """
+        Returns the JSON bytes of built ``params``, or of a list of them.
+        """
+        if not self.super_properties:
+            return dumps(params)
+        if isinstance(params, list):
+            # A single call encoding the whole batch beats splicing every
+            # event in, which takes a call per event.
+            return dumps([self._merge(p) for p in params])
+        return self._encode(params)
+
+    def _merge(self, params):
+        properties = params.get('properties')
+        if 'event' not in params or not isinstance(properties, dict):
+            return params
+        merged = dict(self.super_properties)
+        merged.update(properties)
+        return dict(params, properties=merged)
+
+    def _encode(self, params):
+        properties = params.get('properties')
+        if 'event' not in params or not isinstance(properties, dict):
+            return dumps(params)
+        if len(params) != 2 or not self._keys.isdisjoint(properties):
+            return dumps(self._merge(params))
+
+        event = params['event']
+        prefix = self._prefixes.get(event)
+        if prefix is None:
+            # Event names come from a small set, so the encoded start of
+            # the event, up to the event's own properties, is cached too.
+            prefix = (b'{"event":' + dumps(event) + b',"properties":{' +
+                      self._fragment)
+            if len(self._prefixes) < 1000:
+                self._prefixes[event] = prefix
+        encoded = dumps(properties)
+        if encoded == b'{}':
+            return prefix + b'}}'
+        return prefix + b',' + encoded[1:] + b'}'
+
+
+_encoder = None
+_encoder_lock = threading.Lock()
+
+
+def get_encoder():
+    """
+    Returns an encoder for the current
+    `:data:mixpanel.conf.settings.MIXPANEL_SUPER_PROPERTIES`.
+    """
+    global _encoder
+
+    super_properties = mp_settings.MIXPANEL_SUPER_PROPERTIES
+    cached = _encoder
+    if cached is None or cached[0] is not super_properties:
+        with _encoder_lock:
+            cached = _encoder = (super_properties,
+                                 EventEncoder(super_properties))
+    return cached[1]
+
+
+class Encoded(object):
+    """
+    Params that were built and encoded by the process that queued the task,
+    so the worker can send them without encoding them again.
+
+    ``text`` is the JSON of the params, and ``insert_id`` their
+    ``$insert_id``, if any.
+    """
+    __slots__ = ('text', 'insert_id')
+
+    def __init__(self, text, insert_id=None):
+        self.text = text
+        self.insert_id = insert_id
+
+    @classmethod
+    def from_params(cls, params, insert_id=None):
+        return cls(encode(params).decode('utf8'), insert_id)
+
+    def __repr__(self):
+        return 'Encoded(%r)' % (self.text,)
+
+    @property
+    def size(self):
+        """
+        The size of the encoded params in bytes.
+        """
+        return len(self.text.encode('utf8'))
+
+    def to_message(self):
+        """
+        Returns the encoded params in a form any task serializer can carry.
+        """
+        return [self.text, self.insert_id]
+
+    def decode(self):
+        """
+        Returns the params, decoded again.
+        """
+        return json.loads(self.text)
+
+
+def encode(params):
+    """
+    Returns the JSON bytes of built ``params``, or of a list of them, with
+    the configured super-properties added to events. :class:`Encoded`
+    params are used as they are.
+    """
+    if isinstance(params, Encoded):
+        return params.text.encode('utf8')
+    if params and isinstance(params, list) and isinstance(params[0], Encoded):
+        return b'[' + b','.join(p.text.encode('utf8') for p in params) + b']'
+    return get_encoder().encode(params)
@@ -0,0 +1,84 @@
+"""Sending many batches to Mixpanel concurrently from a pool of threads"""
+from __future__ import absolute_import, unicode_literals
+
+import sys
+import threading
+
+import six
+from six.moves import queue
+
+from . import concurrency
+
+
+def send_batches(task, batches, threads):
+    """
+    Sends each ``(params, test)`` batch with ``task`` from up to ``threads``
+    threads and returns, in order, the result of ``task._send_batch`` for it
+    or the ``FailedEventRequest`` it raised.
+
+    The threads borrow their connections from the process's keep-alive
+    pool, so set `:data:mixpanel.conf.settings.MIXPANEL_CONNECTION_POOL_SIZE`
+    to at least ``threads`` to keep them all open between calls. With
+    `:data:mixpanel.conf.settings.MIXPANEL_ADAPTIVE_CONCURRENCY` on, fewer
+    of them may be sending at once.
+    """
+    outcomes = [None] * len(batches)
+    pending = queue.Queue()
+    for index, batch in enumerate(batches):
+        pending.put((index, batch))
+    errors = []
+    gate = threading.Condition()
+    in_flight = [0]
+
+    def work():
+        conn = None
+        try:
+            while not errors:
+                with gate:
+                    while in_flight[0] >= concurrency.get_limit(threads):
+                        gate.wait()
+                    try:
+                        index, (params, test) = pending.get_nowait()
+                    except queue.Empty:
+                        break
+                    in_flight[0] += 1
+                    sending = in_flight[0]
+                if conn is None:
+                    conn = task._get_connection()
+                started = concurrency.now()
+                failure = None
+                try:
+                    outcomes[index] = task._send_batch(conn, params, test)
+                except task.PartiallyRejected as e:
+                    outcomes[index] = e
+                except task.FailedEventRequest as e:
+                    conn.close()
+                    conn = None
+                    outcomes[index] = failure = e
+                finally:
+                    with gate:
+                        in_flight[0] -= 1
+                        gate.notify_all()
+                concurrency.record(started, failure, sending)
+        except Exception:
+            errors.append(sys.exc_info())
+            if conn is not None:
+                # The request or response may be half done, so the
+                # connection mustn't go back to the keep-alive pool.
+                conn.close()
+                conn = None
+        if conn is not None:
+            task._release_connection(conn)
+
+    workers = [
+        threading.Thread(target=work)
+        for i in range(min(threads, len(batches)))
+    ]
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+    for worker in workers:
+        worker.join()
+    if errors:
+        six.reraise(*errors[0])
+    return outcomes
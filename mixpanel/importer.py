@@ -0,0 +1,274 @@
+"""
+Streaming bulk import of historical events into Mixpanel.
+
+Used by the ``mixpanel_import`` management command. Events are read lazily
+from JSON-lines files, gzipped or not, or from spool segments, built with
+the usual ``_build_params`` logic and uploaded in batches by a pool of
+threads. A checkpoint file records how far each file got, so an interrupted
+import can be resumed.
+"""
+from __future__ import absolute_import, unicode_literals
+
+import gzip
+import io
+import json
+import logging
+import os
+import threading
+import time
+
+from six.moves import queue
+
+from .batching import encode_params, split
+from .conf import settings as mp_settings
+from .spool import decode_record
+from .tasks import EventTracker, event_importer
+
+logger = logging.getLogger(__name__)
+
+
+class ImportFailed(Exception):
+    """
+    A batch of events couldn't be imported, even after retrying.
+    """
+
+
+class Checkpoint(object):
+    """
+    The number of lines of each file that have been imported, stored as JSON
+    in ``path``. Without a ``path`` nothing is stored.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.lines = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.lines = json.load(f)
+
+    def get(self, name):
+        return self.lines.get(os.path.abspath(name), 0)
+
+    def set(self, name, line):
+        self.lines[os.path.abspath(name)] = line
+        if not self.path:
+            return
+        tmp_path = '%s.tmp' % self.path
+        with open(tmp_path, 'w') as f:
+            json.dump(self.lines, f)
+        os.rename(tmp_path, self.path)
+
+
+class Importer(object):
+    """
+    Imports events from files with ``workers`` concurrent uploads of up to
+    ``batch_size`` events each.
+
+    ``token`` overrides the token of events that don't have one. Set
+    ``spool`` to read spool segments instead of JSON lines. ``progress`` is
+    called with a message every ``progress_every`` batches.
+
+    Raises ``ValueError`` if the tracker can't authenticate, for example
+    without `:data:mixpanel.conf.settings.MIXPANEL_API_SECRET`.
+    """
+    tracker = event_importer
+
+    def __init__(self, workers=None, batch_size=None, checkpoint=None,
+                 token=None, spool=False, progress=None,
+                 progress_every=100):
+        self.workers = workers or mp_settings.MIXPANEL_IMPORT_WORKERS
+        self.batch_size = batch_size or mp_settings.MIXPANEL_BATCH_SIZE
+        self.checkpoint = Checkpoint(checkpoint)
+        self.token = token
+        self.spool = spool
+        self.progress = progress or logger.info
+        self.progress_every = progress_every
+        # Fail now rather than in every worker thread.
+        self.tracker._request_headers()
+
+    def run(self, paths):
+        """
+        Imports every file in ``paths`` and returns the number of events
+        sent. Raises ``ImportFailed`` if a batch couldn't be imported.
+        """
+        return sum(self.import_file(path) for path in paths)
+
+    def import_file(self, path):
+        """
+        Imports the events of a single file, starting after its checkpoint.
+        """
+        state = _FileState(self, path)
+        batches = queue.Queue(maxsize=self.workers * 2)
+        threads = [
+            threading.Thread(target=self._work, args=(batches, state))
+            for i in range(self.workers)
+        ]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        try:
+            events = (
+                (line, encode_params(params))
+                for line, params in self._read(path, state.start_line)
+            )
+            sized = split(events, lambda item: item[1].size, self.batch_size)
+            for batch, oversized in sized:
+                line = batch[-1][0]
+                if oversized:
+                    logger.warning("Skipping event too large to import at "
+                                   "%s:%d" % (path, line))
+                    continue
+                batches.put(state.add_batch([p for _, p in batch], line))
+                if state.error is not None:
+                    break
+        finally:
+            for thread in threads:
+                batches.put(None)
+            for thread in threads:
+                thread.join()
+
+        if state.error is not None:
+            raise ImportFailed("Importing %s failed after line %d: %s" % (
+                path, self.checkpoint.get(path), state.error,
+            ))
+        self.progress("%s: imported %d events" % (path, state.sent))
+        return state.sent
+
+    def _read(self, path, start_line):
+        """
+        Yields the line number and built params of each event in ``path``
+        after ``start_line``.
+        """
+        if path.endswith('.gz'):
+            f = io.TextIOWrapper(gzip.open(path), encoding='utf8')
+        else:
+            f = io.open(path, encoding='utf8')
+        with f:
+            for line_number, line in enumerate(f, 1):
+                if line_number <= start_line or not line.strip():
+                    continue
+                if self.spool:
+                    record = decode_record(line.encode('utf8'))
+                    if record is None:
+                        logger.warning("Skipping corrupt record at %s:%d" %
+                                       (path, line_number))
+                        continue
+                    task_name, params, test = record
+                    if 'event' not in params:
+                        # People updates can't go through the import API.
+                        logger.warning("Skipping %s record at %s:%d" %
+                                       (task_name, path, line_number))
+                        continue
+                    yield line_number, params
+                    continue
+                try:
+                    record = json.loads(line)
+                    params = self.tracker._build_params(
+                        record['event'],
+                        record.get('properties'),
+                        token=self.token,
+                    )
+                except (ValueError, KeyError, TypeError, AttributeError) as e:
+                    logger.warning("Skipping invalid event at %s:%d: %r" %
+                                   (path, line_number, e))
+                    continue
+                yield line_number, params
+
+    def _work(self, batches, state):
+        while True:
+            item = batches.get()
+            if item is None:
+                return
+            sequence, line, params = item
+            if state.error is not None:
+                # Another batch failed; drain the queue without sending.
+                continue
+            try:
+                sent = self._send(params)
+            except Exception as e:
+                # Keep draining the queue so the reader never blocks.
+                if not isinstance(e, EventTracker.FailedEventRequest):
+                    logger.exception("Importing a batch of %s failed" %
+                                     state.path)
+                state.fail(e)
+            else:
+                state.done(sequence, line, sent)
+
+    def _send(self, params):
+        """
+        Sends a batch, retrying retryable failures with backoff, and
+        returns the number of events imported. Events Mixpanel refuses are
+        handed to the dead-letter sink.
+        """
+        policy = self.tracker.retry_policy
+        retries = 0
+        while True:
+            conn = self.tracker._get_connection()
+            try:
+                self.tracker._send_batch(conn, params, None)
+            except EventTracker.PartiallyRejected as e:
+                self.tracker._release_connection(conn)
+                return len(self.tracker._dead_letter_refused(params, e))
+            except EventTracker.FailedEventRequest as e:
+                conn.close()
+                if (not policy.should_retry(e) or
+                        retries >= self.tracker.max_retries):
+                    raise
+                time.sleep(policy.countdown(retries, e.retry_after))
+                retries += 1
+            else:
+                self.tracker._release_connection(conn)
+                return len(params)
+
+
+class _FileState(object):
+    """
+    Progress of importing one file, shared by the worker threads.
+
+    Batches can finish out of order, so the checkpoint only moves past a
+    batch once every batch before it has been imported too.
+    """
+
+    def __init__(self, importer, path):
+        self.importer = importer
+        self.path = path
+        self.start_line = importer.checkpoint.get(path)
+        self.sent = 0
+        self.error = None
+        self._batches = 0
+        self._completed = 0
+        self._next = 0
+        self._finished = {}
+        self._started_at = time.time()
+        self._lock = threading.Lock()
+
+    def add_batch(self, params, line):
+        sequence = self._batches
+        self._batches += 1
+        return sequence, line, params
+
+    def done(self, sequence, line, count):
+        with self._lock:
+            self.sent += count
+            self._completed += 1
+            self._finished[sequence] = line
+            checkpoint_line = None
+            while self._next in self._finished:
+                checkpoint_line = self._finished.pop(self._next)
+                self._next += 1
+            if checkpoint_line is not None:
+                self.importer.checkpoint.set(self.path, checkpoint_line)
+            if self._completed % self.importer.progress_every == 0:
+                elapsed = time.time() - self._started_at
+                self.importer.progress(
+                    "%s: %d events imported (%.0f/s), up to line %d" % (
+                        self.path, self.sent, self.sent / max(elapsed, 1e-6),
+                        self.importer.checkpoint.get(self.path),
+                    )
+                )
+
+    def fail(self, exc):
+        with self._lock:
+            if self.error is None:
+                self.error = exc
@@ -0,0 +1,53 @@
+from __future__ import absolute_import, unicode_literals
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mixpanel.importer import ImportFailed, Importer
+
+
+class Command(BaseCommand):
+    help = ("Imports events into Mixpanel from JSON-lines files, which may "
+            "be gzipped, or from spool segments.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths', nargs='+',
+            help="Files with one {\"event\": ..., \"properties\": ...} "
+                 "object per line. Names ending in .gz are decompressed.")
+        parser.add_argument(
+            '--workers', type=int,
+            help="Number of concurrent uploads. Defaults to the "
+                 "MIXPANEL_IMPORT_WORKERS setting.")
+        parser.add_argument(
+            '--batch-size', type=int,
+            help="Number of events per request. Defaults to the "
+                 "MIXPANEL_BATCH_SIZE setting.")
+        parser.add_argument(
+            '--checkpoint',
+            help="File recording how far each input got. Rerunning with "
+                 "the same checkpoint resumes an interrupted import.")
+        parser.add_argument(
+            '--token',
+            help="Token for events that don't have one. Defaults to the "
+                 "MIXPANEL_API_TOKEN setting.")
+        parser.add_argument(
+            '--spool', action='store_true',
+            help="Read spool segments instead of JSON lines.")
+
+    def handle(self, *args, **options):
+        try:
+            importer = Importer(
+                workers=options['workers'],
+                batch_size=options['batch_size'],
+                checkpoint=options['checkpoint'],
+                token=options['token'],
+                spool=options['spool'],
+                progress=self.stdout.write,
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        try:
+            sent = importer.run(options['paths'])
+        except ImportFailed as e:
+            raise CommandError(str(e))
+        self.stdout.write("Imported %d events" % sent)
@@ -0,0 +1,57 @@
+"""Process-local counters and gauges describing mixpanel-celery's state"""
+from __future__ import absolute_import, unicode_literals
+
+import threading
+
+from django.utils.module_loading import import_string
+
+from .conf import settings as mp_settings
+
+COUNTER = 'counter'
+GAUGE = 'gauge'
+
+_values = {}
+_lock = threading.Lock()
+
+
+def incr(name, value=1):
+    """
+    Adds ``value`` to the counter ``name``.
+    """
+    with _lock:
+        _values[name] = _values.get(name, 0) + value
+    _report(COUNTER, name, value)
+
+
+def gauge(name, value):
+    """
+    Sets the gauge ``name`` to ``value``.
+    """
+    with _lock:
+        _values[name] = value
+    _report(GAUGE, name, value)
+
+
+def snapshot():
+    """
+    Returns a dictionary of the current value of every metric.
+    """
+    with _lock:
+        return dict(_values)
+
+
+def reset():
+    """
+    Forgets every metric.
+    """
+    with _lock:
+        _values.clear()
+
+
+def _report(kind, name, value):
+    backend = mp_settings.MIXPANEL_METRICS_BACKEND
+    if backend is None:
+        return
+    if not callable(backend):
+        backend = import_string(backend)
+    backend(kind, name, value)
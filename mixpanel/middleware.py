@@ -0,0 +1,83 @@
+from __future__ import absolute_import, unicode_literals
+
+from django.db import transaction
+
+try:
+    from django.utils.deprecation import MiddlewareMixin
+except ImportError:
+    # Django < 1.10 only has old-style middleware.
+    MiddlewareMixin = object
+
+from .coalesce import PeopleCoalescer
+from .tasks import batch_event_tracker
+
+
+class EventCollector(object):
+    """
+    Collects the Mixpanel events of a single request so they can be queued
+    together once the request is done.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.people_updates = []
+
+    def track(self, event_name, properties=None, token=None):
+        """
+        Collects an event, with the same arguments as ``EventTracker``.
+        """
+        properties = dict(properties or {})
+        if token:
+            properties['token'] = token
+        self.events.append((event_name, properties))
+
+    def people(self, event_name, properties=None, **kwargs):
+        """
+        Collects a People update, with the same arguments as
+        ``PeopleTracker``.
+        """
+        self.people_updates.append((event_name, properties, kwargs))
+
+    def people_set(self, properties, **kwargs):
+        """
+        Collects a People ``set`` update.
+        """
+        self.people('set', properties, **kwargs)
+
+    def flush(self):
+        """
+        Queues the collected events as a single batch task, and the
+        collected People updates, merged per profile, as another.
+        """
+        events, self.events = self.events, []
+        updates, self.people_updates = self.people_updates, []
+        if events:
+            batch_event_tracker.delay(events)
+        coalescer = PeopleCoalescer(window=0)
+        for event_name, properties, kwargs in updates:
+            coalescer.people(event_name, properties, **kwargs)
+        coalescer.flush()
+
+
+class EventCollectorMiddleware(MiddlewareMixin):
+    """
+    Gives each request an :class:`EventCollector` as ``request.mixpanel``.
+
+    Whatever views collect is queued once the response is ready, rather than
+    publishing a task for every event while the view is running. If the
+    response is returned inside a transaction, the events wait for it to
+    commit and are dropped if it rolls back.
+    """
+
+    def process_request(self, request):
+        request.mixpanel = EventCollector()
+
+    def process_response(self, request, response):
+        collector = getattr(request, 'mixpanel', None)
+        if collector is not None:
+            if hasattr(transaction, 'on_commit'):
+                # Runs straight away when there's no transaction open.
+                transaction.on_commit(collector.flush)
+            else:
+                collector.flush()
+        return response
@@ -0,0 +1,135 @@
+"""Deciding whether and when failed Mixpanel requests are retried"""
+from __future__ import absolute_import, unicode_literals
+
+import json
+import random
+import time
+from email.utils import mktime_tz, parsedate_tz
+
+from .conf import settings as mp_settings
+
+#: 4xx statuses that are worth retrying: timeouts and rate limiting.
+RETRYABLE_CLIENT_STATUSES = (408, 429)
+
+
+def is_retryable_status(status):
+    """
+    Returns ``True`` if a request that got an HTTP ``status`` back may
+    succeed when sent again. Other 4xx errors mean Mixpanel refused the
+    request itself, so sending it again won't help.
+    """
+    return not (400 <= status < 500) or status in RETRYABLE_CLIENT_STATUSES
+
+
+def parse_retry_after(value, now=None):
+    """
+    Returns the number of seconds a ``Retry-After`` header value asks us to
+    wait, or ``None`` if there isn't a usable one.
+
+    The header can hold either a number of seconds or an HTTP date.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    parsed = parsedate_tz(value)
+    if parsed is None:
+        return None
+    if now is None:
+        now = time.time()
+    return max(0, mktime_tz(parsed) - now)
+
+
+def _parse_json(data):
+    if isinstance(data, bytes):
+        data = data.decode('utf8', 'replace')
+    try:
+        return json.loads(data)
+    except ValueError:
+        return None
+
+
+def is_verbose_success(data):
+    """
+    Returns ``True`` if the body ``data`` of a verbose or strict response
+    says every event was recorded.
+    """
+    parsed = _parse_json(data)
+    if not isinstance(parsed, dict):
+        return False
+    return parsed.get('status') in (1, 'OK')
+
+
+def parse_verbose_error(data):
+    """
+    Returns the error Mixpanel gave for a whole request in the body ``data``
+    of a verbose response, such as ``{"status": 0, "error": "..."}`` from
+    ``/track``, or ``None`` if it doesn't report one.
+    """
+    parsed = _parse_json(data)
+    if not isinstance(parsed, dict) or parsed.get('status') != 0:
+        return None
+    return parsed.get('error') or 'unknown error'
+
+
+def parse_failed_records(data):
+    """
+    Returns a dictionary mapping the index of each event Mixpanel refused
+    to its explanation, from the body ``data`` of a response to a strict
+    batch, or ``None`` if the body doesn't list the refused events.
+    """
+    parsed = _parse_json(data)
+    if not isinstance(parsed, dict):
+        return None
+    failed = {}
+    for record in parsed.get('failed_records') or ():
+        if not isinstance(record, dict) or 'index' not in record:
+            return None
+        failed[record['index']] = '%s: %s' % (
+            record.get('field'), record.get('message'),
+        )
+    return failed or None
+
+
+class RetryPolicy(object):
+    """
+    Capped exponential backoff with full jitter.
+
+    The n-th retry waits a random amount of time between zero and
+    ``base * 2 ** n`` seconds, but never more than ``cap`` seconds, so that
+    events that failed together don't all come back at once. A
+    ``Retry-After`` given by Mixpanel is always waited out, even beyond
+    ``cap``.
+
+    ``base`` and ``cap`` default to the ``MIXPANEL_RETRY_BACKOFF`` and
+    ``MIXPANEL_RETRY_DELAY`` settings.
+    """
+
+    def __init__(self, base=None, cap=None):
+        self.base = base
+        self.cap = cap
+
+    def countdown(self, retries, retry_after=None):
+        """
+        Returns the number of seconds to wait before retry number
+        ``retries`` (counting from zero).
+        """
+        base = self.base
+        if base is None:
+            base = mp_settings.MIXPANEL_RETRY_BACKOFF
+        cap = self.cap
+        if cap is None:
+            cap = mp_settings.MIXPANEL_RETRY_DELAY
+
+        delay = random.uniform(0, min(cap, base * 2 ** retries))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def should_retry(self, exc):
+        """
+        Returns ``True`` if the request that raised ``exc`` may succeed when
+        sent again.
+        """
+        return getattr(exc, 'retryable', True)
@@ -0,0 +1,35 @@
+"""Routing tracking tasks to queues by how urgent their events are"""
+from __future__ import absolute_import, unicode_literals
+
+from .conf import settings as mp_settings
+
+HIGH = 'high'
+NORMAL = 'normal'
+BULK = 'bulk'
+
+#: Lanes from the most to the least urgent.
+LANES = (HIGH, NORMAL, BULK)
+
+
+def lane_for(event_names, default=NORMAL):
+    """
+    Returns the lane of a message carrying ``event_names``, which are event
+    names or People operations: the most urgent of their lanes in
+    `:data:mixpanel.conf.settings.MIXPANEL_LANES`, with ``default`` for the
+    ones not listed there.
+    """
+    lanes = mp_settings.MIXPANEL_LANES
+    found = set(lanes.get(name, default) for name in event_names)
+    for lane in LANES:
+        if lane in found:
+            return lane
+    return default
+
+
+def queue_for(event_names, default=NORMAL):
+    """
+    Returns the name of the queue for a message carrying ``event_names``,
+    or ``None`` if `:data:mixpanel.conf.settings.MIXPANEL_QUEUES` doesn't
+    name one for its lane.
+    """
+    return mp_settings.MIXPANEL_QUEUES.get(lane_for(event_names, default))
@@ -0,0 +1,120 @@
+"""Dropping low-value events before they're queued"""
+from __future__ import absolute_import, unicode_literals
+
+import random
+import threading
+import time
+
+from . import metrics
+from .conf import settings as mp_settings
+
+#: Property recording the share of an event's occurrences that were kept.
+SAMPLE_RATE = '$sample_rate'
+
+_now = getattr(time, 'monotonic', time.time)
+
+
+def sample(event_name, properties):
+    """
+    Decides whether to keep an occurrence of ``event_name``, going by its
+    rate in `:data:mixpanel.conf.settings.MIXPANEL_SAMPLE_RATES`.
+
+    Returns ``None`` if it's dropped. Otherwise returns ``properties``, or
+    an empty dictionary if there are none, copied and given a
+    ``$sample_rate`` property if the event is sampled.
+    """
+    rate = mp_settings.MIXPANEL_SAMPLE_RATES.get(event_name)
+    if rate is None or rate >= 1:
+        return {} if properties is None else properties
+    if random.random() >= rate:
+        metrics.incr('mixpanel.events.sampled_out')
+        return None
+    properties = dict(properties or {})
+    properties[SAMPLE_RATE] = rate
+    return properties
+
+
+class TokenBucket(object):
+    """
+    Allows ``rate`` events a second on average, and bursts of up to
+    ``burst`` events. Thread-safe.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._tokens = self.burst
+        self._updated_at = _now()
+        self._lock = threading.Lock()
+
+    def take(self):
+        """
+        Returns ``True`` if an event may go through now.
+        """
+        with self._lock:
+            now = _now()
+            self._tokens = min(
+                self.burst,
+                self._tokens + (now - self._updated_at) * self.rate,
+            )
+            self._updated_at = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class RateLimiter(object):
+    """
+    Keeps a ``TokenBucket`` for each Mixpanel project token, allowing the
+    rate set by `:data:mixpanel.conf.settings.MIXPANEL_RATE_LIMIT`.
+
+    Each process has its own buckets.
+    """
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def allow(self, token):
+        """
+        Returns ``True`` if an event for ``token`` may be queued now.
+        """
+        rate = mp_settings.MIXPANEL_RATE_LIMIT
+        if rate is None:
+            return True
+        with self._lock:
+            bucket = self._buckets.get(token)
+            if bucket is None:
+                burst = mp_settings.MIXPANEL_RATE_LIMIT_BURST or rate
+                bucket = self._buckets[token] = TokenBucket(rate, burst)
+        if bucket.take():
+            return True
+        metrics.incr('mixpanel.events.rate_limited')
+        return False
+
+    def clear(self):
+        """
+        Forgets every bucket.
+        """
+        with self._lock:
+            self._buckets.clear()
+
+
+#: The limiter checked by the tracking tasks before queueing events.
+rate_limiter = RateLimiter()
+
+
+def admit(event_name, properties, token=None):
+    """
+    Returns the properties to queue an occurrence of ``event_name`` with,
+    after sampling, or ``None`` if it's sampled out or over the rate limit
+    of ``token``, which defaults to
+    `:data:mixpanel.conf.settings.MIXPANEL_API_TOKEN`.
+    """
+    properties = sample(event_name, properties)
+    if properties is None:
+        return None
+    if not rate_limiter.allow(token or mp_settings.MIXPANEL_API_TOKEN):
+        return None
+    return properties
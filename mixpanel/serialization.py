@@ -0,0 +1,86 @@
+"""
+A compact kombu serializer for tracking task messages.
+
+Messages are encoded with msgpack when it's installed and compact JSON
+otherwise, and compressed with zlib once they're larger than
+:data:`mixpanel.conf.settings.MIXPANEL_COMPRESS_MESSAGES_OVER` bytes. The
+serializer is registered as ``mixpanel`` when this module is imported, and
+the trackers use it when
+:data:`mixpanel.conf.settings.MIXPANEL_COMPACT_MESSAGES` is on.
+
+Workers only accept it if it's in celery's ``accept_content`` setting.
+"""
+from __future__ import absolute_import, unicode_literals
+
+import json
+import zlib
+
+from kombu.serialization import register
+
+from . import encoding
+from .conf import settings as mp_settings
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+NAME = 'mixpanel'
+CONTENT_TYPE = 'application/x-mixpanel'
+
+# The first byte of a message says how the rest of it is encoded.
+MSGPACK = b'M'
+JSON = b'J'
+ZLIB = b'Z'
+
+
+def _msgpack_dumps(obj):
+    return msgpack.packb(obj, use_bin_type=True, default=encoding.default)
+
+
+def _msgpack_loads(data):
+    return msgpack.unpackb(data, raw=False)
+
+
+def _json_loads(data):
+    return json.loads(data.decode('utf8'))
+
+
+def dumps(obj, compress_over=None):
+    """
+    Returns ``obj`` encoded as a message body, compressed if it's larger
+    than ``compress_over`` bytes, which defaults to the
+    ``MIXPANEL_COMPRESS_MESSAGES_OVER`` setting.
+    """
+    if msgpack is not None:
+        data = MSGPACK + _msgpack_dumps(obj)
+    else:
+        data = JSON + encoding.dumps(obj)
+    if compress_over is None:
+        compress_over = mp_settings.MIXPANEL_COMPRESS_MESSAGES_OVER
+    if compress_over is not None and len(data) > compress_over:
+        data = ZLIB + zlib.compress(data)
+    return data
+
+
+def loads(data):
+    """
+    Returns the object encoded in a message body.
+    """
+    data = bytes(data)
+    if data[:1] == ZLIB:
+        data = zlib.decompress(data[1:])
+    codec, data = data[:1], data[1:]
+    if codec == MSGPACK:
+        if msgpack is None:
+            raise ValueError(
+                "Can't decode message: msgpack isn't installed",
+            )
+        return _msgpack_loads(data)
+    if codec == JSON:
+        return _json_loads(data)
+    raise ValueError("Unknown message encoding: %r" % (codec,))
+
+
+register(NAME, dumps, loads, content_type=CONTENT_TYPE,
+         content_encoding='binary')
@@ -0,0 +1,282 @@
+"""
+A durable on-disk spool for events that couldn't be delivered to Mixpanel.
+
+Events are appended to segment files in
+:data:`mixpanel.conf.settings.MIXPANEL_SPOOL_DIR`, one checksummed JSON
+record per line. Every process writes to segments of its own, which are
+sealed once they grow too big or too old. ``mixpanel.tasks.SpoolDrainer``
+claims sealed segments and replays them in batches.
+"""
+from __future__ import absolute_import, unicode_literals
+
+import atexit
+import binascii
+import json
+import logging
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, where open segments are only told apart
+    # by how long ago they were written to.
+    fcntl = None
+
+from .conf import settings as mp_settings
+
+logger = logging.getLogger(__name__)
+
+OPEN_SUFFIX = '.open'
+SEALED_SUFFIX = '.seg'
+CLAIMED_SUFFIX = '.draining'
+
+
+def _checksum(data):
+    return '%08x' % (binascii.crc32(data) & 0xffffffff)
+
+
+def encode_record(task_name, params, test=None):
+    """
+    Returns the spool line for the built ``params`` of one event that
+    ``task_name`` failed to send with the ``test`` flag.
+    """
+    record = {'task': task_name, 'params': params}
+    if test is not None:
+        record['test'] = test
+    data = json.dumps(record, separators=(',', ':'),
+                      sort_keys=True).encode('utf8')
+    return _checksum(data).encode('ascii') + b' ' + data + b'\n'
+
+
+def decode_record(line):
+    """
+    Returns the ``(task_name, params, test)`` of a spool line, or ``None``
+    if the line is truncated or corrupt.
+    """
+    checksum, _, data = line.rstrip(b'\n').partition(b' ')
+    if (not line.endswith(b'\n') or
+            _checksum(data).encode('ascii') != checksum):
+        return None
+    record = json.loads(data.decode('utf8'))
+    return record['task'], record['params'], record.get('test')
+
+
+class Spool(object):
+    """
+    An append-only spool of undeliverable events in ``directory``.
+
+    The current segment is sealed once it holds ``segment_size`` bytes or
+    was opened ``segment_age`` seconds ago, even if nothing else is written
+    to it, and written records are fsynced every ``fsync_every`` records.
+    Records are handed to the operating system as soon as they're written,
+    so only a crash of the whole machine can lose the unsynced ones.
+    Arguments left out default to the matching ``MIXPANEL_SPOOL_*``
+    settings.
+
+    Spools are thread-safe. Each process needs a spool of its own, see
+    :func:`get_spool`.
+    """
+
+    def __init__(self, directory, segment_size=None, segment_age=None,
+                 fsync_every=None):
+        self.directory = directory
+        self.segment_size = (segment_size or
+                             mp_settings.MIXPANEL_SPOOL_SEGMENT_SIZE)
+        self.segment_age = (segment_age or
+                            mp_settings.MIXPANEL_SPOOL_SEGMENT_AGE)
+        self.fsync_every = (fsync_every or
+                            mp_settings.MIXPANEL_SPOOL_FSYNC_EVERY)
+        self._file = None
+        self._path = None
+        self._opened_at = None
+        self._timer = None
+        self._unsynced = 0
+        self._counter = 0
+        self._lock = threading.Lock()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def write(self, task_name, params_list, test=None):
+        """
+        Appends the built params of events ``task_name`` couldn't send with
+        the ``test`` flag.
+        """
+        data = b''.join(encode_record(task_name, p, test)
+                        for p in params_list)
+        with self._lock:
+            if self._file is not None and (
+                    self._file.tell() >= self.segment_size or
+                    time.time() - self._opened_at >= self.segment_age):
+                self._seal()
+            if self._file is None:
+                self._open()
+            self._file.write(data)
+            self._unsynced += len(params_list)
+            if self._unsynced >= self.fsync_every:
+                self._sync()
+            else:
+                self._file.flush()
+
+    def seal(self):
+        """
+        Syncs and seals the current segment so it can be drained.
+        """
+        with self._lock:
+            if self._file is not None:
+                self._seal()
+
+    def claim(self):
+        """
+        Claims the sealed segments, oldest first, so no other drainer
+        replays them. Open segments left behind by a process that went away
+        are claimed as well, once they haven't been written to in twice
+        ``segment_age`` seconds. Writers hold a lock on their open segment,
+        so idle ones are never claimed from under a live process.
+
+        Returns the paths of the claimed segments.
+        """
+        claimed = []
+        stale_before = time.time() - 2 * self.segment_age
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            if name.endswith(OPEN_SUFFIX):
+                if path == self._path:
+                    continue
+                try:
+                    if os.path.getmtime(path) > stale_before:
+                        continue
+                except OSError:
+                    continue
+                if _is_locked(path):
+                    continue
+            elif not name.endswith(SEALED_SUFFIX):
+                continue
+            claimed_path = os.path.splitext(path)[0] + CLAIMED_SUFFIX
+            try:
+                os.rename(path, claimed_path)
+            except OSError:
+                # Another drainer got there first.
+                continue
+            claimed.append(claimed_path)
+        return claimed
+
+    def read(self, path):
+        """
+        Yields the ``(task_name, params, test)`` of every intact record in
+        the segment at ``path``.
+        """
+        with open(path, 'rb') as f:
+            for line in f:
+                record = decode_record(line)
+                if record is None:
+                    logger.warning("Skipping corrupt record in %s" % path)
+                    continue
+                yield record
+
+    def unclaim(self, path):
+        """
+        Hands a claimed segment back, to be drained later.
+        """
+        os.rename(path, os.path.splitext(path)[0] + SEALED_SUFFIX)
+
+    def remove(self, path):
+        """
+        Deletes a claimed segment once it has been replayed.
+        """
+        os.remove(path)
+
+    def _open(self):
+        self._counter += 1
+        name = '%020d-%d-%d%s' % (time.time() * 1000000, os.getpid(),
+                                  self._counter, OPEN_SUFFIX)
+        self._path = os.path.join(self.directory, name)
+        self._file = open(self._path, 'ab')
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self._opened_at = time.time()
+        self._unsynced = 0
+        # Seal the segment once it's old enough to drain, in case this
+        # process doesn't spool anything else for a while.
+        self._timer = threading.Timer(self.segment_age, self._expire,
+                                      args=(self._path,))
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _expire(self, path):
+        with self._lock:
+            if self._file is not None and self._path == path:
+                self._seal()
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def _seal(self):
+        try:
+            self._sync()
+            self._file.close()
+            os.rename(self._path,
+                      os.path.splitext(self._path)[0] + SEALED_SUFFIX)
+        except (IOError, OSError) as e:
+            # The segment is gone or broken; the next write opens a new one.
+            logger.warning("Couldn't seal spool segment %s: %s" %
+                           (self._path, e))
+            self._file.close()
+        finally:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._file = self._path = self._opened_at = self._timer = None
+
+
+def _is_locked(path):
+    """
+    Returns ``True`` if a live process still has the open segment at
+    ``path`` locked for writing.
+    """
+    if fcntl is None:
+        return False
+    try:
+        with open(path, 'ab') as f:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except (IOError, OSError):
+                return True
+            # Closing the file releases the lock again.
+            return False
+    except (IOError, OSError):
+        # Sealed or claimed in the meantime.
+        return True
+
+
+_spool = None
+_spool_pid = None
+_spool_lock = threading.Lock()
+
+
+def get_spool():
+    """
+    Returns the current process's spool in
+    `:data:mixpanel.conf.settings.MIXPANEL_SPOOL_DIR`, or ``None`` if
+    spooling is turned off.
+    """
+    global _spool, _spool_pid
+
+    directory = mp_settings.MIXPANEL_SPOOL_DIR
+    if not directory:
+        return None
+    with _spool_lock:
+        if (_spool is None or _spool_pid != os.getpid() or
+                _spool.directory != directory):
+            # A forked child must not append to its parent's segment.
+            _spool = Spool(directory)
+            _spool_pid = os.getpid()
+        return _spool
+
+
+@atexit.register
+def _seal_on_exit():
+    if _spool is not None and _spool_pid == os.getpid():
+        _spool.seal()
@@ -2,15 +2,76 @@ from __future__ import absolute_import, unicode_literals
 
 import base64
 import datetime
-import json
 import logging
 import socket
 import sys
+import zlib
 
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from celery import states
+from celery.result import EagerResult
 from celery.task import Task
+from celery.utils import uuid
 from six.moves import http_client, urllib
 
+from . import circuit, deadletter, fanout, metrics, serialization
+from .batching import encode_params, split
+from .circuit import OPEN, circuit_breaker
 from .conf import settings as mp_settings
+from .connection import get_pool, is_stale_connection_error
+from .dedupe import get_insert_id, recently_sent, with_insert_id
+from .encoding import Encoded, encode
+from .retry import (
+    RetryPolicy,
+    is_retryable_status,
+    is_verbose_success,
+    parse_failed_records,
+    parse_retry_after,
+    parse_verbose_error,
+)
+from .routing import BULK, NORMAL, queue_for
+from .sampling import admit
+from .spool import get_spool
+
+
+def _unpack(event_name, properties=None, test=None, **kwargs):
+    """
+    Splits the arguments of an ``EventTracker`` call the way ``run`` does.
+    """
+    return event_name, properties, test, kwargs
+
+
+def gzip_compress(data, level=None):
+    """
+    Returns ``data`` compressed in the gzip format, at
+    `:data:mixpanel.conf.settings.MIXPANEL_GZIP_LEVEL` unless ``level`` is
+    given.
+    """
+    if level is None:
+        level = mp_settings.MIXPANEL_GZIP_LEVEL
+    # A window size of 16 + 15 writes a gzip header and trailer.
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _without_token(mapping, token):
+    """
+    Returns ``mapping`` without its ``token`` key if that holds ``token``.
+    """
+    if mapping and mapping.get('token') == token:
+        mapping = dict(mapping)
+        del mapping['token']
+    return mapping
+
+
+def _unpack_batch(events, test=None, **kwargs):
+    """
+    Splits the arguments of a ``BatchEventTracker`` call the way ``run``
+    does.
+    """
+    return events, test, kwargs
 
 
 class EventTracker(Task):
@@ -21,10 +82,69 @@ class EventTracker(Task):
     max_retries = mp_settings.MIXPANEL_MAX_RETRIES
     endpoint = mp_settings.MIXPANEL_TRACKING_ENDPOINT
 
+    if mp_settings.MIXPANEL_AGGREGATE_EVENTS:
+        # Have the worker buffer our messages and send them in batches.
+        Strategy = 'mixpanel.aggregation:strategy'
+
+    if mp_settings.MIXPANEL_COMPACT_MESSAGES:
+        serializer = serialization.NAME
+
+    #: Decides which failures are retried, and after how long.
+    retry_policy = RetryPolicy()
+
+    #: Position of the ``properties`` argument to stamp with an
+    #: ``$insert_id``, or ``None`` for tasks that don't send events.
+    properties_index = 1
+
+    #: Lane of the messages whose events aren't in ``MIXPANEL_LANES``.
+    lane = NORMAL
+
+    #: Added to the body of batches to get a response that says why they
+    #: were refused, when ``MIXPANEL_VERBOSE_BATCHES`` is on.
+    verbose_param = 'verbose=1'
+
+    #: Whether the endpoint's verbose responses list the events it refused,
+    #: so that a batch can be partly recorded. ``/track`` only reports an
+    #: error for the whole batch.
+    lists_refused_events = False
+
     class FailedEventRequest(Exception):
         """
         The attempted recording event failed because of a non-200 HTTP return
         code.
+
+        ``status`` is the HTTP status code, if there was a response, and
+        ``retry_after`` the number of seconds Mixpanel asked us to wait.
+        """
+        retryable = True
+
+        def __init__(self, message, status=None, retry_after=None):
+            Exception.__init__(self, message)
+            self.status = status
+            self.retry_after = retry_after
+
+    class RejectedEventRequest(FailedEventRequest):
+        """
+        Mixpanel refused the request with a 4xx HTTP return code, so sending
+        it again won't help.
+        """
+        retryable = False
+
+    class PartiallyRejected(RejectedEventRequest):
+        """
+        Mixpanel refused some of the events of a batch as invalid and
+        recorded the rest. ``failed`` maps the index of each refused event
+        in the batch to Mixpanel's explanation.
+        """
+
+        def __init__(self, message, failed, **kwargs):
+            EventTracker.RejectedEventRequest.__init__(self, message, **kwargs)
+            self.failed = failed
+
+    class CircuitOpen(FailedEventRequest):
+        """
+        The request wasn't attempted because the circuit breaker is open
+        after too many recent failures.
         """
 
     def run(self, event_name, properties=None, test=None, **kwargs):
@@ -41,7 +161,12 @@ class EventTracker(Task):
         `:data:mixpanel.conf.settings.MIXPANEL_TEST_PRIORITY` setting for
         putting the events on a high-priority queue at Mixpanel for testing
         purposes.
+
+        If the event was built and encoded when it was queued, see
+        `:data:mixpanel.conf.settings.MIXPANEL_PRESERIALIZE`, ``encoded`` is
+        set and ``properties`` holds the encoded event.
         """
+        encoded = kwargs.pop('encoded', False)
         logger = self.get_logger(**kwargs)
         if mp_settings.MIXPANEL_DISABLE:
             logger.info(
@@ -50,21 +175,18 @@ class EventTracker(Task):
             return False
 
         logger.info("Recording event: <%s>" % event_name)
+        self._set_debuglevel(logger)
 
-        # Celery 3.x changed the way the logger could be accessed
-        if hasattr(logger, 'getEffectiveLevel'):
-            # celery 3.x
-            effective_level = logger.getEffectiveLevel()
+        if encoded:
+            params = Encoded(*properties)
         else:
-            # Fall back to celery 2.x support
-            effective_level = logger.logger.getEffectiveLevel()
-
-        if effective_level == logging.DEBUG:
-            http_client.HTTPConnection.debuglevel = 1
-
-        params = self._build_params(event_name, properties, **kwargs)
+            params = self._build_params(event_name, properties, **kwargs)
         logger.debug('params: <%r>' % (params,))
 
+        if get_insert_id(params) in recently_sent:
+            logger.info("Event already recorded: <%s>" % event_name)
+            return True
+
         url_params = self._encode_params(params, test)
         logger.debug('encoded: <%s>' % (url_params,))
 
@@ -74,26 +196,206 @@ class EventTracker(Task):
             result = self._send_request(conn, url_params)
         except self.FailedEventRequest as e:
             conn.close()
+            if not self.retry_policy.should_retry(e):
+                logger.info("Event rejected: <%s>" % event_name)
+                raise
+            if self._spool([params], e, test):
+                logger.info("Event spooled: <%s>" % event_name)
+                return False
             logger.info("Event failed. Retrying: <%s>" % event_name)
             self.retry(
                 exc=e,
-                countdown=mp_settings.MIXPANEL_RETRY_DELAY,
+                countdown=self._retry_countdown(e),
             )
             return
-        conn.close()
+        self._release_connection(conn)
         if result:
+            recently_sent.add([get_insert_id(params)])
             logger.info("Event recorded/logged: <%s>" % event_name)
         else:
             logger.info("Event ignored: <%s>" % event_name)
 
         return result
 
+    @classmethod
+    def apply_async(cls, args=None, kwargs=None, *a, **options):
+        """
+        Queues the task like ``Task.apply_async``, stamping the event with a
+        stable ``$insert_id`` first if
+        `:data:mixpanel.conf.settings.MIXPANEL_INSERT_ID` is on. Retries
+        then send the same id, so Mixpanel never counts an event twice.
+
+        With `:data:mixpanel.conf.settings.MIXPANEL_PRESERIALIZE` on, the
+        event is also built and encoded right away, so values that can't be
+        encoded fail here rather than in the worker. Otherwise, with
+        `:data:mixpanel.conf.settings.MIXPANEL_COMPACT_MESSAGES` on, the
+        default token is left out of the message.
+
+        Events are sampled and rate limited before anything else, see
+        :mod:`mixpanel.sampling`. If nothing is left to send, nothing is
+        queued and an ``EagerResult`` holding ``False``, the result of a
+        task that didn't record anything, is returned instead. Retries are
+        never dropped.
+
+        Unless a queue is given, the message goes to the queue of its lane,
+        see :mod:`mixpanel.routing`.
+        """
+        args, kwargs = list(args or ()), dict(kwargs or {})
+        if not kwargs.get('encoded'):
+            if not options.get('retries'):
+                admitted = cls._admit(args, kwargs)
+                if admitted is None:
+                    return EagerResult(options.get('task_id') or uuid(),
+                                       False, states.SUCCESS)
+                args, kwargs = admitted
+            if 'queue' not in options and 'routing_key' not in options:
+                queue = queue_for(cls._event_names(args, kwargs), cls.lane)
+                if queue is not None:
+                    options['queue'] = queue
+            if mp_settings.MIXPANEL_INSERT_ID:
+                args, kwargs = cls._stamp_insert_ids(args, kwargs)
+            if mp_settings.MIXPANEL_PRESERIALIZE:
+                args, kwargs = cls._preserialize(args, kwargs)
+            elif (mp_settings.MIXPANEL_COMPACT_MESSAGES and
+                    mp_settings.MIXPANEL_API_TOKEN):
+                args, kwargs = cls._strip_default_token(args, kwargs)
+        return super(EventTracker, cls).apply_async(args, kwargs, *a,
+                                                    **options)
+
+    @classmethod
+    def _event_names(cls, args, kwargs):
+        """
+        Returns the event names, or People operations, of a call.
+        """
+        return [args[0] if args else kwargs.get('event_name')]
+
+    @classmethod
+    def _admit(cls, args, kwargs):
+        """
+        Returns the ``args`` and ``kwargs`` of a call once its event has
+        been sampled and rate limited, or ``None`` if it was dropped.
+        """
+        index = cls.properties_index
+        if index is None:
+            return args, kwargs
+        event_name = args[0] if args else kwargs.get('event_name')
+        if len(args) > index:
+            properties = args[index]
+        else:
+            properties = kwargs.get('properties')
+        token = (properties or {}).get('token') or kwargs.get('token')
+        properties = admit(event_name, properties, token)
+        if properties is None:
+            return None
+        if len(args) > index:
+            args[index] = properties
+        else:
+            kwargs['properties'] = properties
+        return args, kwargs
+
+    @classmethod
+    def _stamp_insert_ids(cls, args, kwargs):
+        """
+        Returns the ``args`` and ``kwargs`` of a call with its event's
+        properties stamped with an ``$insert_id``.
+        """
+        index = cls.properties_index
+        if index is None:
+            return args, kwargs
+        if len(args) > index:
+            args[index] = with_insert_id(args[index])
+        else:
+            kwargs['properties'] = with_insert_id(kwargs.get('properties'))
+        return args, kwargs
+
+    @classmethod
+    def _strip_default_token(cls, args, kwargs):
+        """
+        Returns the ``args`` and ``kwargs`` of a call without the
+        ``MIXPANEL_API_TOKEN``, which ``run`` puts back.
+        """
+        token = mp_settings.MIXPANEL_API_TOKEN
+        if kwargs.get('token') == token:
+            del kwargs['token']
+        index = cls.properties_index
+        if index is None or 'token' in kwargs:
+            # An explicit token argument would replace the stripped one.
+            return args, kwargs
+        if len(args) > index:
+            args[index] = _without_token(args[index], token)
+        elif 'properties' in kwargs:
+            kwargs['properties'] = _without_token(kwargs['properties'],
+                                                  token)
+        return args, kwargs
+
+    @classmethod
+    def _preserialize(cls, args, kwargs):
+        """
+        Returns the ``args`` and ``kwargs`` of a call with its event built
+        and encoded, for ``run`` to send as it is.
+        """
+        task = cls.app.tasks[cls.name]
+        event_name, properties, test, kwargs = _unpack(*args, **kwargs)
+        params = task._build_params(event_name, properties, **kwargs)
+        encoded = Encoded.from_params(params, get_insert_id(params))
+        return [event_name, encoded.to_message()], _encoded_kwargs(test)
+
+    def _set_debuglevel(self, logger):
+        """
+        Turns on ``http_client`` debugging output when debug logging is on.
+        """
+        # Celery 3.x changed the way the logger could be accessed
+        if hasattr(logger, 'getEffectiveLevel'):
+            # celery 3.x
+            effective_level = logger.getEffectiveLevel()
+        else:
+            # Fall back to celery 2.x support
+            effective_level = logger.logger.getEffectiveLevel()
+
+        if effective_level == logging.DEBUG:
+            http_client.HTTPConnection.debuglevel = 1
+
+    def _retry_countdown(self, exc):
+        """
+        Returns the number of seconds to wait before retrying after ``exc``.
+        """
+        return self.retry_policy.countdown(
+            self.request.retries or 0, exc.retry_after,
+        )
+
+    def _spool(self, params, exc, test=None):
+        """
+        Writes the built ``params`` of events that failed with ``exc`` to
+        the spool, along with their ``test`` flag, instead of retrying, if
+        spooling is on and either the circuit breaker is open or the
+        retries have run out.
+
+        Returns ``True`` if the events were spooled.
+        """
+        spool = get_spool()
+        if spool is None:
+            return False
+        if not (isinstance(exc, self.CircuitOpen) or
+                (self.request.retries or 0) >= self.max_retries):
+            return False
+        spool.write(self.name, [
+            p.decode() if isinstance(p, Encoded) else p for p in params
+        ], test)
+        return True
+
     def _get_connection(self):
-        server = mp_settings.MIXPANEL_API_SERVER
+        """
+        Borrows a keep-alive connection to the api server from this process's
+        pool. Give it back with ``_release_connection``.
+        """
+        return get_pool().get()
 
-        # Wish we could use python 2.6's httplib timeout support
-        socket.setdefaulttimeout(mp_settings.MIXPANEL_API_TIMEOUT)
-        return http_client.HTTPConnection(server)
+    def _release_connection(self, connection):
+        """
+        Returns a connection whose last response was read completely to the
+        pool so later requests can reuse it.
+        """
+        get_pool().put(connection)
 
     def _build_params(self, event, properties, **kwargs):
         """
@@ -110,7 +412,7 @@ class EventTracker(Task):
         Encodes data and returns the urlencoded parameters.
         """
         key = mp_settings.MIXPANEL_DATA_VARIABLE
-        value = base64.b64encode(json.dumps(params).encode('utf8'))
+        value = base64.b64encode(encode(params))
         data = {key: value}
         if test is None:
             test = mp_settings.MIXPANEL_TEST_PRIORITY
@@ -118,44 +420,479 @@ class EventTracker(Task):
             data['test'] = '1'
         return urllib.parse.urlencode(data)
 
-    def _send_request(self, connection, params):
+    def _send_request(self, connection, params, method='GET'):
         """
         Send a an event with its properties to the api server.
 
+        ``method`` is ``GET`` to send ``params`` in the query string or
+        ``POST`` to send them as a form-encoded request body.
+
         Returns ``True`` if the event was logged by Mixpanel.
+
+        While the circuit breaker is open, this fails straight away with
+        ``CircuitOpen`` instead of waiting on a server that is down.
+        """
+        with self._circuit_guard():
+            return self._send(connection, params, method)
+
+    @contextmanager
+    def _circuit_guard(self):
+        """
+        Wraps sending a single request, by any transport, with the circuit
+        breaker: raises ``CircuitOpen`` if it won't let the request through
+        right now, and records how the request went otherwise.
         """
+        if not mp_settings.MIXPANEL_CIRCUIT_BREAKER:
+            yield
+            return
 
+        self._check_circuit()
+        started = circuit.now()
+        failed = True
         try:
-            connection.request('GET', '%s?%s' % (self.endpoint, params))
+            yield
+            failed = False
+        except self.FailedEventRequest as e:
+            # Mixpanel refusing a request still means it's up.
+            failed = e.retryable
+            raise
+        finally:
+            # Anything else counts as a failure, and must still end a
+            # half-open trial.
+            circuit_breaker.record(failed, circuit.now() - started)
+
+    def _check_circuit(self):
+        """
+        Raises ``CircuitOpen`` if the circuit breaker won't let a request
+        through right now.
+        """
+        if not circuit_breaker.allow_request():
+            raise self.CircuitOpen(
+                "The tracking request wasn't sent because the circuit "
+                "breaker is open.",
+                retry_after=circuit_breaker.retry_in(),
+            )
 
-            response = connection.getresponse()
-        except socket.error:
+    def _send(self, connection, params, method):
+        """
+        Does the work of ``_send_request``.
+        """
+        # A pooled connection's socket may have been closed by the server
+        # while it sat idle, which we only find out by using it.
+        reused = getattr(connection, 'sock', None) is not None
+        try:
+            try:
+                response = self._request(connection, params, method)
+            except (socket.error, http_client.HTTPException) as e:
+                if not (reused and is_stale_connection_error(e)):
+                    raise
+                connection.close()
+                response = self._request(connection, params, method)
+            # Reading the body can time out too.
+            return self._check_response(response)
+        except (socket.error, http_client.HTTPException):
             raise self.FailedEventRequest(
                 "The tracking request failed with a socket error. "
                 "Message: [%s]" % str(sys.exc_info()[1])
             )
 
+    def _check_response(self, response):
+        """
+        Returns ``True`` if ``response`` says the request was logged by
+        Mixpanel, and raises ``FailedEventRequest`` if it failed.
+        """
         if response.status != 200 or response.reason != 'OK':
-            raise self.FailedEventRequest(
+            failed = None
+            if response.status == 400 and self.lists_refused_events:
+                failed = parse_failed_records(response.read())
+            if failed:
+                raise self.PartiallyRejected(
+                    "Mixpanel refused %d events of the batch." % len(failed),
+                    failed,
+                    status=response.status,
+                )
+            if is_retryable_status(response.status):
+                exc_class = self.FailedEventRequest
+            else:
+                exc_class = self.RejectedEventRequest
+            raise exc_class(
                 "The tracking request failed. "
                 "Non-200 response code was: "
-                "[%s] reason: [%s]" % (response.status, response.reason)
+                "[%s] reason: [%s]" % (response.status, response.reason),
+                status=response.status,
+                retry_after=parse_retry_after(
+                    response.getheader('Retry-After')
+                ),
             )
 
         # Successful requests will generate a log
         response_data = response.read()
-        if response_data != b'1':
-            return False
+        if response_data == b'1':
+            return True
+        error = parse_verbose_error(response_data)
+        if error is not None:
+            raise self.RejectedEventRequest(
+                "Mixpanel refused the request: [%s]" % error,
+                status=response.status,
+            )
+        return is_verbose_success(response_data)
 
-        return True
+    def _send_batch(self, connection, params, test):
+        """
+        POSTs a list of already-built event ``params`` in a single request.
+
+        Returns ``True`` if the events were logged by Mixpanel.
+        """
+        body = self._encode_batch(params, test)
+        return self._send_request(connection, body, 'POST')
+
+    def _encode_batch(self, params, test):
+        """
+        Returns the request body for the batch ``params``.
+        """
+        body = self._encode_params(params, test)
+        if mp_settings.MIXPANEL_VERBOSE_BATCHES:
+            body = '%s&%s' % (body, self.verbose_param)
+        return body
+
+    def _send_batches(self, batches):
+        """
+        Sends each ``(params, test)`` batch and returns, in order, the result
+        of ``_send_batch`` for it or the ``FailedEventRequest`` it raised.
+
+        The batches are sent concurrently when
+        `:data:mixpanel.conf.settings.MIXPANEL_ASYNC_TRANSPORT` is on, or
+        from `:data:mixpanel.conf.settings.MIXPANEL_SEND_THREADS` threads.
+        Otherwise they're sent one after the other over a single connection,
+        and a failure, other than some events being refused, stops the
+        batches after it from being sent: they get the same failure.
+        """
+        if mp_settings.MIXPANEL_ASYNC_TRANSPORT:
+            from . import aio
+            return aio.send_batches(self, batches)
+        threads = mp_settings.MIXPANEL_SEND_THREADS
+        if threads > 1 and len(batches) > 1:
+            return fanout.send_batches(self, batches, threads)
+
+        outcomes = []
+        conn = self._get_connection()
+        failure = None
+        for params, test in batches:
+            if failure is not None:
+                outcomes.append(failure)
+                continue
+            try:
+                outcomes.append(self._send_batch(conn, params, test))
+            except self.PartiallyRejected as e:
+                outcomes.append(e)
+            except self.FailedEventRequest as e:
+                conn.close()
+                outcomes.append(e)
+                failure = e
+        if failure is None:
+            self._release_connection(conn)
+        return outcomes
+
+    def _dead_letter_refused(self, params, exc):
+        """
+        Hands the events of the batch ``params`` that Mixpanel refused, as
+        told by the ``PartiallyRejected`` ``exc``, to the dead-letter sink.
+
+        Returns the other events, which were recorded.
+        """
+        recorded = []
+        for index, event in enumerate(params):
+            if index in exc.failed:
+                deadletter.send(self.name, event, exc.failed[index])
+            else:
+                recorded.append(event)
+        return recorded
+
+    def _request(self, connection, params, method):
+        """
+        Makes the request to the api server and returns its response.
+        """
+        url, body, headers = self._prepare_request(params, method)
+        if method == 'POST':
+            connection.request('POST', url, body, headers)
+        else:
+            connection.request('GET', url, headers=headers)
+        return connection.getresponse()
+
+    def _prepare_request(self, params, method):
+        """
+        Returns the url, body and headers of the request sending the encoded
+        ``params`` with ``method``.
+        """
+        headers = self._request_headers()
+        if method == 'POST':
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+            threshold = mp_settings.MIXPANEL_GZIP_OVER
+            if threshold is not None and len(params) > threshold:
+                params = gzip_compress(params.encode('ascii'))
+                headers['Content-Encoding'] = 'gzip'
+            return self.endpoint, params, headers
+        return '%s?%s' % (self.endpoint, params), None, headers
+
+    def _request_headers(self):
+        """
+        Returns a dictionary of extra headers to send with each request.
+        """
+        return {}
 
 
 event_tracker = EventTracker()
 
 
+def _encoded_kwargs(test):
+    kwargs = {'encoded': True}
+    if test is not None:
+        kwargs['test'] = test
+    return kwargs
+
+
+class BatchEventTracker(EventTracker):
+    """
+    Task to track many Mixpanel events with as few requests as possible.
+    """
+    name = "mixpanel.tasks.BatchEventTracker"
+    max_retries = mp_settings.MIXPANEL_MAX_RETRIES
+
+    def run(self, events, test=None, **kwargs):
+        """
+        Track a list of event occurrences to mixpanel through the API.
+
+        ``events`` is a list of ``(event_name, properties)`` pairs, each
+        built just like the arguments to ``EventTracker``. They are POSTed in
+        chunks of at most `:data:mixpanel.conf.settings.MIXPANEL_BATCH_SIZE`
+        events and `:data:mixpanel.conf.settings.MIXPANEL_BATCH_MAX_BYTES`
+        bytes per request. Events too large to send on their own are dropped
+        and logged as errors, without failing the rest.
+        ``token`` and ``test`` behave as they do for ``EventTracker`` and
+        apply to every event in the list.
+
+        If chunks fail, the task is retried with only the events that
+        haven't been sent yet.
+
+        If the events were built and encoded when they were queued, see
+        `:data:mixpanel.conf.settings.MIXPANEL_PRESERIALIZE`, ``encoded`` is
+        set and ``events`` holds the encoded events.
+        """
+        encoded = kwargs.pop('encoded', False)
+        logger = self.get_logger(**kwargs)
+        events = list(events)
+        if mp_settings.MIXPANEL_DISABLE:
+            logger.info(
+                "Mixpanel disabled; not recording %d events" % len(events),
+            )
+            return False
+
+        logger.info("Recording %d events" % len(events))
+        self._set_debuglevel(logger)
+
+        result = True
+        prepared = []
+        for event in events:
+            try:
+                prepared.append(
+                    Encoded(*event) if encoded else
+                    encode_params(self._build_batch_params(event, **kwargs))
+                )
+            except Exception as e:
+                # One bad event mustn't cost the rest of the batch.
+                deadletter.send(self.name, list(event),
+                                "Invalid event: %s" % e)
+                prepared.append(None)
+                result = False
+        chunks = []
+        batches = split(
+            ((index, params) for index, params in enumerate(prepared)
+             if params is not None),
+            lambda item: item[1].size,
+        )
+        for batch, oversized in batches:
+            if oversized:
+                index, params = batch[0]
+                metrics.incr('mixpanel.events.oversized')
+                deadletter.send(self.name, params, "Event too large to "
+                                "send: %d bytes" % params.size)
+                result = False
+                continue
+            unsent = [(index, params) for index, params in batch
+                      if get_insert_id(params) not in recently_sent]
+            if unsent:
+                chunks.append(unsent)
+
+        outcomes = self._send_batches([
+            ([params for _, params in chunk], test) for chunk in chunks
+        ])
+        failed = []
+        failure = rejection = None
+        for chunk, outcome in zip(chunks, outcomes):
+            params = [p for _, p in chunk]
+            logger.debug('params: <%r>' % (params,))
+            if isinstance(outcome, self.PartiallyRejected):
+                logger.info("Mixpanel refused %d of %d events" %
+                            (len(outcome.failed), len(params)))
+                recently_sent.add(
+                    get_insert_id(p)
+                    for p in self._dead_letter_refused(params, outcome)
+                )
+                result = False
+            elif isinstance(outcome, self.FailedEventRequest):
+                if not self.retry_policy.should_retry(outcome):
+                    logger.info(
+                        "Batch rejected. Dropping %d events" % len(chunk),
+                    )
+                    for p in params:
+                        deadletter.send(self.name, p, str(outcome))
+                    rejection = outcome
+                else:
+                    failed.extend(index for index, _ in chunk)
+                    failure = outcome
+            else:
+                if outcome:
+                    recently_sent.add(get_insert_id(p) for p in params)
+                result = outcome and result
+
+        if failed:
+            remaining = [events[index] for index in failed]
+            if self._spool([prepared[index] for index in failed], failure,
+                           test):
+                logger.info("Spooled %d events" % len(remaining))
+                return False
+            logger.info("Batch failed. Retrying %d events" % len(remaining))
+            args = tuple(self.request.args or ())
+            self.retry(
+                args=(remaining,) + args[1:],
+                exc=failure,
+                countdown=self._retry_countdown(failure),
+            )
+            return
+        if rejection is not None:
+            raise rejection
+
+        if result:
+            logger.info("Events recorded/logged: %d" % len(events))
+        else:
+            logger.info("Some events ignored out of: %d" % len(events))
+
+        return result
+
+    def _build_batch_params(self, event, **kwargs):
+        """
+        Returns the params of one ``(event_name, properties)`` pair of a
+        batch.
+        """
+        event_name, properties = event
+        return self._build_params(event_name, properties, **kwargs)
+
+    @classmethod
+    def _preserialize(cls, args, kwargs):
+        task = cls.app.tasks[cls.name]
+        events, test, kwargs = _unpack_batch(*args, **kwargs)
+        encoded = []
+        for event in events:
+            params = task._build_batch_params(event, **kwargs)
+            encoded.append(
+                Encoded.from_params(params, get_insert_id(params))
+                .to_message()
+            )
+        return [encoded], _encoded_kwargs(test)
+
+    @classmethod
+    def _strip_default_token(cls, args, kwargs):
+        token = mp_settings.MIXPANEL_API_TOKEN
+        if kwargs.get('token') == token:
+            del kwargs['token']
+        if 'token' in kwargs:
+            return args, kwargs
+        if args:
+            args[0] = [cls._strip_event_token(event, token)
+                       for event in args[0]]
+        elif 'events' in kwargs:
+            kwargs['events'] = [cls._strip_event_token(event, token)
+                                for event in kwargs['events']]
+        return args, kwargs
+
+    @classmethod
+    def _strip_event_token(cls, event, token):
+        event_name, properties = event
+        return event_name, _without_token(properties, token)
+
+    @classmethod
+    def _event_names(cls, args, kwargs):
+        events = args[0] if args else kwargs.get('events', ())
+        return [event[0] for event in events]
+
+    @classmethod
+    def _admit(cls, args, kwargs):
+        events = args[0] if args else kwargs.get('events', ())
+        token = kwargs.get('token')
+        admitted = []
+        for event_name, properties in events:
+            event_token = (properties or {}).get('token') or token
+            properties = admit(event_name, properties, event_token)
+            if properties is not None:
+                admitted.append((event_name, properties))
+        if not admitted:
+            return None
+        if args:
+            args[0] = admitted
+        else:
+            kwargs['events'] = admitted
+        return args, kwargs
+
+    @classmethod
+    def _stamp_insert_ids(cls, args, kwargs):
+        if args:
+            args[0] = [(event_name, with_insert_id(properties))
+                       for event_name, properties in args[0]]
+        else:
+            kwargs['events'] = [
+                (event_name, with_insert_id(properties))
+                for event_name, properties in kwargs.get('events', ())
+            ]
+        return args, kwargs
+
+
+batch_event_tracker = BatchEventTracker()
+
+
+class EventImporter(BatchEventTracker):
+    """
+    Task to import historical events through Mixpanel's import endpoint.
+
+    Works like ``BatchEventTracker``, but accepts events of any age. Each
+    event needs a ``time`` property, and
+    `:data:mixpanel.conf.settings.MIXPANEL_API_SECRET` must be set.
+    """
+    name = "mixpanel.tasks.EventImporter"
+    endpoint = mp_settings.MIXPANEL_IMPORT_ENDPOINT
+    verbose_param = 'strict=1'
+    lists_refused_events = True
+    lane = BULK
+
+    @classmethod
+    def _admit(cls, args, kwargs):
+        # Sampling a backfill would silently lose history.
+        return args, kwargs
+
+    def _request_headers(self):
+        secret = mp_settings.MIXPANEL_API_SECRET
+        if not secret:
+            raise ValueError("MIXPANEL_API_SECRET is required for imports.")
+        credentials = base64.b64encode(('%s:' % secret).encode('utf8'))
+        return {'Authorization': 'Basic %s' % credentials.decode('ascii')}
+
+
+event_importer = EventImporter()
+
+
 class PeopleTracker(EventTracker):
     name = "mixpanel.tasks.PeopleTracker"
     endpoint = mp_settings.MIXPANEL_PEOPLE_ENDPOINT
+    properties_index = None
     event_map = {
         'add': '$add',
         'append': '$append',
@@ -192,6 +929,29 @@ class PeopleTracker(EventTracker):
             **kwargs
         )
 
+    def batch(self, updates, **options):
+        """
+        Queues a list of updates as a single ``PeopleBatchTracker`` task.
+
+        ``updates`` holds ``(event_name, properties, kwargs)`` tuples, each
+        built just like the arguments to ``PeopleTracker``. ``options`` are
+        passed on to ``apply_async``.
+
+        Updates that can't be built, for example without a ``distinct_id``,
+        are handed to the dead-letter sink instead of being queued.
+        """
+        valid = []
+        for update in updates:
+            event_name, properties, kwargs = update
+            try:
+                self._build_params(event_name, properties, **dict(kwargs))
+            except Exception as e:
+                deadletter.send(people_batch_tracker.name, list(update),
+                                "Invalid update: %s" % e)
+                continue
+            valid.append(update)
+        return people_batch_tracker.apply_async((valid,), **options)
+
     def _build_params(self, event, properties, **kwargs):
         """
         Returns the people profile event format.
@@ -258,16 +1018,65 @@ class PeopleTracker(EventTracker):
 people_tracker = PeopleTracker()
 
 
+class PeopleBatchTracker(BatchEventTracker, PeopleTracker):
+    """
+    Task to send many People updates with as few requests as possible.
+    """
+    name = "mixpanel.tasks.PeopleBatchTracker"
+    max_retries = mp_settings.MIXPANEL_MAX_RETRIES
+
+    def run(self, updates, test=None, **kwargs):
+        """
+        Send a list of People updates to mixpanel through the API.
+
+        ``updates`` is a list of ``(event_name, properties, kwargs)`` tuples,
+        each built just like the arguments to ``PeopleTracker``. They are
+        POSTed to the engage endpoint in chunks, and retried, just like the
+        events of a ``BatchEventTracker``. Keyword arguments given to the
+        task itself apply to every update, unless the update overrides them.
+        """
+        return super(PeopleBatchTracker, self).run(updates, test, **kwargs)
+
+    def _build_batch_params(self, update, **kwargs):
+        event_name, properties, update_kwargs = update
+        kwargs.update(update_kwargs)
+        return self._build_params(event_name, properties, **kwargs)
+
+    @classmethod
+    def _strip_event_token(cls, update, token):
+        event_name, properties, kwargs = update
+        return event_name, properties, _without_token(kwargs, token)
+
+    @classmethod
+    def _admit(cls, args, kwargs):
+        # People updates aren't events, and are never dropped.
+        return args, kwargs
+
+    @classmethod
+    def _stamp_insert_ids(cls, args, kwargs):
+        # People updates aren't events and have no $insert_id.
+        return args, kwargs
+
+
+people_batch_tracker = PeopleBatchTracker()
+
+
 class FunnelEventTracker(EventTracker):
     """
     Task to track a Mixpanel funnel event.
     """
     name = "mixpanel.tasks.FunnelEventTracker"
     max_retries = mp_settings.MIXPANEL_MAX_RETRIES
+    properties_index = 3
 
     class InvalidFunnelProperties(Exception):
         """Required properties were missing from the funnel-tracking call"""
 
+    @classmethod
+    def _admit(cls, args, kwargs):
+        # A dropped step would break the funnel.
+        return args, kwargs
+
     def run(self, funnel, step, goal, properties, **kwargs):
         """
         Track an event occurrence to mixpanel through the API.
@@ -307,5 +1116,120 @@ class FunnelEventTracker(EventTracker):
 
         return properties
 
+    @classmethod
+    def _preserialize(cls, args, kwargs):
+        # The funnel properties are only added by run.
+        return args, kwargs
+
 
 funnel_tracker = FunnelEventTracker()
+
+
+class SpoolDrainer(Task):
+    """
+    Task to replay the events in the spool once Mixpanel is reachable again.
+
+    Schedule it to run periodically, for example with celery beat, when
+    `:data:mixpanel.conf.settings.MIXPANEL_SPOOL_DIR` is set.
+    """
+    name = "mixpanel.tasks.SpoolDrainer"
+    ignore_result = True
+
+    def run(self, **kwargs):
+        """
+        Sends every spooled event in batches and returns how many were sent.
+
+        Draining stops at the first batch that failed in a way worth
+        retrying. Its events, and the rest of their segment, are spooled
+        again to be retried by a later run. Batches Mixpanel rejects are
+        handed to the dead-letter sink instead.
+        """
+        logger = self.get_logger(**kwargs)
+        spool = get_spool()
+        if spool is None or mp_settings.MIXPANEL_DISABLE:
+            return 0
+        if circuit_breaker.state == OPEN:
+            logger.info("Circuit breaker open; not draining the spool")
+            return 0
+
+        spool.seal()
+        paths = spool.claim()
+        sent = 0
+        for index, path in enumerate(paths):
+            try:
+                groups = OrderedDict()
+                for task_name, params, test in spool.read(path):
+                    groups.setdefault((task_name, test), []).append(params)
+                sent += self._replay(spool, groups)
+            except EventTracker.FailedEventRequest as e:
+                logger.info("Spool draining stopped: %s" % e)
+                spool.remove(path)
+                for remaining_path in paths[index + 1:]:
+                    spool.unclaim(remaining_path)
+                break
+            except Exception:
+                # Hand every unfinished segment back for a later run.
+                for remaining_path in paths[index:]:
+                    spool.unclaim(remaining_path)
+                raise
+            spool.remove(path)
+
+        logger.info("Replayed %d spooled events" % sent)
+        return sent
+
+    def _replay(self, spool, groups):
+        """
+        Sends the spooled ``groups`` of event params, keyed by the name of
+        the task that spooled them and their ``test`` flag. If batches fail
+        in a way worth retrying, they and every group after them are spooled
+        again before the failure is re-raised.
+        """
+        logger = self.get_logger()
+        sent = 0
+        pending = list(groups.items())
+        for group_index, ((task_name, test), params) in enumerate(pending):
+            tracker = self.app.tasks[task_name]
+            chunks = []
+            prepared = enumerate(encode_params(p) for p in params)
+            batches = split(prepared, lambda item: item[1].size)
+            for batch, oversized in batches:
+                if oversized:
+                    index, event = batch[0]
+                    metrics.incr('mixpanel.events.oversized')
+                    deadletter.send(task_name, event, "Event too large to "
+                                    "send: %d bytes" % event.size)
+                    continue
+                chunks.append(batch)
+
+            outcomes = tracker._send_batches([
+                ([event for _, event in chunk], test) for chunk in chunks
+            ])
+            failure = None
+            for chunk, outcome in zip(chunks, outcomes):
+                events = [event for _, event in chunk]
+                if isinstance(outcome, EventTracker.PartiallyRejected):
+                    logger.info("Mixpanel refused %d spooled events" %
+                                len(outcome.failed))
+                    sent += len(tracker._dead_letter_refused(events, outcome))
+                elif isinstance(outcome, EventTracker.FailedEventRequest):
+                    if not tracker.retry_policy.should_retry(outcome):
+                        logger.info("Mixpanel rejected %d spooled events" %
+                                    len(events))
+                        for i, _ in chunk:
+                            deadletter.send(task_name, params[i],
+                                            str(outcome))
+                        continue
+                    spool.write(task_name, [params[i] for i, _ in chunk],
+                                test)
+                    failure = outcome
+                else:
+                    sent += len(events)
+            if failure is not None:
+                for (later_name, later_test), later_params in (
+                        pending[group_index + 1:]):
+                    spool.write(later_name, later_params, later_test)
+                raise failure
+        return sent
+
+
+spool_drainer = SpoolDrainer()
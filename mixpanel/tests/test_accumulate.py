@@ -0,0 +1,135 @@
+from __future__ import absolute_import, unicode_literals
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import patch
+
+from mixpanel.accumulate import AddAccumulator, MemoryStore, SQLiteStore
+from mixpanel.tasks import PeopleTracker
+
+
+class StoreTestMixin(object):
+
+    def test_sums(self):
+        self.store.add(None, 'x', {'views': 1, 'clicks': 2})
+        self.assertEqual(self.store.add(None, 'x', {'views': 3}), 2)
+        self.store.add('t', 'x', {'views': 1})
+        self.assertEqual(sorted(self.store.take(), key=repr), sorted([
+            (None, 'x', 'views', 4),
+            (None, 'x', 'clicks', 2),
+            ('t', 'x', 'views', 1),
+        ], key=repr))
+
+    def test_take_empties(self):
+        self.store.add(None, 'x', {'views': 1})
+        self.store.take()
+        self.assertEqual(self.store.take(), [])
+
+    def test_types_kept(self):
+        self.store.add('', 123, {'views': 1})
+        self.store.add(None, None, {'views': 2})
+        self.store.add('', 123, {'views': 1})
+        self.assertEqual(sorted(self.store.take(), key=repr), sorted([
+            ('', 123, 'views', 2),
+            (None, None, 'views', 2),
+        ], key=repr))
+
+    def test_floats(self):
+        self.store.add(None, 'x', {'spent': 1.5})
+        self.store.add(None, 'x', {'spent': 2})
+        self.assertEqual(self.store.take(), [(None, 'x', 'spent', 3.5)])
+
+
+class MemoryStoreTest(StoreTestMixin, unittest.TestCase):
+
+    def setUp(self):
+        self.store = MemoryStore()
+
+
+class SQLiteStoreTest(StoreTestMixin, unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'add.db')
+        self.store = SQLiteStore(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_shared(self):
+        self.store.add(None, 'x', {'views': 1})
+        other = SQLiteStore(self.path)
+        other.add(None, 'x', {'views': 2})
+        self.assertEqual(other.take(), [(None, 'x', 'views', 3)])
+        self.assertEqual(self.store.take(), [])
+
+    def test_integers_stay_integers(self):
+        self.store.add(None, 'x', {'views': 1})
+        self.store.add(None, 'x', {'views': 1})
+        total = self.store.take()[0][3]
+        self.assertEqual(total, 2)
+        self.assertIsInstance(total, int)
+
+
+@patch.object(PeopleTracker, 'batch')
+class AddAccumulatorTest(unittest.TestCase):
+
+    def test_flush_queues_one_update_per_profile(self, batch):
+        accumulator = AddAccumulator(interval=60, max_keys=100,
+                                     store=MemoryStore())
+        accumulator.add({'views': 1}, 'x')
+        accumulator.add({'views': 1, 'clicks': 1}, 'x')
+        accumulator.add({'views': 1}, 'y', token='t')
+        self.assertFalse(batch.called)
+
+        accumulator.flush()
+        self.assertEqual(batch.call_count, 1)
+        updates, = batch.call_args[0]
+        self.assertEqual(sorted(updates, key=repr), sorted([
+            ('add', {'views': 2, 'clicks': 1}, {'distinct_id': 'x'}),
+            ('add', {'views': 1}, {'distinct_id': 'y', 'token': 't'}),
+        ], key=repr))
+        self.assertIsNone(accumulator._timer)
+
+    def test_flush_empty(self, batch):
+        AddAccumulator(store=MemoryStore()).flush()
+        self.assertFalse(batch.called)
+
+    def test_flushes_exactly_once(self, batch):
+        accumulator = AddAccumulator(interval=60, store=MemoryStore())
+        accumulator.add({'views': 1}, 'x')
+        accumulator.flush()
+        accumulator.flush()
+        self.assertEqual(batch.call_count, 1)
+
+    def test_failed_flush_keeps_sums(self, batch):
+        accumulator = AddAccumulator(interval=60, store=MemoryStore())
+        accumulator.add({'views': 1}, 'x')
+        batch.side_effect = RuntimeError('broker down')
+        accumulator.flush()
+        self.assertIsNotNone(accumulator._timer)
+
+        batch.side_effect = None
+        accumulator.add({'views': 2}, 'x')
+        accumulator.flush()
+        self.assertEqual(batch.call_args[0][0], [
+            ('add', {'views': 3}, {'distinct_id': 'x'}),
+        ])
+
+    def test_max_keys(self, batch):
+        accumulator = AddAccumulator(interval=60, max_keys=2,
+                                     store=MemoryStore())
+        accumulator.add({'views': 1}, 'x')
+        self.assertFalse(batch.called)
+        accumulator.add({'views': 1}, 'y')
+        self.assertEqual(batch.call_count, 1)
+        self.assertEqual(len(batch.call_args[0][0]), 2)
+
+    def test_interval(self, batch):
+        accumulator = AddAccumulator(interval=0.05, store=MemoryStore())
+        accumulator.add({'views': 1}, 'x')
+        accumulator._timer.join(1)
+        self.assertEqual(batch.call_count, 1)
@@ -0,0 +1,164 @@
+from __future__ import absolute_import, unicode_literals
+
+from mock import patch
+
+from mixpanel.aggregation import (
+    AggregatedRequest,
+    EventAggregator,
+    event_aggregator,
+)
+from mixpanel.conf import settings as mp_settings
+from mixpanel.tasks import EventTracker
+from mixpanel.tests.test_tasks import TasksTestCase
+
+
+def make_request(*args, **kwargs):
+    retries = kwargs.pop('retries', 0)
+    request = AggregatedRequest('id-%s' % args[0], EventTracker.name, args,
+                                kwargs, None, 'localhost')
+    request.retries = retries
+    return request
+
+
+class EventAggregatorTest(TasksTestCase):
+
+    def test_registered(self):
+        self.assertIsInstance(event_aggregator, EventAggregator)
+
+    def test_run_groups_by_token(self):
+        result = EventAggregator().run([
+            make_request('event_a', {'foo': 'bar'}),
+            make_request('event_b', token='xxx'),
+            make_request('event_c'),
+        ])
+        self.assertTrue(result)
+        self.assertEqual(len(self.conn.request_call_args), 2)
+        self.assertBatchParams([
+            {'event': 'event_a',
+             'properties': {'token': 'testtesttest', 'foo': 'bar'}},
+            {'event': 'event_c', 'properties': {'token': 'testtesttest'}},
+        ])
+        self.assertBatchParams([
+            {'event': 'event_b', 'properties': {'token': 'xxx'}},
+        ], index=1)
+
+    def test_run_groups_by_test(self):
+        EventAggregator().run([
+            make_request('event_a', test=True),
+            make_request('event_b', None, False),
+        ])
+        self.assertEqual(self.get_body_dict(0)['test'], '1')
+        self.assertNotIn('test', self.get_body_dict(1))
+
+    def test_run_skips_sent_events(self):
+        EventAggregator().run([make_request('event_a', {'$insert_id': 'a'})])
+        EventAggregator().run([
+            make_request('event_a', {'$insert_id': 'a'}),
+            make_request('event_b', {'$insert_id': 'b'}),
+        ])
+        self.assertEqual(len(self.conn.request_call_args), 2)
+        self.assertBatchParams([
+            {'event': 'event_b',
+             'properties': {'token': 'testtesttest', '$insert_id': 'b'}},
+        ], index=1)
+
+    def test_run_encoded_events(self):
+        EventAggregator().run([
+            make_request('event_a', [
+                '{"event":"event_a","properties":{"token":"xxx"}}', None,
+            ], encoded=True),
+            make_request('event_b'),
+        ])
+        self.assertEqual(len(self.conn.request_call_args), 2)
+        self.assertBatchParams([
+            {'event': 'event_a', 'properties': {'token': 'xxx'}},
+        ], index=0)
+
+    def test_malformed_message_dropped(self):
+        result = EventAggregator().run([
+            make_request('event_a'),
+            make_request('event_b', {'foo': object()}),
+            make_request('event_c', None, None, 'unexpected'),
+            make_request('event_d'),
+        ])
+        self.assertTrue(result)
+        self.assertEqual(len(self.conn.request_call_args), 1)
+        self.assertBatchParams([
+            {'event': 'event_a', 'properties': {'token': 'testtesttest'}},
+            {'event': 'event_d', 'properties': {'token': 'testtesttest'}},
+        ])
+
+    def test_send_error_not_requeued(self):
+        with patch('mixpanel.tasks.BatchEventTracker._send_batches',
+                   side_effect=RuntimeError('boom')):
+            result = EventAggregator().run([make_request('event_a')])
+        self.assertFalse(result)
+
+    @patch.object(EventTracker, 'apply_async',
+                  side_effect=[RuntimeError('broker down'), None])
+    def test_retry_error_isolated(self, apply_async):
+        self.response.status = 503
+        EventAggregator().run([
+            make_request('event_a'),
+            make_request('event_b'),
+        ])
+        self.assertEqual(apply_async.call_count, 2)
+
+    @patch.object(EventTracker, 'apply_async')
+    def test_failed_batch_retries_each_event(self, apply_async):
+        self.response.status = 503
+        EventAggregator().run([
+            make_request('event_a', {'foo': 'bar'}),
+            make_request('event_b', retries=2),
+        ])
+        self.assertEqual(apply_async.call_count, 2)
+        kwargs = apply_async.call_args_list[1][1]
+        self.assertEqual(kwargs['args'], ('event_b',))
+        self.assertEqual(kwargs['task_id'], 'id-event_b')
+        self.assertEqual(kwargs['retries'], 3)
+
+    @patch('mixpanel.aggregation.deadletter.send')
+    @patch.object(EventTracker, 'apply_async')
+    def test_failed_batch_gives_up_after_max_retries(self, apply_async,
+                                                     send):
+        self.response.status = 503
+        EventAggregator().run([
+            make_request('event_a', retries=mp_settings.MIXPANEL_MAX_RETRIES),
+        ])
+        self.assertFalse(apply_async.called)
+        self.assertEqual(send.call_count, 1)
+        self.assertEqual(send.call_args[0][0], EventTracker.name)
+        self.assertEqual(send.call_args[0][1].decode()['event'], 'event_a')
+
+    @patch('mixpanel.aggregation.deadletter.send')
+    @patch.object(EventTracker, 'apply_async')
+    def test_refused_batch_dead_lettered(self, apply_async, send):
+        self.response.status = 400
+        EventAggregator().run([make_request('event_a')])
+        self.assertFalse(apply_async.called)
+        self.assertEqual(send.call_count, 1)
+        self.assertEqual(send.call_args[0][1].decode()['event'], 'event_a')
+
+    def test_apply_buffer_acknowledges_or_requeues(self):
+        class Pool(object):
+            def apply_async(self, fun, args, callback):
+                self.callback = callback
+
+        class Request(object):
+            acked = requeued = False
+
+            def acknowledge(self):
+                self.acked = True
+
+            def reject(self, requeue=False):
+                self.requeued = requeue
+
+        aggregator = EventAggregator()
+        aggregator._pool = Pool()
+        done, crashed = Request(), Request()
+        aggregator.apply_buffer([done])
+        aggregator._pool.callback(True)
+        aggregator.apply_buffer([crashed])
+        aggregator._pool.callback(None)
+        self.assertTrue(done.acked)
+        self.assertTrue(crashed.requeued)
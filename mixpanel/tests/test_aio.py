@@ -0,0 +1,204 @@
+from __future__ import absolute_import, unicode_literals
+
+import base64
+import json
+import threading
+import unittest
+
+import six
+from six.moves import urllib
+from mock import patch
+
+from mixpanel.circuit import circuit_breaker
+from mixpanel.concurrency import ConcurrencyLimiter
+from mixpanel.conf import settings as mp_settings
+from mixpanel.dedupe import recently_sent
+from mixpanel.tasks import BatchEventTracker, EventTracker, batch_event_tracker
+
+if not six.PY2:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+    from mixpanel import aio
+
+    class Server(ThreadingMixIn, HTTPServer):
+        daemon_threads = True
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            length = int(self.headers['Content-Length'])
+            body = self.rfile.read(length).decode('ascii')
+            server = self.server
+            with server.lock:
+                server.requests.append((self.path, body))
+                server.connections.add(self.client_address)
+            status, data = server.respond(body)
+            self.send_response(status)
+            if server.chunked:
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                for piece in (data[:1], data[1:]):
+                    if piece:
+                        self.wfile.write(b'%x\r\n%s\r\n' % (len(piece), piece))
+                self.wfile.write(b'0\r\n\r\n')
+            else:
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+
+@unittest.skipIf(six.PY2, "asyncio isn't available on python 2")
+class AsyncTransportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.server.lock = threading.Lock()
+        self.server.requests = []
+        self.server.connections = set()
+        self.server.chunked = False
+        self.server.respond = lambda body: (200, b'1')
+        thread = threading.Thread(target=self.server.serve_forever,
+                                  args=(0.01,))
+        thread.daemon = True
+        thread.start()
+
+        self.old_server = mp_settings.MIXPANEL_API_SERVER
+        mp_settings.MIXPANEL_API_SERVER = '127.0.0.1:%d' % (
+            self.server.server_address[1],
+        )
+        mp_settings.MIXPANEL_API_TOKEN = 'testtesttest'
+        mp_settings.MIXPANEL_TRACKING_ENDPOINT = '/track/'
+        circuit_breaker.reset()
+        recently_sent.clear()
+
+    def tearDown(self):
+        mp_settings.MIXPANEL_API_SERVER = self.old_server
+        self.server.shutdown()
+        self.server.server_close()
+
+    def sent_events(self):
+        events = []
+        for path, body in self.server.requests:
+            data = dict(urllib.parse.parse_qsl(body))['data']
+            events.extend(json.loads(base64.b64decode(data).decode('utf8')))
+        return sorted(event['event'] for event in events)
+
+    def batches(self, count):
+        return [
+            ([{'event': 'event_%d' % n, 'properties': {}}], None)
+            for n in range(count)
+        ]
+
+    def test_send_batches(self):
+        outcomes = aio.send_batches(batch_event_tracker, self.batches(5))
+        self.assertEqual(outcomes, [True] * 5)
+        self.assertEqual(self.server.requests[0][0], '/track/')
+        self.assertEqual(self.sent_events(),
+                         ['event_%d' % n for n in range(5)])
+
+    def test_concurrency_limits_connections(self):
+        with patch.object(mp_settings, 'MIXPANEL_ASYNC_CONCURRENCY', 2):
+            aio.send_batches(batch_event_tracker, self.batches(6))
+        self.assertEqual(len(self.server.requests), 6)
+        self.assertLessEqual(len(self.server.connections), 2)
+
+    def test_connections_reused_between_calls(self):
+        with patch.object(mp_settings, 'MIXPANEL_ASYNC_CONCURRENCY', 1):
+            aio.send_batches(batch_event_tracker, self.batches(2))
+            aio.send_batches(batch_event_tracker, self.batches(2))
+        self.assertEqual(len(self.server.requests), 4)
+        self.assertEqual(len(self.server.connections), 1)
+
+    def test_called_from_running_loop(self):
+        import asyncio
+
+        # No ``async def``: this module must still compile on Python 2.
+        loop = asyncio.new_event_loop()
+        result = loop.create_future()
+
+        def track():
+            try:
+                result.set_result(
+                    aio.send_batches(batch_event_tracker, self.batches(2)),
+                )
+            except Exception as e:
+                result.set_exception(e)
+
+        loop.call_soon(track)
+        try:
+            self.assertEqual(loop.run_until_complete(result), [True, True])
+        finally:
+            loop.close()
+
+    def test_new_loop_after_fork(self):
+        loop = aio.get_loop()
+        self.assertIs(aio.get_loop(), loop)
+        with patch('mixpanel.aio.os.getpid', return_value=-1):
+            self.assertIsNot(aio.get_loop(), loop)
+
+    def test_adaptive_limit(self):
+        self.server.respond = lambda body: (503, b'0')
+        with patch.object(mp_settings, 'MIXPANEL_ADAPTIVE_CONCURRENCY',
+                          True), \
+                patch('mixpanel.concurrency.concurrency_limiter',
+                      ConcurrencyLimiter(minimum=1)):
+            aio.send_batches(batch_event_tracker, self.batches(4))
+        # One request at a time, all over the same connection.
+        self.assertEqual(len(self.server.requests), 4)
+        self.assertEqual(len(self.server.connections), 1)
+
+    def test_chunked_response(self):
+        self.server.chunked = True
+        self.server.respond = lambda body: (200, b'{"status": 1}')
+        outcomes = aio.send_batches(batch_event_tracker, self.batches(2))
+        self.assertEqual(outcomes, [True, True])
+
+    def test_failures_returned(self):
+        def respond(body):
+            if 'test=1' in body:
+                return 503, b'0'
+            return 200, b'1'
+        self.server.respond = respond
+        batches = self.batches(2)
+        batches[1] = (batches[1][0], True)
+        outcomes = aio.send_batches(batch_event_tracker, batches)
+        self.assertTrue(outcomes[0])
+        self.assertIsInstance(outcomes[1], EventTracker.FailedEventRequest)
+        self.assertEqual(outcomes[1].status, 503)
+
+    def test_connection_refused(self):
+        self.server.shutdown()
+        self.server.server_close()
+        outcomes = aio.send_batches(batch_event_tracker, self.batches(1))
+        self.assertIsInstance(outcomes[0], EventTracker.FailedEventRequest)
+
+    def test_batch_tracker_uses_transport(self):
+        with patch.object(mp_settings, 'MIXPANEL_ASYNC_TRANSPORT', True), \
+                patch.object(mp_settings, 'MIXPANEL_BATCH_SIZE', 2):
+            result = BatchEventTracker().run([
+                ('event_%d' % n, {}) for n in range(5)
+            ])
+        self.assertTrue(result)
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(self.sent_events(),
+                         ['event_%d' % n for n in range(5)])
+
+    def test_batch_tracker_retries_failed_chunks(self):
+        def respond(body):
+            data = dict(urllib.parse.parse_qsl(body))['data']
+            events = json.loads(base64.b64decode(data).decode('utf8'))
+            if events[0]['event'] == 'event_2':
+                return 503, b'0'
+            return 200, b'1'
+        self.server.respond = respond
+        events = [('event_%d' % n, {}) for n in range(5)]
+        with patch.object(mp_settings, 'MIXPANEL_ASYNC_TRANSPORT', True), \
+                patch.object(mp_settings, 'MIXPANEL_BATCH_SIZE', 2), \
+                patch.object(BatchEventTracker, 'retry') as retry:
+            BatchEventTracker().run(events)
+        self.assertEqual(retry.call_args[1]['args'][0], events[2:4])
@@ -0,0 +1,65 @@
+from __future__ import absolute_import, unicode_literals
+
+import unittest
+
+from mixpanel.batching import encode_params, split
+from mixpanel.encoding import Encoded
+
+
+class SplitTest(unittest.TestCase):
+
+    def split(self, sizes, max_events=100, max_bytes=100):
+        return [
+            (batch, oversized) for batch, oversized
+            in split(sizes, lambda size: size, max_events, max_bytes)
+        ]
+
+    def test_max_events(self):
+        self.assertEqual(self.split([1] * 5, max_events=2), [
+            ([1, 1], False), ([1, 1], False), ([1], False),
+        ])
+
+    def test_max_bytes(self):
+        # Brackets and commas count: [30,30,30] takes 94 bytes.
+        self.assertEqual(self.split([30, 30, 30, 30]), [
+            ([30, 30, 30], False), ([30], False),
+        ])
+        self.assertEqual(self.split([49, 48]), [([49, 48], False)])
+        self.assertEqual(self.split([49, 49]), [
+            ([49], False), ([49], False),
+        ])
+
+    def test_greedy(self):
+        self.assertEqual(self.split([60, 20, 50, 10]), [
+            ([60, 20], False), ([50, 10], False),
+        ])
+
+    def test_oversized(self):
+        self.assertEqual(self.split([10, 99, 10, 98, 10]), [
+            ([10], False), ([99], True), ([10], False), ([98], False),
+            ([10], False),
+        ])
+
+    def test_empty(self):
+        self.assertEqual(self.split([]), [])
+
+    def test_lazy(self):
+        batches = split(iter([1, 1, 1]), lambda size: size, 1, 100)
+        self.assertEqual(next(batches), ([1], False))
+
+
+class EncodeParamsTest(unittest.TestCase):
+
+    def test_encodes(self):
+        encoded = encode_params({
+            'event': 'foo', 'properties': {'$insert_id': 'abc'},
+        })
+        self.assertEqual(encoded.insert_id, 'abc')
+        self.assertEqual(encoded.size, len(encoded.text))
+
+    def test_encoded_passthrough(self):
+        encoded = Encoded('{}', None)
+        self.assertIs(encode_params(encoded), encoded)
+
+    def test_size_in_bytes(self):
+        self.assertEqual(Encoded('"é"', None).size, 4)
@@ -0,0 +1,71 @@
+from __future__ import absolute_import, unicode_literals
+
+import datetime
+import decimal
+import unittest
+import uuid
+
+from mock import patch
+
+from mixpanel import encoding
+from mixpanel.buffer import EventBuffer
+from mixpanel.tasks import BatchEventTracker
+
+
+@patch.object(BatchEventTracker, 'delay')
+class EventBufferTest(unittest.TestCase):
+
+    def test_flush_queues_one_task(self, delay):
+        buf = EventBuffer(max_events=10, max_bytes=10000, max_age=60)
+        buf.track('event_a', {'foo': 'bar'})
+        buf.track('event_b', token='xxx')
+        self.assertFalse(delay.called)
+        self.assertEqual(len(buf), 2)
+
+        buf.flush()
+        delay.assert_called_once_with([
+            ('event_a', {'foo': 'bar'}),
+            ('event_b', {'token': 'xxx'}),
+        ])
+        self.assertEqual(len(buf), 0)
+        self.assertIsNone(buf._timer)
+
+    def test_flush_empty(self, delay):
+        buf = EventBuffer()
+        self.assertIsNone(buf.flush())
+        self.assertFalse(delay.called)
+
+    def test_max_events(self, delay):
+        buf = EventBuffer(max_events=2, max_bytes=10000, max_age=60)
+        buf.track('event_a')
+        buf.track('event_b')
+        self.assertEqual(delay.call_count, 1)
+        self.assertEqual(len(buf), 0)
+
+    def test_max_bytes(self, delay):
+        buf = EventBuffer(max_events=10, max_bytes=50, max_age=60)
+        buf.track('event_a', {'foo': 'bar'})
+        self.assertFalse(delay.called)
+        buf.track('event_b', {'foo': 'x' * 50})
+        self.assertEqual(delay.call_count, 1)
+
+    def test_size_in_encoded_bytes(self, delay):
+        buf = EventBuffer(max_events=10, max_bytes=10000, max_age=60)
+        properties = {
+            'time': datetime.datetime(2020, 1, 1),
+            'price': decimal.Decimal('1.5'),
+            'id': uuid.UUID(int=0),
+            'name': '\u00e9\u00e9\u00e9',
+        }
+        buf.track('event_a', properties)
+        self.assertEqual(
+            buf._bytes, len(encoding.dumps(['event_a', properties])),
+        )
+        buf.flush()
+
+    def test_max_age(self, delay):
+        buf = EventBuffer(max_events=10, max_bytes=10000, max_age=0.05)
+        buf.track('event_a')
+        timer = buf._timer
+        timer.join(1)
+        self.assertEqual(delay.call_count, 1)
@@ -0,0 +1,69 @@
+from __future__ import absolute_import, unicode_literals
+
+import unittest
+
+from mock import patch
+
+from mixpanel import metrics
+from mixpanel.circuit import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def setUp(self):
+        super(CircuitBreakerTest, self).setUp()
+        metrics.reset()
+        self.breaker = CircuitBreaker(window=10, min_calls=4, error_rate=0.5,
+                                      slow_call=2, reset_timeout=30)
+
+    def test_stays_closed_below_error_rate(self):
+        for failed in (True, False, False, False, True, False):
+            self.breaker.record(failed)
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertTrue(self.breaker.allow_request())
+
+    def test_opens_at_error_rate(self):
+        for failed in (True, False, True, False):
+            self.breaker.record(failed)
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertFalse(self.breaker.allow_request())
+        self.assertEqual(metrics.snapshot()['mixpanel.circuit.state'], 2)
+        self.assertEqual(metrics.snapshot()['mixpanel.circuit.rejected'], 1)
+
+    def test_needs_min_calls(self):
+        for i in range(3):
+            self.breaker.record(True)
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_slow_calls_count_as_failures(self):
+        for i in range(4):
+            self.breaker.record(False, latency=5)
+        self.assertEqual(self.breaker.state, OPEN)
+
+    def test_half_open_allows_one_trial(self):
+        with patch('mixpanel.circuit._now', return_value=100):
+            self.breaker._open()
+            self.assertEqual(self.breaker.retry_in(), 30)
+        with patch('mixpanel.circuit._now', return_value=130):
+            self.assertEqual(self.breaker.state, HALF_OPEN)
+            self.assertTrue(self.breaker.allow_request())
+            self.assertFalse(self.breaker.allow_request())
+            self.breaker.record(False)
+            self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_failed_trial_reopens(self):
+        with patch('mixpanel.circuit._now', return_value=100):
+            self.breaker._open()
+        with patch('mixpanel.circuit._now', return_value=130):
+            self.assertTrue(self.breaker.allow_request())
+            self.breaker.record(True)
+            self.assertEqual(self.breaker.state, OPEN)
+            self.assertEqual(self.breaker.retry_in(), 30)
+
+    def test_metrics_backend(self):
+        reported = []
+        with patch('mixpanel.metrics.mp_settings.MIXPANEL_METRICS_BACKEND',
+                   lambda *args: reported.append(args)):
+            self.breaker._open()
+        self.assertIn(('gauge', 'mixpanel.circuit.state', 2), reported)
+        self.assertIn(('counter', 'mixpanel.circuit.opened', 1), reported)
@@ -0,0 +1,131 @@
+from __future__ import absolute_import, unicode_literals
+
+import unittest
+
+from mock import patch
+
+from mixpanel.coalesce import PeopleCoalescer
+from mixpanel.tasks import PeopleTracker
+
+
+def queued(batch):
+    return [update for args, kwargs in batch.call_args_list
+            for update in args[0]]
+
+
+@patch.object(PeopleTracker, 'batch')
+class PeopleCoalescerTest(unittest.TestCase):
+
+    def setUp(self):
+        super(PeopleCoalescerTest, self).setUp()
+        self.coalescer = PeopleCoalescer(window=60)
+
+    def tearDown(self):
+        if self.coalescer._timer is not None:
+            self.coalescer._timer.cancel()
+        super(PeopleCoalescerTest, self).tearDown()
+
+    def test_set_last_write_wins(self, batch):
+        self.coalescer.people('set', {'a': 1, 'b': 1}, distinct_id='x')
+        self.coalescer.people('set', {'a': 2}, distinct_id='x')
+        self.assertFalse(batch.called)
+        self.coalescer.flush()
+        batch.assert_called_once_with([
+            ('set', {'a': 2, 'b': 1}, {'distinct_id': 'x'}),
+        ])
+
+    def test_set_once_first_write_wins(self, batch):
+        self.coalescer.people('set_once', {'a': 1}, distinct_id='x')
+        self.coalescer.people('set_once', {'a': 2, 'b': 2},
+                              distinct_id='x')
+        self.coalescer.flush()
+        self.assertEqual(queued(batch), [
+            ('set_once', {'a': 1, 'b': 2}, {'distinct_id': 'x'}),
+        ])
+
+    def test_unset_and_union_collected(self, batch):
+        self.coalescer.people('unset', ['a'], distinct_id='x')
+        self.coalescer.people('unset', ['b', 'a'], distinct_id='x')
+        self.coalescer.people('union', {'l': [1, 2]}, distinct_id='x')
+        self.coalescer.people('union', {'l': [2, 3], 'm': [1]},
+                              distinct_id='x')
+        self.coalescer.flush()
+        self.assertEqual(queued(batch), [
+            ('unset', ['a', 'b'], {'distinct_id': 'x'}),
+            ('union', {'l': [1, 2, 3], 'm': [1]}, {'distinct_id': 'x'}),
+        ])
+
+    def test_keyed_by_token_and_distinct_id(self, batch):
+        self.coalescer.people('set', {'a': 1}, distinct_id='x')
+        self.coalescer.people('set', {'a': 2}, distinct_id='y')
+        self.coalescer.people('set', {'distinct_id': 'x', 'b': 1},
+                              token='t')
+        self.coalescer.flush()
+        self.assertEqual(queued(batch), [
+            ('set', {'a': 1}, {'distinct_id': 'x'}),
+            ('set', {'a': 2}, {'distinct_id': 'y'}),
+            ('set', {'b': 1}, {'distinct_id': 'x', 'token': 't'}),
+        ])
+
+    def test_latest_kwargs_kept(self, batch):
+        self.coalescer.people('set', {'a': 1}, distinct_id='x', ip='1')
+        self.coalescer.people('set', {'b': 1}, distinct_id='x', ip='2')
+        self.coalescer.flush()
+        self.assertEqual(queued(batch), [
+            ('set', {'a': 1, 'b': 1}, {'distinct_id': 'x', 'ip': '2'}),
+        ])
+
+    def test_other_operations_keep_order(self, batch):
+        self.coalescer.people('set', {'a': 1}, distinct_id='x')
+        self.coalescer.people('add', {'n': 1}, distinct_id='x')
+        batch.assert_called_once_with([
+            ('set', {'a': 1}, {'distinct_id': 'x'}),
+            ('add', {'n': 1}, {'distinct_id': 'x'}),
+        ])
+        self.assertEqual(len(self.coalescer), 0)
+
+    def test_conflicting_unset_flushes_profile(self, batch):
+        self.coalescer.people('set', {'a': 1}, distinct_id='x')
+        self.coalescer.people('unset', ['a'], distinct_id='x')
+        batch.assert_called_once_with([
+            ('set', {'a': 1}, {'distinct_id': 'x'}),
+        ])
+        self.coalescer.people('set', {'a': 2}, distinct_id='x')
+        self.coalescer.flush()
+        self.assertEqual(queued(batch)[1:], [
+            ('unset', ['a'], {'distinct_id': 'x'}),
+            ('set', {'a': 2}, {'distinct_id': 'x'}),
+        ])
+
+    def test_conflicting_set_and_union_flush_profile(self, batch):
+        self.coalescer.people('union', {'tags': ['a']}, distinct_id='x')
+        self.coalescer.people('set', {'tags': ['b']}, distinct_id='x')
+        self.coalescer.people('union', {'tags': ['c']}, distinct_id='x')
+        self.coalescer.flush()
+        self.assertEqual(queued(batch), [
+            ('union', {'tags': ['a']}, {'distinct_id': 'x'}),
+            ('set', {'tags': ['b']}, {'distinct_id': 'x'}),
+            ('union', {'tags': ['c']}, {'distinct_id': 'x'}),
+        ])
+
+    def test_caller_properties_not_modified(self, batch):
+        properties = {'a': 1}
+        self.coalescer.people('set', properties, distinct_id='x')
+        self.coalescer.people('set', {'a': 2}, distinct_id='x')
+        self.assertEqual(properties, {'a': 1})
+
+    def test_flush_empty(self, batch):
+        self.coalescer.flush()
+        self.assertFalse(batch.called)
+
+    def test_window(self, batch):
+        coalescer = PeopleCoalescer(window=0.05)
+        coalescer.people('set', {'a': 1}, distinct_id='x')
+        coalescer._timer.join(1)
+        self.assertEqual(batch.call_count, 1)
+
+    def test_no_window(self, batch):
+        coalescer = PeopleCoalescer(window=0)
+        coalescer.people('set', {'a': 1}, distinct_id='x')
+        self.assertIsNone(coalescer._timer)
+        self.assertEqual(len(coalescer), 1)
@@ -0,0 +1,90 @@
+from __future__ import absolute_import, unicode_literals
+
+import unittest
+
+from mock import patch
+
+from mixpanel import metrics
+from mixpanel.concurrency import ConcurrencyLimiter, get_limit
+from mixpanel.conf import settings as mp_settings
+
+
+class ConcurrencyLimiterTest(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+        self.time = 100.0
+        patcher = patch('mixpanel.concurrency._now', lambda: self.time)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.limiter = ConcurrencyLimiter(minimum=2, backoff=0.5,
+                                          latency_factor=3)
+
+    def succeed(self, count, latency=0.1, in_flight=None):
+        for i in range(count):
+            started = self.time
+            self.time += latency
+            self.limiter.record(started, False,
+                                in_flight or self.limiter.limit)
+
+    def test_starts_at_minimum(self):
+        self.assertEqual(self.limiter.limit, 2)
+        self.assertEqual(metrics.snapshot()['mixpanel.concurrency.limit'], 2)
+
+    def test_additive_increase(self):
+        # About one more request per round of requests.
+        self.succeed(3)
+        self.assertEqual(self.limiter.limit, 3)
+        self.succeed(3)
+        self.assertEqual(self.limiter.limit, 4)
+        self.assertEqual(metrics.snapshot()['mixpanel.concurrency.limit'], 4)
+
+    def test_no_increase_while_underused(self):
+        self.succeed(10, in_flight=1)
+        self.assertEqual(self.limiter.limit, 2)
+
+    def test_multiplicative_decrease(self):
+        self.succeed(20)
+        limit = self.limiter.limit
+        started = self.time
+        self.time += 0.1
+        self.limiter.record(started, True, limit)
+        self.assertEqual(self.limiter.limit, limit // 2)
+        self.assertEqual(
+            metrics.snapshot()['mixpanel.concurrency.backoff'], 1,
+        )
+
+    def test_one_decrease_per_round(self):
+        self.succeed(20)
+        limit = self.limiter.limit
+        started = self.time
+        self.time += 0.1
+        for i in range(3):
+            self.limiter.record(started, True, limit)
+        self.assertEqual(self.limiter.limit, limit // 2)
+
+    def test_never_below_minimum(self):
+        for i in range(5):
+            started = self.time
+            self.time += 0.1
+            self.limiter.record(started, True, 2)
+        self.assertEqual(self.limiter.limit, 2)
+
+    def test_latency_spike(self):
+        self.succeed(20)
+        limit = self.limiter.limit
+        started = self.time
+        self.time += 1
+        self.limiter.record(started, False, limit)
+        self.assertEqual(self.limiter.limit, limit // 2)
+
+    def test_get_limit(self):
+        with patch.object(mp_settings, 'MIXPANEL_ADAPTIVE_CONCURRENCY',
+                          False):
+            self.assertEqual(get_limit(20), 20)
+        with patch.object(mp_settings, 'MIXPANEL_ADAPTIVE_CONCURRENCY',
+                          True), \
+                patch('mixpanel.concurrency.concurrency_limiter',
+                      self.limiter):
+            self.assertEqual(get_limit(20), 2)
+            self.assertEqual(get_limit(1), 1)
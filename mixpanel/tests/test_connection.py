@@ -0,0 +1,161 @@
+from __future__ import absolute_import, unicode_literals
+
+import socket
+import unittest
+
+from mock import patch
+
+from mixpanel import connection
+from mixpanel.connection import (
+    ConnectionPool,
+    HTTPConnection,
+    clear_pools,
+    get_pool,
+)
+
+
+class FakeConnection(object):
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        super(ConnectionPoolTest, self).setUp()
+        self.pool = ConnectionPool('api.mixpanel.com', 2, 30)
+        self.pool._new_connection = FakeConnection
+
+    def test_reuses_released_connection(self):
+        conn = self.pool.get()
+        self.pool.put(conn)
+        self.assertIs(self.pool.get(), conn)
+        self.assertFalse(conn.closed)
+
+    def test_new_connection_when_empty(self):
+        conn = self.pool.get()
+        self.assertIsNot(self.pool.get(), conn)
+
+    def test_closes_connections_over_size(self):
+        conns = [self.pool.get() for i in range(3)]
+        for conn in conns:
+            self.pool.put(conn)
+        self.assertEqual([c.closed for c in conns], [False, False, True])
+
+    def test_idle_expiry(self):
+        conn = self.pool.get()
+        with patch('mixpanel.connection.time.time', return_value=0):
+            self.pool.put(conn)
+        with patch('mixpanel.connection.time.time', return_value=31):
+            self.assertIsNot(self.pool.get(), conn)
+        self.assertTrue(conn.closed)
+
+    def test_clear(self):
+        conn = self.pool.get()
+        self.pool.put(conn)
+        self.pool.clear()
+        self.assertTrue(conn.closed)
+        self.assertIsNot(self.pool.get(), conn)
+
+
+class GetPoolTest(unittest.TestCase):
+
+    def tearDown(self):
+        clear_pools()
+        super(GetPoolTest, self).tearDown()
+
+    def test_one_pool_per_host(self):
+        self.assertIs(get_pool('a.example.com'), get_pool('a.example.com'))
+        self.assertIsNot(get_pool('a.example.com'),
+                         get_pool('b.example.com'))
+
+    def test_new_pool_after_fork(self):
+        pool = get_pool('a.example.com')
+        with patch.object(connection.os, 'getpid', return_value=-1):
+            self.assertIsNot(get_pool('a.example.com'), pool)
+
+
+class HTTPConnectionTest(unittest.TestCase):
+
+    def setUp(self):
+        super(HTTPConnectionTest, self).setUp()
+        self.server = socket.socket()
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(1)
+        self.host = '127.0.0.1:%d' % self.server.getsockname()[1]
+
+    def tearDown(self):
+        self.server.close()
+        super(HTTPConnectionTest, self).tearDown()
+
+    def test_read_timeout_only_on_own_socket(self):
+        conn = HTTPConnection(self.host, connect_timeout=1, read_timeout=2)
+        conn.connect()
+        try:
+            self.assertEqual(conn.sock.gettimeout(), 2)
+            self.assertEqual(socket.getdefaulttimeout(), None)
+        finally:
+            conn.close()
+
+    def test_deadline_shortens_read_timeout(self):
+        conn = HTTPConnection(self.host, connect_timeout=1, read_timeout=5,
+                              deadline=2)
+        with patch('mixpanel.connection._now', return_value=100):
+            conn.request('GET', '/')
+            self.assertEqual(conn.sock.gettimeout(), 2)
+        with patch('mixpanel.connection._now', return_value=101.5):
+            conn._apply_read_timeout()
+            self.assertEqual(conn.sock.gettimeout(), 0.5)
+        conn.close()
+
+    def test_deadline_exceeded(self):
+        conn = HTTPConnection(self.host, connect_timeout=1, read_timeout=5,
+                              deadline=2)
+        with patch('mixpanel.connection._now', return_value=100):
+            conn.request('GET', '/')
+        with patch('mixpanel.connection._now', return_value=102):
+            self.assertRaises(socket.timeout, conn.getresponse)
+        conn.close()
+
+    def test_deadline_covers_body(self):
+        conn = HTTPConnection(self.host, connect_timeout=1, read_timeout=5,
+                              deadline=2)
+        with patch('mixpanel.connection._now', return_value=100):
+            conn.request('GET', '/')
+            client, address = self.server.accept()
+            client.recv(1024)
+            client.sendall(b'HTTP/1.1 200 OK\r\nContent-Length: 10\r\n'
+                           b'\r\nabc')
+            response = conn.getresponse()
+        try:
+            with patch('mixpanel.connection._now', return_value=101.5):
+                self.assertEqual(response.read(3), b'abc')
+            with patch('mixpanel.connection._now', return_value=102):
+                self.assertRaises(socket.timeout, response.read)
+        finally:
+            client.close()
+            conn.close()
+
+    def test_deadline_checked_between_recvs(self):
+        conn = HTTPConnection(self.host, connect_timeout=1, read_timeout=5,
+                              deadline=2)
+        with patch('mixpanel.connection._now', return_value=100):
+            conn.request('GET', '/')
+            client, address = self.server.accept()
+            client.recv(1024)
+            client.sendall(b'HTTP/1.1 200 OK\r\nContent-Length: 10\r\n'
+                           b'\r\nabc')
+            response = conn.getresponse()
+        client.sendall(b'd')
+        try:
+            # The one read needs two recvs, and the deadline passes between
+            # them.
+            with patch('mixpanel.connection._now', side_effect=[101, 102]):
+                with self.assertRaises(socket.timeout) as cm:
+                    response.read()
+            self.assertIn('deadline', str(cm.exception))
+        finally:
+            client.close()
+            conn.close()
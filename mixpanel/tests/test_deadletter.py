@@ -0,0 +1,45 @@
+from __future__ import absolute_import, unicode_literals
+
+import unittest
+
+from mock import Mock, patch
+
+from mixpanel import deadletter, metrics
+from mixpanel.encoding import Encoded
+
+
+class SendTest(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+
+    def test_sink(self):
+        sink = Mock()
+        with patch('mixpanel.deadletter.mp_settings.MIXPANEL_DEAD_LETTER',
+                   sink):
+            deadletter.send('task', {'event': 'foo'}, 'invalid')
+        sink.assert_called_once_with('task', {'event': 'foo'}, 'invalid')
+        self.assertEqual(
+            metrics.snapshot()['mixpanel.events.dead_lettered'], 1,
+        )
+
+    def test_dotted_path(self):
+        with patch('mixpanel.deadletter.mp_settings.MIXPANEL_DEAD_LETTER',
+                   'mixpanel.tests.test_deadletter.sink'):
+            deadletter.send('task', {'event': 'foo'}, 'invalid')
+        sink.assert_called_once_with('task', {'event': 'foo'}, 'invalid')
+
+    def test_decodes_encoded(self):
+        sink = Mock()
+        with patch('mixpanel.deadletter.mp_settings.MIXPANEL_DEAD_LETTER',
+                   sink):
+            deadletter.send('task', Encoded('{"event":"foo"}', None), 'x')
+        sink.assert_called_once_with('task', {'event': 'foo'}, 'x')
+
+    def test_no_sink(self):
+        with patch('mixpanel.deadletter.logger') as logger:
+            deadletter.send('task', {'event': 'foo'}, 'invalid')
+        self.assertTrue(logger.error.called)
+
+
+sink = Mock()
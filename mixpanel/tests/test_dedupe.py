@@ -0,0 +1,76 @@
+from __future__ import absolute_import, unicode_literals
+
+import unittest
+
+from mock import patch
+
+from mixpanel.dedupe import DedupeCache, get_insert_id, with_insert_id
+
+
+class WithInsertIdTest(unittest.TestCase):
+
+    def test_stamps_copy(self):
+        properties = {'foo': 'bar'}
+        stamped = with_insert_id(properties)
+        self.assertEqual(len(stamped['$insert_id']), 32)
+        self.assertEqual(properties, {'foo': 'bar'})
+
+    def test_keeps_existing(self):
+        self.assertEqual(with_insert_id({'$insert_id': 'abc'}),
+                         {'$insert_id': 'abc'})
+
+    def test_none(self):
+        self.assertIn('$insert_id', with_insert_id(None))
+
+    def test_unique(self):
+        self.assertNotEqual(with_insert_id({})['$insert_id'],
+                            with_insert_id({})['$insert_id'])
+
+    def test_get_insert_id(self):
+        self.assertEqual(
+            get_insert_id({'properties': {'$insert_id': 'abc'}}), 'abc',
+        )
+        self.assertIsNone(get_insert_id({'properties': {}}))
+        self.assertIsNone(get_insert_id({}))
+
+
+class DedupeCacheTest(unittest.TestCase):
+
+    def test_add(self):
+        cache = DedupeCache(size=10, ttl=60)
+        self.assertNotIn('abc', cache)
+        cache.add(['abc'])
+        self.assertIn('abc', cache)
+
+    def test_none_ignored(self):
+        cache = DedupeCache(size=10, ttl=60)
+        cache.add([None])
+        self.assertEqual(len(cache), 0)
+        self.assertNotIn(None, cache)
+
+    def test_evicts_oldest(self):
+        cache = DedupeCache(size=2, ttl=60)
+        cache.add(['a', 'b'])
+        cache.add(['a'])
+        cache.add(['c'])
+        self.assertEqual(len(cache), 2)
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertIn('c', cache)
+
+    @patch('mixpanel.dedupe.time.time')
+    def test_expires(self, time):
+        time.return_value = 1000
+        cache = DedupeCache(size=10, ttl=60)
+        cache.add(['abc'])
+        time.return_value = 1059
+        self.assertIn('abc', cache)
+        time.return_value = 1060
+        self.assertNotIn('abc', cache)
+        self.assertEqual(len(cache), 0)
+
+    def test_clear(self):
+        cache = DedupeCache(size=10, ttl=60)
+        cache.add(['abc'])
+        cache.clear()
+        self.assertNotIn('abc', cache)
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+import json
+import unittest
+from datetime import date, datetime
+from decimal import Decimal
+from uuid import UUID
+
+from mixpanel import encoding
+from mixpanel.conf import settings as mp_settings
+from mixpanel.encoding import Encoded, EventEncoder, encode, load_backend
+
+
+def decode(data):
+    return json.loads(data.decode('utf8'))
+
+
+class BackendTest(unittest.TestCase):
+
+    def test_selected(self):
+        self.assertIn(encoding.backend, encoding.BACKENDS)
+
+    def test_stdlib_compact(self):
+        dumps = load_backend('json')
+        self.assertEqual(dumps({'a': [1, 2]}), b'{"a":[1,2]}')
+
+    def test_unicode(self):
+        data = {'name': 'é☃'}
+        self.assertEqual(decode(load_backend('json')(data)), data)
+        self.assertEqual(decode(encoding.dumps(data)), data)
+
+    def test_missing(self):
+        self.assertRaises(ImportError, load_backend, 'not_a_json_library')
+
+
+class EventEncoderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.encoder = EventEncoder({'app': 'web', 'version': 2})
+
+    def test_no_super_properties(self):
+        params = {'event': 'foo', 'properties': {'token': 'x'}}
+        self.assertEqual(EventEncoder().encode(params),
+                         encoding.dumps(params))
+
+    def test_super_properties_spliced(self):
+        encoded = self.encoder.encode(
+            {'event': 'foo', 'properties': {'token': 'x', 'a': 1}},
+        )
+        self.assertEqual(decode(encoded), {
+            'event': 'foo',
+            'properties': {'token': 'x', 'a': 1, 'app': 'web', 'version': 2},
+        })
+
+    def test_empty_properties(self):
+        encoded = self.encoder.encode({'event': 'foo', 'properties': {}})
+        self.assertEqual(decode(encoded), {
+            'event': 'foo', 'properties': {'app': 'web', 'version': 2},
+        })
+
+    def test_event_overrides_super_properties(self):
+        encoded = self.encoder.encode(
+            {'event': 'foo', 'properties': {'app': 'ios'}},
+        )
+        self.assertEqual(decode(encoded), {
+            'event': 'foo', 'properties': {'app': 'ios', 'version': 2},
+        })
+
+    def test_list(self):
+        encoded = self.encoder.encode([
+            {'event': 'foo', 'properties': {}},
+            {'event': 'bar', 'properties': {'b': 1}},
+        ])
+        self.assertEqual(decode(encoded), [
+            {'event': 'foo', 'properties': {'app': 'web', 'version': 2}},
+            {'event': 'bar',
+             'properties': {'b': 1, 'app': 'web', 'version': 2}},
+        ])
+
+    def test_people_updates_untouched(self):
+        params = {'$distinct_id': 'x', '$set': {'a': 1}}
+        self.assertEqual(decode(self.encoder.encode(params)), params)
+
+    def test_params_not_modified(self):
+        params = {'event': 'foo', 'properties': {'app': 'ios'}}
+        self.encoder.encode(params)
+        self.assertEqual(params, {'event': 'foo',
+                                  'properties': {'app': 'ios'}})
+
+
+class EncodeTest(unittest.TestCase):
+
+    def tearDown(self):
+        mp_settings.MIXPANEL_SUPER_PROPERTIES = {}
+
+    def test_uses_settings(self):
+        params = {'event': 'foo', 'properties': {}}
+        self.assertEqual(decode(encode(params)), params)
+        mp_settings.MIXPANEL_SUPER_PROPERTIES = {'app': 'web'}
+        self.assertEqual(decode(encode(params)), {
+            'event': 'foo', 'properties': {'app': 'web'},
+        })
+
+
+class DefaultTest(unittest.TestCase):
+
+    def test_types(self):
+        data = {
+            'datetime': datetime(2017, 5, 1, 12, 30),
+            'date': date(2017, 5, 1),
+            'decimal': Decimal('11.77'),
+            'uuid': UUID('12345678123456781234567812345678'),
+        }
+        self.assertEqual(decode(encoding.dumps(data)), {
+            'datetime': '2017-05-01T12:30:00',
+            'date': '2017-05-01',
+            'decimal': 11.77,
+            'uuid': '12345678-1234-5678-1234-567812345678',
+        })
+
+    def test_unknown_type(self):
+        self.assertRaises(TypeError, encoding.dumps, {'a': object()})
+
+
+class EncodedTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        params = {'event': 'foo', 'properties': {'a': 1}}
+        encoded = Encoded.from_params(params, 'abc')
+        self.assertEqual(encoded.insert_id, 'abc')
+        self.assertEqual(Encoded(*encoded.to_message()).decode(), params)
+
+    def test_encode(self):
+        encoded = Encoded('{"event":"foo"}')
+        self.assertEqual(encode(encoded), b'{"event":"foo"}')
+        self.assertEqual(encode([encoded, encoded]),
+                         b'[{"event":"foo"},{"event":"foo"}]')
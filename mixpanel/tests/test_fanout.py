@@ -0,0 +1,97 @@
+from __future__ import absolute_import, unicode_literals
+
+import threading
+import time
+
+from mock import Mock, patch
+
+from mixpanel import fanout
+from mixpanel.concurrency import ConcurrencyLimiter
+from mixpanel.conf import settings as mp_settings
+from mixpanel.tasks import BatchEventTracker, EventTracker
+from mixpanel.tests.test_tasks import TasksTestCase
+
+
+class SendBatchesTest(TasksTestCase):
+
+    def fake_send_batch(self, conn, params, test):
+        with self.lock:
+            self.threads.add(threading.current_thread().ident)
+        if params == ['fail']:
+            raise EventTracker.FailedEventRequest("failed", status=503)
+        if params == ['refused']:
+            raise EventTracker.PartiallyRejected("refused", {0: 'invalid'})
+        if params == ['crash']:
+            raise ValueError("crash")
+        return params != ['ignored']
+
+    def send(self, batches, threads=3):
+        self.lock = threading.Lock()
+        self.threads = set()
+        with patch.object(BatchEventTracker, '_send_batch',
+                          self.fake_send_batch):
+            return fanout.send_batches(
+                BatchEventTracker(), [(params, None) for params in batches],
+                threads,
+            )
+
+    def test_ordered_outcomes(self):
+        outcomes = self.send([['a'], ['fail'], ['ignored'], ['refused']])
+        self.assertTrue(outcomes[0])
+        self.assertIsInstance(outcomes[1], EventTracker.FailedEventRequest)
+        self.assertFalse(outcomes[2])
+        self.assertIsInstance(outcomes[3], EventTracker.PartiallyRejected)
+
+    def test_bounded_threads(self):
+        self.send([['a']] * 20, threads=2)
+        self.assertLessEqual(len(self.threads), 2)
+
+    def test_adaptive_limit(self):
+        in_flight = [0, 0]
+
+        def send_batch(task, conn, params, test):
+            with self.lock:
+                in_flight[0] += 1
+                in_flight[1] = max(in_flight)
+            time.sleep(0.001)
+            with self.lock:
+                in_flight[0] -= 1
+            # Overloaded, so the limit stays at its minimum.
+            raise EventTracker.FailedEventRequest("failed", status=503)
+
+        self.fake_send_batch = send_batch
+        with patch.object(mp_settings, 'MIXPANEL_ADAPTIVE_CONCURRENCY',
+                          True), \
+                patch('mixpanel.concurrency.concurrency_limiter',
+                      ConcurrencyLimiter(minimum=1)):
+            self.send([['a']] * 10, threads=4)
+        self.assertEqual(in_flight[1], 1)
+
+    def test_unexpected_error_raised(self):
+        with self.assertRaises(ValueError):
+            self.send([['a'], ['crash'], ['b']])
+
+    def test_unexpected_error_closes_connection(self):
+        conn = Mock()
+        with patch.object(BatchEventTracker, '_get_connection',
+                          return_value=conn), \
+                patch.object(BatchEventTracker,
+                             '_release_connection') as release:
+            with self.assertRaises(ValueError):
+                self.send([['a'], ['crash']], threads=1)
+        self.assertTrue(conn.close.called)
+        self.assertFalse(release.called)
+
+    def test_batch_tracker_fans_out(self):
+        with patch.object(mp_settings, 'MIXPANEL_SEND_THREADS', 3), \
+                patch.object(mp_settings, 'MIXPANEL_BATCH_SIZE', 2):
+            result = BatchEventTracker().run([
+                ('event_%d' % n, {}) for n in range(5)
+            ])
+        self.assertTrue(result)
+        events = sorted(
+            event['event']
+            for index in range(3)
+            for event in self.get_batch_params(index)
+        )
+        self.assertEqual(events, ['event_%d' % n for n in range(5)])
@@ -0,0 +1,155 @@
+from __future__ import absolute_import, unicode_literals
+
+import base64
+import gzip
+import json
+import os
+import shutil
+import tempfile
+
+from django.core.management import CommandError, call_command
+from mock import patch
+from six import StringIO
+
+from mixpanel.conf import settings as mp_settings
+from mixpanel.importer import Checkpoint, ImportFailed, Importer
+from mixpanel.spool import encode_record
+from mixpanel.tests.test_tasks import TasksTestCase
+
+
+class ImporterTest(TasksTestCase):
+
+    def setUp(self):
+        super(ImporterTest, self).setUp()
+        mp_settings.MIXPANEL_API_SECRET = 'secret'
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        mp_settings.MIXPANEL_API_SECRET = None
+        super(ImporterTest, self).tearDown()
+
+    def write_events(self, name, count, opener=open):
+        path = os.path.join(self.directory, name)
+        with opener(path, 'wb') as f:
+            for n in range(count):
+                f.write(json.dumps({
+                    'event': 'event_%d' % n,
+                    'properties': {'time': n},
+                }).encode('utf8') + b'\n')
+        return path
+
+    def imported_events(self):
+        events = []
+        for index in range(len(self.conn.request_call_args)):
+            parsed = self.get_body_dict(index)
+            events.extend(json.loads(
+                base64.b64decode(parsed['data']).decode('utf8')
+            ))
+        return sorted(e['properties']['time'] for e in events)
+
+    def test_import(self):
+        path = self.write_events('events.jsonl', 7)
+        sent = Importer(workers=2, batch_size=3).run([path])
+        self.assertEqual(sent, 7)
+        self.assertEqual(len(self.conn.request_call_args), 3)
+        self.assertEqual(self.conn.request_call_args[0][1], '/import/')
+        self.assertEqual(self.conn.request_call_args[0][3]['Authorization'],
+                         'Basic c2VjcmV0Og==')
+        self.assertEqual(self.imported_events(), list(range(7)))
+
+    def test_import_gzip(self):
+        path = self.write_events('events.jsonl.gz', 4, opener=gzip.open)
+        self.assertEqual(Importer(workers=2).run([path]), 4)
+        self.assertEqual(self.imported_events(), list(range(4)))
+
+    def test_import_spool(self):
+        path = os.path.join(self.directory, 'segment.seg')
+        with open(path, 'wb') as f:
+            f.write(encode_record('mixpanel.tasks.EventTracker', {
+                'event': 'event_a', 'properties': {'time': 1},
+            }))
+            f.write(encode_record('mixpanel.tasks.PeopleTracker', {
+                '$distinct_id': 'x', '$set': {},
+            }))
+        with patch('mixpanel.importer.logger') as logger:
+            self.assertEqual(Importer(spool=True).run([path]), 1)
+        self.assertEqual(logger.warning.call_count, 1)
+
+    def test_invalid_lines_skipped(self):
+        path = self.write_events('events.jsonl', 2)
+        with open(path, 'ab') as f:
+            f.write(b'{"event": \n')
+            f.write(b'{"properties": {"time": 5}}\n')
+            f.write(b'["event_x"]\n')
+            f.write(json.dumps({
+                'event': 'event_7', 'properties': {'time': 7},
+            }).encode('utf8') + b'\n')
+        checkpoint_path = os.path.join(self.directory, 'checkpoint.json')
+        with patch('mixpanel.importer.logger') as logger:
+            sent = Importer(checkpoint=checkpoint_path).run([path])
+        self.assertEqual(sent, 3)
+        self.assertEqual(logger.warning.call_count, 3)
+        self.assertEqual(self.imported_events(), [0, 1, 7])
+        self.assertEqual(Checkpoint(checkpoint_path).get(path), 6)
+
+    def test_checkpoint_resume(self):
+        path = self.write_events('events.jsonl', 5)
+        checkpoint_path = os.path.join(self.directory, 'checkpoint.json')
+        Checkpoint(checkpoint_path).set(path, 3)
+
+        sent = Importer(batch_size=2, checkpoint=checkpoint_path).run([path])
+        self.assertEqual(sent, 2)
+        self.assertEqual(self.imported_events(), [3, 4])
+        self.assertEqual(Checkpoint(checkpoint_path).get(path), 5)
+
+    def test_failure(self):
+        path = self.write_events('events.jsonl', 5)
+        self.response.status = 400
+        with self.assertRaises(ImportFailed):
+            Importer(workers=1, batch_size=2).run([path])
+
+    def test_unexpected_error(self):
+        path = self.write_events('events.jsonl', 20)
+        importer = Importer(workers=1, batch_size=1)
+        with patch.object(importer, '_send',
+                          side_effect=RuntimeError('boom')):
+            with self.assertRaises(ImportFailed):
+                importer.run([path])
+
+    def test_secret_required(self):
+        mp_settings.MIXPANEL_API_SECRET = None
+        with self.assertRaises(ValueError):
+            Importer()
+
+    def test_refused_events_dead_lettered(self):
+        path = self.write_events('events.jsonl', 3)
+        self.response.status = 400
+        self.response.reason = 'Bad Request'
+        self.response.read = lambda *args, **kwargs: (
+            b'{"code": 400, "num_records_imported": 2, "failed_records":'
+            b' [{"index": 0, "field": "properties.time",'
+            b' "message": "invalid"}]}'
+        )
+        with patch('mixpanel.tasks.deadletter.send') as send:
+            sent = Importer(workers=1).run([path])
+        self.assertEqual(sent, 2)
+        self.assertEqual(send.call_count, 1)
+
+    def test_command(self):
+        path = self.write_events('events.jsonl', 3)
+        out = StringIO()
+        call_command('mixpanel_import', path, workers=1, stdout=out)
+        self.assertIn('Imported 3 events', out.getvalue())
+
+    def test_command_without_secret(self):
+        path = self.write_events('events.jsonl', 3)
+        mp_settings.MIXPANEL_API_SECRET = None
+        with self.assertRaises(CommandError):
+            call_command('mixpanel_import', path, stdout=StringIO())
+
+    def test_command_failure(self):
+        path = self.write_events('events.jsonl', 3)
+        self.response.status = 400
+        with self.assertRaises(CommandError):
+            call_command('mixpanel_import', path, stdout=StringIO())
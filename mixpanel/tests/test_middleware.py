@@ -0,0 +1,70 @@
+from __future__ import absolute_import, unicode_literals
+
+import unittest
+
+from django.db import transaction
+from django.http import HttpResponse
+from django.test import RequestFactory
+from mock import patch
+
+from mixpanel.middleware import EventCollectorMiddleware
+from mixpanel.tasks import BatchEventTracker, PeopleTracker
+
+
+def view(request):
+    request.mixpanel.track('event_a', {'foo': 'bar'})
+    request.mixpanel.track('event_b', token='xxx')
+    request.mixpanel.people_set({'plan': 'pro'}, distinct_id='x')
+    return HttpResponse()
+
+
+@patch.object(PeopleTracker, 'batch')
+@patch.object(BatchEventTracker, 'delay')
+class EventCollectorMiddlewareTest(unittest.TestCase):
+
+    def setUp(self):
+        super(EventCollectorMiddlewareTest, self).setUp()
+        self.middleware = EventCollectorMiddleware(view)
+        self.request = RequestFactory().get('/')
+
+    def test_queues_events_after_response(self, batch_delay, people_batch):
+        self.middleware(self.request)
+        batch_delay.assert_called_once_with([
+            ('event_a', {'foo': 'bar'}),
+            ('event_b', {'token': 'xxx'}),
+        ])
+        people_batch.assert_called_once_with([
+            ('set', {'plan': 'pro'}, {'distinct_id': 'x'}),
+        ])
+
+    def test_nothing_collected(self, batch_delay, people_batch):
+        self.middleware = EventCollectorMiddleware(lambda r: HttpResponse())
+        self.middleware(self.request)
+        self.assertFalse(batch_delay.called)
+        self.assertFalse(people_batch.called)
+
+    def test_waits_for_commit(self, batch_delay, people_batch):
+        with transaction.atomic():
+            self.middleware(self.request)
+            self.assertFalse(batch_delay.called)
+        self.assertEqual(batch_delay.call_count, 1)
+
+    def test_dropped_on_rollback(self, batch_delay, people_batch):
+        try:
+            with transaction.atomic():
+                self.middleware(self.request)
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertFalse(batch_delay.called)
+
+    def test_people_updates_coalesced(self, batch_delay, people_batch):
+        def view(request):
+            request.mixpanel.people_set({'a': 1}, distinct_id='x')
+            request.mixpanel.people_set({'b': 2}, distinct_id='x')
+            return HttpResponse()
+
+        EventCollectorMiddleware(view)(self.request)
+        people_batch.assert_called_once_with([
+            ('set', {'a': 1, 'b': 2}, {'distinct_id': 'x'}),
+        ])
@@ -0,0 +1,101 @@
+from __future__ import absolute_import, unicode_literals
+
+import unittest
+
+from mock import patch
+
+from mixpanel.retry import (
+    RetryPolicy,
+    is_retryable_status,
+    is_verbose_success,
+    parse_failed_records,
+    parse_retry_after,
+    parse_verbose_error,
+)
+
+
+class RetryPolicyTest(unittest.TestCase):
+
+    def test_backoff_grows_to_cap(self):
+        policy = RetryPolicy(base=2, cap=30)
+        with patch('mixpanel.retry.random.uniform',
+                   side_effect=lambda low, high: high):
+            delays = [policy.countdown(n) for n in range(6)]
+        self.assertEqual(delays, [2, 4, 8, 16, 30, 30])
+
+    def test_full_jitter(self):
+        policy = RetryPolicy(base=2, cap=30)
+        with patch('mixpanel.retry.random.uniform',
+                   side_effect=lambda low, high: low):
+            self.assertEqual(policy.countdown(3), 0)
+
+    def test_retry_after_wins(self):
+        policy = RetryPolicy(base=2, cap=30)
+        self.assertEqual(policy.countdown(0, retry_after=60), 60)
+
+    def test_statuses(self):
+        for status in (500, 502, 503, 504, 408, 429):
+            self.assertTrue(is_retryable_status(status), status)
+        for status in (400, 401, 403, 404, 413):
+            self.assertFalse(is_retryable_status(status), status)
+
+
+class ParseRetryAfterTest(unittest.TestCase):
+
+    def test_seconds(self):
+        self.assertEqual(parse_retry_after('30'), 30)
+
+    def test_http_date(self):
+        self.assertEqual(
+            parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT',
+                              now=1445412450),
+            30,
+        )
+
+    def test_missing_or_invalid(self):
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after('soon'))
+
+
+class VerboseResponseTest(unittest.TestCase):
+
+    def test_verbose_success(self):
+        self.assertTrue(is_verbose_success(b'{"status": 1, "error": null}'))
+        self.assertTrue(is_verbose_success(
+            b'{"code": 200, "num_records_imported": 2, "status": "OK"}'
+        ))
+        self.assertFalse(is_verbose_success(
+            b'{"status": 0, "error": "data, missing or empty"}'
+        ))
+        self.assertFalse(is_verbose_success(b'0'))
+        self.assertFalse(is_verbose_success(b'<html>'))
+
+    def test_verbose_error(self):
+        self.assertEqual(parse_verbose_error(
+            b'{"status": 0, "error": "data, missing or empty"}'
+        ), 'data, missing or empty')
+        self.assertIsNone(parse_verbose_error(b'{"status": 1, "error": null}'))
+        self.assertIsNone(parse_verbose_error(
+            b'{"code": 200, "num_records_imported": 2, "status": "OK"}'
+        ))
+        self.assertIsNone(parse_verbose_error(b'0'))
+
+    def test_failed_records(self):
+        data = (
+            b'{"code": 400, "num_records_imported": 1,'
+            b' "status": "Bad Request", "failed_records": ['
+            b'{"index": 1, "$insert_id": "abc", "field": "properties.time",'
+            b' "message": "must be specified as seconds since epoch"}]}'
+        )
+        self.assertEqual(parse_failed_records(data), {
+            1: 'properties.time: must be specified as seconds since epoch',
+        })
+
+    def test_no_failed_records(self):
+        self.assertIsNone(parse_failed_records(b'0'))
+        self.assertIsNone(parse_failed_records(
+            b'{"status": 0, "error": "invalid api key"}'
+        ))
+        self.assertIsNone(parse_failed_records(
+            b'{"failed_records": [{"message": "no index"}]}'
+        ))
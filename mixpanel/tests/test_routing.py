@@ -0,0 +1,30 @@
+from __future__ import absolute_import, unicode_literals
+
+import unittest
+
+from mock import patch
+
+from mixpanel.conf import settings as mp_settings
+from mixpanel.routing import BULK, HIGH, NORMAL, lane_for, queue_for
+
+
+@patch.object(mp_settings, 'MIXPANEL_LANES',
+              {'track_charge': HIGH, 'page_scroll': BULK})
+class RoutingTest(unittest.TestCase):
+
+    def test_lane_for(self):
+        self.assertEqual(lane_for(['track_charge']), HIGH)
+        self.assertEqual(lane_for(['page_scroll']), BULK)
+        self.assertEqual(lane_for(['signup']), NORMAL)
+        self.assertEqual(lane_for(['signup'], default=BULK), BULK)
+
+    def test_most_urgent_lane_wins(self):
+        self.assertEqual(lane_for(['page_scroll', 'track_charge']), HIGH)
+        self.assertEqual(lane_for(['page_scroll', 'signup']), NORMAL)
+        self.assertEqual(lane_for([]), NORMAL)
+
+    def test_queue_for(self):
+        with patch.object(mp_settings, 'MIXPANEL_QUEUES',
+                          {HIGH: 'mixpanel.high'}):
+            self.assertEqual(queue_for(['track_charge']), 'mixpanel.high')
+            self.assertIsNone(queue_for(['signup']))
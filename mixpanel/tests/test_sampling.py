@@ -0,0 +1,99 @@
+from __future__ import absolute_import, unicode_literals
+
+import unittest
+
+from mock import patch
+
+from mixpanel import metrics
+from mixpanel.conf import settings as mp_settings
+from mixpanel.sampling import (
+    RateLimiter,
+    TokenBucket,
+    admit,
+    rate_limiter,
+    sample,
+)
+
+
+class SampleTest(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+        patcher = patch.object(mp_settings, 'MIXPANEL_SAMPLE_RATES',
+                               {'page_scroll': 0.25})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_unsampled_event(self):
+        properties = {'foo': 'bar'}
+        self.assertIs(sample('purchase', properties), properties)
+        self.assertEqual(sample('purchase', None), {})
+
+    @patch('mixpanel.sampling.random.random', lambda: 0.1)
+    def test_kept(self):
+        properties = {'foo': 'bar'}
+        self.assertEqual(sample('page_scroll', properties),
+                         {'foo': 'bar', '$sample_rate': 0.25})
+        self.assertEqual(properties, {'foo': 'bar'})
+
+    @patch('mixpanel.sampling.random.random', lambda: 0.5)
+    def test_dropped(self):
+        self.assertIsNone(sample('page_scroll', {}))
+        self.assertEqual(metrics.snapshot()['mixpanel.events.sampled_out'],
+                         1)
+
+
+class TokenBucketTest(unittest.TestCase):
+
+    def setUp(self):
+        self.time = 100.0
+        patcher = patch('mixpanel.sampling._now', lambda: self.time)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_burst_then_rate(self):
+        bucket = TokenBucket(rate=2, burst=3)
+        self.assertEqual([bucket.take() for i in range(4)],
+                         [True, True, True, False])
+        self.time += 0.5
+        self.assertTrue(bucket.take())
+        self.assertFalse(bucket.take())
+
+    def test_refill_capped_at_burst(self):
+        bucket = TokenBucket(rate=10, burst=2)
+        self.time += 60
+        self.assertEqual([bucket.take() for i in range(3)],
+                         [True, True, False])
+
+
+class RateLimiterTest(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+        self.limiter = RateLimiter()
+
+    def test_unlimited(self):
+        with patch.object(mp_settings, 'MIXPANEL_RATE_LIMIT', None):
+            self.assertTrue(all(self.limiter.allow('a') for i in range(100)))
+
+    def test_per_token(self):
+        with patch.object(mp_settings, 'MIXPANEL_RATE_LIMIT', 1), \
+                patch.object(mp_settings, 'MIXPANEL_RATE_LIMIT_BURST', 2):
+            self.assertEqual([self.limiter.allow('a') for i in range(3)],
+                             [True, True, False])
+            self.assertTrue(self.limiter.allow('b'))
+        self.assertEqual(metrics.snapshot()['mixpanel.events.rate_limited'],
+                         1)
+
+
+class AdmitTest(unittest.TestCase):
+
+    def tearDown(self):
+        rate_limiter.clear()
+
+    def test_rate_limited_on_default_token(self):
+        with patch.object(mp_settings, 'MIXPANEL_RATE_LIMIT', 1), \
+                patch.object(mp_settings, 'MIXPANEL_API_TOKEN', 'default'):
+            self.assertEqual(admit('foo', None), {})
+            self.assertIsNone(admit('foo', {}))
+            self.assertEqual(admit('foo', {}, 'other'), {})
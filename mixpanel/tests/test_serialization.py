@@ -0,0 +1,62 @@
+from __future__ import absolute_import, unicode_literals
+
+import unittest
+import zlib
+from datetime import datetime
+
+from kombu.serialization import dumps as kombu_dumps
+from kombu.serialization import loads as kombu_loads
+
+from mixpanel import serialization
+from mixpanel.serialization import CONTENT_TYPE, dumps, loads
+
+BODY = [
+    ['event_foo', {'foo': 'bar', '$insert_id': 'abc'}],
+    {'test': True},
+    {'callbacks': None, 'errbacks': None, 'chain': None, 'chord': None},
+]
+
+
+class SerializationTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        self.assertEqual(loads(dumps(BODY)), BODY)
+
+    def test_compressed_over_threshold(self):
+        body = [[['event_foo', {'foo': 'x' * 100}]] * 50, {}, {}]
+        data = dumps(body, compress_over=1024)
+        self.assertEqual(data[:1], serialization.ZLIB)
+        self.assertLess(len(data), len(dumps(body, compress_over=10 ** 9)))
+        self.assertEqual(loads(data), body)
+
+    def test_small_not_compressed(self):
+        self.assertNotEqual(dumps(BODY, compress_over=1024)[:1],
+                            serialization.ZLIB)
+
+    def test_json_codec(self):
+        data = serialization.JSON + b'{"a":[1,2]}'
+        self.assertEqual(loads(data), {'a': [1, 2]})
+        self.assertEqual(loads(serialization.ZLIB + zlib.compress(data)),
+                         {'a': [1, 2]})
+
+    def test_other_types(self):
+        body = loads(dumps({'when': datetime(2017, 5, 1)}))
+        self.assertEqual(body, {'when': '2017-05-01T00:00:00'})
+
+    def test_unknown_encoding(self):
+        self.assertRaises(ValueError, loads, b'X{}')
+
+    @unittest.skipIf(serialization.msgpack is None, "msgpack not installed")
+    def test_msgpack(self):
+        data = dumps(BODY, compress_over=10 ** 9)
+        self.assertEqual(data[:1], serialization.MSGPACK)
+        self.assertEqual(loads(data), BODY)
+
+    def test_registered(self):
+        content_type, content_encoding, data = kombu_dumps(
+            BODY, serializer='mixpanel',
+        )
+        self.assertEqual(content_type, CONTENT_TYPE)
+        self.assertEqual(content_encoding, 'binary')
+        self.assertEqual(kombu_loads(data, content_type, content_encoding),
+                         BODY)
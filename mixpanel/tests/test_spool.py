@@ -0,0 +1,136 @@
+from __future__ import absolute_import, unicode_literals
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import patch
+
+from mixpanel.spool import Spool, decode_record, encode_record, fcntl
+
+
+class RecordTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        line = encode_record('mixpanel.tasks.EventTracker',
+                             {'event': 'foo', 'properties': {'a': 1}})
+        self.assertEqual(decode_record(line), (
+            'mixpanel.tasks.EventTracker',
+            {'event': 'foo', 'properties': {'a': 1}},
+            None,
+        ))
+
+    def test_test_flag(self):
+        line = encode_record('mixpanel.tasks.EventTracker', {'event': 'foo'},
+                             test=True)
+        self.assertEqual(decode_record(line)[2], True)
+
+    def test_corrupt(self):
+        line = encode_record('mixpanel.tasks.EventTracker', {'event': 'foo'})
+        self.assertIsNone(decode_record(line.replace(b'foo', b'bar')))
+        self.assertIsNone(decode_record(line[:-5]))
+
+
+class SpoolTest(unittest.TestCase):
+
+    def setUp(self):
+        super(SpoolTest, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.spool = Spool(self.directory, segment_size=1024,
+                           segment_age=60, fsync_every=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        super(SpoolTest, self).tearDown()
+
+    def read_all(self, paths):
+        return [params for path in paths
+                for name, params, test in self.spool.read(path)]
+
+    def test_open_segment_not_claimed(self):
+        self.spool.write('task', [{'n': 1}])
+        self.assertEqual(self.spool.claim(), [])
+
+    def test_seal_and_claim(self):
+        self.spool.write('task', [{'n': 1}, {'n': 2}])
+        self.spool.write('task', [{'n': 3}])
+        self.spool.seal()
+        paths = self.spool.claim()
+        self.assertEqual(len(paths), 1)
+        self.assertEqual(self.read_all(paths), [{'n': 1}, {'n': 2}, {'n': 3}])
+        self.assertEqual(self.spool.claim(), [])
+
+        self.spool.remove(paths[0])
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_rotates_full_segments(self):
+        for n in range(20):
+            self.spool.write('task', [{'n': n, 'padding': 'x' * 100}])
+        self.spool.seal()
+        paths = self.spool.claim()
+        self.assertTrue(len(paths) > 1)
+        self.assertEqual([p['n'] for p in self.read_all(paths)],
+                         list(range(20)))
+
+    def test_rotates_old_segments(self):
+        with patch('mixpanel.spool.time.time', return_value=1000):
+            self.spool.write('task', [{'n': 1}])
+        with patch('mixpanel.spool.time.time', return_value=1061):
+            self.spool.write('task', [{'n': 2}])
+        self.assertEqual(len(self.spool.claim()), 1)
+
+    def test_idle_segment_sealed_by_age(self):
+        spool = Spool(self.directory, segment_age=0.05)
+        spool.write('task', [{'n': 1}])
+        spool._timer.join(1)
+        # The writer is still alive but hasn't written again.
+        self.assertEqual(self.read_all(self.spool.claim()), [{'n': 1}])
+        spool.write('task', [{'n': 2}])
+        spool.seal()
+        self.assertEqual(self.read_all(self.spool.claim()), [{'n': 2}])
+
+    def test_claims_abandoned_open_segments(self):
+        other = Spool(self.directory)
+        other.write('task', [{'n': 1}])
+        # The process that held the segment went away.
+        other._file.close()
+        os.utime(other._path, (0, 0))
+        self.assertEqual(self.read_all(self.spool.claim()), [{'n': 1}])
+
+    @unittest.skipIf(fcntl is None, "fcntl isn't available")
+    def test_idle_open_segments_of_live_writers_not_claimed(self):
+        other = Spool(self.directory)
+        other.write('task', [{'n': 1}])
+        os.utime(other._path, (0, 0))
+        self.assertEqual(self.spool.claim(), [])
+        other.write('task', [{'n': 2}])
+        other.seal()
+        self.assertEqual(self.read_all(self.spool.claim()),
+                         [{'n': 1}, {'n': 2}])
+
+    def test_recovers_from_lost_segment(self):
+        self.spool.write('task', [{'n': 1}])
+        os.rename(self.spool._path, self.spool._path + '.lost')
+        with patch('mixpanel.spool.time.time', return_value=2 ** 40):
+            self.spool.write('task', [{'n': 2}])
+        self.spool.write('task', [{'n': 3}])
+        self.spool.seal()
+        self.assertEqual(self.read_all(self.spool.claim()),
+                         [{'n': 2}, {'n': 3}])
+
+    def test_skips_corrupt_records(self):
+        self.spool.write('task', [{'n': 1}, {'n': 2}])
+        self.spool.seal()
+        path = os.path.join(self.directory, os.listdir(self.directory)[0])
+        with open(path, 'ab') as f:
+            f.write(b'deadbeef {"truncated')
+        self.assertEqual(self.read_all(self.spool.claim()),
+                         [{'n': 1}, {'n': 2}])
+
+    def test_unclaim(self):
+        self.spool.write('task', [{'n': 1}])
+        self.spool.seal()
+        path, = self.spool.claim()
+        self.spool.unclaim(path)
+        self.assertEqual(len(self.spool.claim()), 1)
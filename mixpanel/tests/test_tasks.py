@@ -1,25 +1,46 @@
 from __future__ import absolute_import, unicode_literals
 
 import base64
+import errno
+import gzip
+import io
 import json
 import logging
+import os
+import shutil
 import socket
+import tempfile
 import unittest
 from datetime import datetime
+from decimal import Decimal
 from six import text_type
-from six.moves import urllib
+from six.moves import http_client, urllib
 from mock import patch
 
 from mixpanel.tests.utils import eager_tasks
 from mixpanel.tasks import (
     EventTracker,
     event_tracker,
+    BatchEventTracker,
+    batch_event_tracker,
+    EventImporter,
+    event_importer,
     PeopleTracker,
     people_tracker,
+    PeopleBatchTracker,
+    people_batch_tracker,
     FunnelEventTracker,
     funnel_tracker,
+    SpoolDrainer,
+    gzip_compress,
 )
+from mixpanel.circuit import OPEN, circuit_breaker
+from mixpanel.dedupe import recently_sent
+from mixpanel.encoding import dumps
 from mixpanel.conf import settings as mp_settings
+from mixpanel.connection import clear_pools, get_pool
+from mixpanel.sampling import rate_limiter
+from mixpanel.spool import get_spool
 
 
 class FakeDateTime(datetime):
@@ -34,9 +55,12 @@ class TasksTestCase(unittest.TestCase):
         super(TasksTestCase, self).setUp()
         self.patch_network()
         self.set_mp_settings()
+        circuit_breaker.reset()
+        recently_sent.clear()
 
     def tearDown(self):
         self.unpatch_network()
+        clear_pools()
         super(TasksTestCase, self).tearDown()
 
     def set_mp_settings(self):
@@ -51,9 +75,13 @@ class TasksTestCase(unittest.TestCase):
         class Response(object):
             status = 200
             reason = 'OK'
+            headers = {}
 
             def read(*args, **kwargs):
                 return b'1'
+
+            def getheader(self, name, default=None):
+                return self.headers.get(name, default)
         response = Response()
         self.response = response
 
@@ -85,9 +113,36 @@ class TasksTestCase(unittest.TestCase):
         path, qs = args[1].split('?', 1)
         return dict(urllib.parse.parse_qsl(qs, keep_blank_values=True))
 
-    def assertParams(self, expected):
+    def get_body_dict(self, index=0):
+        args = self.conn.request_call_args[index]
+        self.assertEqual(args[0], 'POST')
+        body = args[2]
+        if args[3].get('Content-Encoding') == 'gzip':
+            body = gzip.GzipFile(fileobj=io.BytesIO(body)).read()
+            body = body.decode('ascii')
+        return dict(urllib.parse.parse_qsl(body, keep_blank_values=True))
+
+    def popInsertId(self, params):
+        insert_id = params['properties'].pop('$insert_id')
+        self.assertEqual(len(insert_id), 32)
+        return insert_id
+
+    def get_batch_params(self, index=0):
+        parsed = self.get_body_dict(index)
+        return json.loads(base64.b64decode(parsed['data']).decode('utf8'))
+
+    def assertBatchParams(self, expected, index=0, stamped=False):
+        params = self.get_batch_params(index)
+        if stamped:
+            for event in params:
+                self.popInsertId(event)
+        self.assertEqual(params, expected)
+
+    def assertParams(self, expected, stamped=False):
         parsed = self.get_querystring_dict()
         params = json.loads(base64.b64decode(parsed['data']).decode('utf8'))
+        if stamped:
+            self.popInsertId(params)
         self.assertEqual(params, expected)
 
 
@@ -145,7 +200,7 @@ class EventTrackerTest(TasksTestCase):
         url_params = et._encode_params(params, test)
 
         expected_params = urllib.parse.urlencode({
-            'data': base64.b64encode(json.dumps(params).encode('utf8')),
+            'data': base64.b64encode(dumps(params)),
             'test': '1'
         })
 
@@ -222,7 +277,7 @@ class EventTrackerTest(TasksTestCase):
         self.assertParams({
             'event': 'event_foo',
             'properties': {'token': 'testtesttest'}
-        })
+        }, stamped=True)
 
     def test_socket_error_replaced_with_failed_event_request(self):
         class FakeConnection(object):
@@ -238,6 +293,372 @@ class EventTrackerTest(TasksTestCase):
         with self.assertRaises(EventTracker.FailedEventRequest):
             et._send_request(fake_connection, {})
 
+    def test_body_timeout_replaced_with_failed_event_request(self):
+        def read(*args, **kwargs):
+            raise socket.timeout('Mixpanel request deadline exceeded')
+        self.response.read = read
+        with self.assertRaises(EventTracker.FailedEventRequest):
+            EventTracker()._send_request(self.conn, {})
+
+    def test_stale_connection_reconnects(self):
+        response = self.response
+
+        class StaleConnection(object):
+            sock = object()
+            requests = 0
+
+            def request(self, *args, **kwargs):
+                self.requests += 1
+                if self.sock is not None:
+                    raise http_client.BadStatusLine('')
+
+            def getresponse(self):
+                return response
+
+            def close(self):
+                self.sock = None
+
+        conn = StaleConnection()
+        self.assertTrue(EventTracker()._send_request(conn, {}))
+        self.assertEqual(conn.requests, 2)
+
+    def test_fresh_connection_does_not_reconnect(self):
+        class FreshConnection(object):
+            requests = 0
+
+            def request(self, *args, **kwargs):
+                self.requests += 1
+                raise socket.error(errno.ECONNRESET, 'reset')
+
+        conn = FreshConnection()
+        with self.assertRaises(EventTracker.FailedEventRequest):
+            EventTracker()._send_request(conn, {})
+        self.assertEqual(conn.requests, 1)
+
+    def test_connection_released_to_pool(self):
+        EventTracker().run('event_foo')
+        self.assertIn(self.conn, [c for c, t in get_pool()._idle])
+
+
+class BatchEventTrackerTest(TasksTestCase):
+
+    def test_run(self):
+        result = BatchEventTracker().run([
+            ('event_foo', {'foo': 'bar'}),
+            ('event_bar', None),
+        ])
+        self.assertTrue(result)
+        self.assertEqual(len(self.conn.request_call_args), 1)
+        self.assertEqual(self.conn.request_call_args[0][1], '/track/')
+        self.assertBatchParams([
+            {'event': 'event_foo',
+             'properties': {'token': 'testtesttest', 'foo': 'bar'}},
+            {'event': 'event_bar',
+             'properties': {'token': 'testtesttest'}},
+        ])
+
+    def test_run_token_and_test(self):
+        result = BatchEventTracker().run([('event_foo', {})], test=True,
+                                         token='xxx')
+        self.assertTrue(result)
+        self.assertEqual(self.get_body_dict()['test'], '1')
+        self.assertBatchParams([
+            {'event': 'event_foo', 'properties': {'token': 'xxx'}},
+        ])
+
+    def test_run_chunks(self):
+        mp_settings.MIXPANEL_BATCH_SIZE = 2
+        try:
+            events = [('event_%d' % i, {}) for i in range(5)]
+            result = BatchEventTracker().run(events)
+        finally:
+            mp_settings.MIXPANEL_BATCH_SIZE = 50
+        self.assertTrue(result)
+        self.assertEqual(len(self.conn.request_call_args), 3)
+        self.assertBatchParams([
+            {'event': 'event_4', 'properties': {'token': 'testtesttest'}},
+        ], index=2)
+
+    def test_run_splits_by_size(self):
+        mp_settings.MIXPANEL_BATCH_MAX_BYTES = 250
+        try:
+            events = [('event_%d' % i, {'pad': 'x' * 40}) for i in range(4)]
+            result = BatchEventTracker().run(events)
+        finally:
+            mp_settings.MIXPANEL_BATCH_MAX_BYTES = 1024 * 1024
+        self.assertTrue(result)
+        self.assertEqual(len(self.conn.request_call_args), 2)
+        self.assertEqual(len(self.get_batch_params(index=0)), 2)
+        self.assertEqual(len(self.get_batch_params(index=1)), 2)
+
+    def test_run_drops_oversized(self):
+        mp_settings.MIXPANEL_BATCH_MAX_BYTES = 200
+        try:
+            result = BatchEventTracker().run([
+                ('event_foo', {}),
+                ('event_big', {'pad': 'x' * 200}),
+                ('event_bar', {}),
+            ])
+        finally:
+            mp_settings.MIXPANEL_BATCH_MAX_BYTES = 1024 * 1024
+        self.assertFalse(result)
+        self.assertEqual(len(self.conn.request_call_args), 2)
+        self.assertBatchParams([
+            {'event': 'event_foo', 'properties': {'token': 'testtesttest'}},
+        ], index=0)
+        self.assertBatchParams([
+            {'event': 'event_bar', 'properties': {'token': 'testtesttest'}},
+        ], index=1)
+
+    def test_non_recorded(self):
+        self.response.read = lambda *args, **kwargs: b'0'
+        result = BatchEventTracker().run([('event_foo', {})])
+        self.assertFalse(result)
+
+    def test_instantiated_batch_event_tracker_delay(self):
+        with eager_tasks():
+            result = batch_event_tracker.delay([('event_foo', {})])
+        self.assertTrue(result)
+        self.assertBatchParams([
+            {'event': 'event_foo', 'properties': {'token': 'testtesttest'}},
+        ], stamped=True)
+
+    def test_failed_request(self):
+        self.response.status = 400
+        with eager_tasks():
+            result = batch_event_tracker.delay([('event_foo', {})])
+        self.assertNotEqual(result.traceback, None)
+
+
+class VerboseBatchTest(TasksTestCase):
+
+    refused = (
+        b'{"code": 400, "num_records_imported": 2, "status": "Bad Request",'
+        b' "failed_records": [{"index": 1, "field": "properties.time",'
+        b' "message": "invalid"}]}'
+    )
+
+    def setUp(self):
+        super(VerboseBatchTest, self).setUp()
+        mp_settings.MIXPANEL_VERBOSE_BATCHES = True
+
+    def tearDown(self):
+        mp_settings.MIXPANEL_VERBOSE_BATCHES = False
+        super(VerboseBatchTest, self).tearDown()
+
+    def test_asks_for_verbose_response(self):
+        self.response.read = lambda *args, **kwargs: (
+            b'{"status": 1, "error": null}'
+        )
+        result = BatchEventTracker().run([('event_foo', {})])
+        self.assertTrue(result)
+        self.assertEqual(self.get_body_dict()['verbose'], '1')
+
+    @patch('mixpanel.tasks.deadletter.send')
+    def test_verbose_error(self, send):
+        self.response.read = lambda *args, **kwargs: (
+            b'{"status": 0, "error": "data, missing or empty"}'
+        )
+        with self.assertRaises(EventTracker.RejectedEventRequest) as cm:
+            BatchEventTracker().run([('event_foo', {}), ('event_bar', {})])
+        self.assertIn('data, missing or empty', str(cm.exception))
+        self.assertEqual(send.call_count, 2)
+        self.assertIn('data, missing or empty', send.call_args[0][2])
+
+    @patch('mixpanel.tasks.deadletter.send')
+    def test_track_failed_records_not_trusted(self, send):
+        self.response.status = 400
+        self.response.reason = 'Bad Request'
+        self.response.read = lambda *args, **kwargs: self.refused
+        with self.assertRaises(EventTracker.RejectedEventRequest) as cm:
+            BatchEventTracker().run([('event_foo', {}), ('event_bad', {})])
+        self.assertNotIsInstance(cm.exception,
+                                 EventTracker.PartiallyRejected)
+        self.assertEqual(send.call_count, 2)
+
+    def test_import_is_strict(self):
+        with patch.object(mp_settings, 'MIXPANEL_API_SECRET', 'secret'):
+            EventImporter().run([('event_foo', {'time': 1})])
+        self.assertEqual(self.get_body_dict()['strict'], '1')
+
+    @patch('mixpanel.tasks.deadletter.send')
+    @patch.object(mp_settings, 'MIXPANEL_API_SECRET', 'secret')
+    def test_dead_letters_refused_events(self, send):
+        self.response.status = 400
+        self.response.reason = 'Bad Request'
+        self.response.read = lambda *args, **kwargs: self.refused
+        with patch.object(EventImporter, 'retry') as retry:
+            result = EventImporter().run([
+                ('event_foo', {'$insert_id': 'a'}),
+                ('event_bad', {'$insert_id': 'b'}),
+                ('event_bar', {'$insert_id': 'c'}),
+            ])
+        self.assertFalse(result)
+        self.assertFalse(retry.called)
+        self.assertEqual(len(self.conn.request_call_args), 1)
+        self.assertEqual(send.call_count, 1)
+        name, params, error = send.call_args[0]
+        self.assertEqual(name, EventImporter.name)
+        self.assertEqual(params.decode()['event'], 'event_bad')
+        self.assertEqual(error, 'properties.time: invalid')
+        self.assertIn('a', recently_sent)
+        self.assertNotIn('b', recently_sent)
+        self.assertIn('c', recently_sent)
+
+    def test_rejected_without_failed_records(self):
+        self.response.status = 400
+        self.response.reason = 'Bad Request'
+        self.response.read = lambda *args, **kwargs: (
+            b'{"status": 0, "error": "invalid api key"}'
+        )
+        with eager_tasks():
+            result = batch_event_tracker.delay([('event_foo', {})])
+        self.assertIsInstance(result.result,
+                              EventTracker.RejectedEventRequest)
+        self.assertNotIsInstance(result.result,
+                                 EventTracker.PartiallyRejected)
+
+    @patch('mixpanel.tasks.deadletter.send')
+    def test_oversized_event_dead_lettered(self, send):
+        mp_settings.MIXPANEL_BATCH_MAX_BYTES = 100
+        try:
+            BatchEventTracker().run([('event_big', {'pad': 'x' * 100})])
+        finally:
+            mp_settings.MIXPANEL_BATCH_MAX_BYTES = 1024 * 1024
+        self.assertEqual(send.call_count, 1)
+        self.assertEqual(self.conn.request_call_args, [])
+
+
+class InsertIdTest(TasksTestCase):
+
+    def test_retry_keeps_insert_id(self):
+        self.response.status = 503
+        with patch.object(EventTracker, 'max_retries', 1):
+            with eager_tasks():
+                event_tracker.delay('event_foo')
+        first = json.loads(base64.b64decode(
+            dict(urllib.parse.parse_qsl(
+                self.conn.request_call_args[0][1].split('?', 1)[1]
+            ))['data']
+        ).decode('utf8'))
+        self.assertIn('$insert_id', first['properties'])
+        self.assertParams(first)
+
+    def test_existing_insert_id_kept(self):
+        with eager_tasks():
+            event_tracker.delay('event_foo', {'$insert_id': 'abc'})
+        self.assertParams({
+            'event': 'event_foo',
+            'properties': {'token': 'testtesttest', '$insert_id': 'abc'},
+        })
+
+    def test_properties_keyword_stamped(self):
+        with eager_tasks():
+            event_tracker.delay('event_foo', properties={'foo': 'bar'})
+        self.assertParams({
+            'event': 'event_foo',
+            'properties': {'token': 'testtesttest', 'foo': 'bar'},
+        }, stamped=True)
+
+    def test_caller_properties_not_modified(self):
+        properties = {'foo': 'bar'}
+        with eager_tasks():
+            event_tracker.delay('event_foo', properties)
+        self.assertEqual(properties, {'foo': 'bar'})
+
+    def test_disabled(self):
+        mp_settings.MIXPANEL_INSERT_ID = False
+        try:
+            with eager_tasks():
+                event_tracker.delay('event_foo')
+        finally:
+            mp_settings.MIXPANEL_INSERT_ID = True
+        self.assertParams({
+            'event': 'event_foo',
+            'properties': {'token': 'testtesttest'},
+        })
+
+    def test_people_not_stamped(self):
+        with eager_tasks():
+            people_tracker.delay('set', {'distinct_id': 'foo'})
+        self.assertNotIn('$insert_id', self.get_querystring_dict()['data'])
+
+    def test_sent_event_skipped(self):
+        EventTracker().run('event_foo', {'$insert_id': 'abc'})
+        result = EventTracker().run('event_foo', {'$insert_id': 'abc'})
+        self.assertTrue(result)
+        self.assertEqual(len(self.conn.request_call_args), 1)
+
+    def test_failed_event_not_remembered(self):
+        self.response.read = lambda *args, **kwargs: b'0'
+        EventTracker().run('event_foo', {'$insert_id': 'abc'})
+        self.assertNotIn('abc', recently_sent)
+
+    def test_batch_skips_sent_events(self):
+        EventTracker().run('event_foo', {'$insert_id': 'abc'})
+        BatchEventTracker().run([
+            ('event_foo', {'$insert_id': 'abc'}),
+            ('event_bar', {'$insert_id': 'def'}),
+        ])
+        self.assertBatchParams([
+            {'event': 'event_bar',
+             'properties': {'token': 'testtesttest', '$insert_id': 'def'}},
+        ], index=1)
+        self.assertIn('def', recently_sent)
+
+    def test_batch_of_sent_events_not_sent(self):
+        EventTracker().run('event_foo', {'$insert_id': 'abc'})
+        result = BatchEventTracker().run([
+            ('event_foo', {'$insert_id': 'abc'}),
+        ])
+        self.assertTrue(result)
+        self.assertEqual(len(self.conn.request_call_args), 1)
+
+
+class GzipTest(TasksTestCase):
+
+    def tearDown(self):
+        mp_settings.MIXPANEL_GZIP_OVER = None
+        super(GzipTest, self).tearDown()
+
+    def headers(self):
+        return self.conn.request_call_args[0][3]
+
+    def test_off_by_default(self):
+        BatchEventTracker().run([('event_foo', {'foo': 'x' * 1000})])
+        self.assertNotIn('Content-Encoding', self.headers())
+
+    def test_compressed_over_threshold(self):
+        mp_settings.MIXPANEL_GZIP_OVER = 100
+        events = [('event_foo', {'foo': 'x' * 1000})] * 10
+        BatchEventTracker().run(events)
+        self.assertEqual(self.headers()['Content-Encoding'], 'gzip')
+        body = self.conn.request_call_args[0][2]
+        self.assertIsInstance(body, bytes)
+        self.assertLess(len(body), 1000)
+        self.assertBatchParams([
+            {'event': 'event_foo',
+             'properties': {'token': 'testtesttest', 'foo': 'x' * 1000}},
+        ] * 10)
+
+    def test_small_body_not_compressed(self):
+        mp_settings.MIXPANEL_GZIP_OVER = 10000
+        BatchEventTracker().run([('event_foo', {})])
+        self.assertNotIn('Content-Encoding', self.headers())
+
+    def test_get_not_compressed(self):
+        mp_settings.MIXPANEL_GZIP_OVER = 0
+        EventTracker().run('event_foo', {'foo': 'x' * 1000})
+        self.assertEqual(self.get_querystring_dict()['data'][:4], 'eyJl')
+
+    def test_gzip_compress(self):
+        data = b'data=' + b'x' * 1000
+        compressed = gzip_compress(data, level=9)
+        self.assertLess(len(compressed), len(data))
+        self.assertEqual(
+            gzip.GzipFile(fileobj=io.BytesIO(compressed)).read(), data,
+        )
+
 
 class PeopleTrackerTest(TasksTestCase):
     @patch('mixpanel.tasks.datetime.datetime', FakeDateTime)
@@ -345,6 +766,436 @@ class PeopleTrackerTest(TasksTestCase):
         })
 
 
+class SuperPropertiesTest(TasksTestCase):
+
+    def tearDown(self):
+        mp_settings.MIXPANEL_SUPER_PROPERTIES = {}
+        super(SuperPropertiesTest, self).tearDown()
+
+    def test_event(self):
+        mp_settings.MIXPANEL_SUPER_PROPERTIES = {'app': 'web'}
+        EventTracker().run('event_foo', {'foo': 'bar'})
+        self.assertParams({
+            'event': 'event_foo',
+            'properties': {'token': 'testtesttest', 'foo': 'bar',
+                           'app': 'web'},
+        })
+
+    def test_batch(self):
+        mp_settings.MIXPANEL_SUPER_PROPERTIES = {'app': 'web'}
+        BatchEventTracker().run([('event_foo', {'app': 'ios'})])
+        self.assertBatchParams([
+            {'event': 'event_foo',
+             'properties': {'token': 'testtesttest', 'app': 'ios'}},
+        ])
+
+    def test_not_added_to_people_updates(self):
+        mp_settings.MIXPANEL_SUPER_PROPERTIES = {'app': 'web'}
+        PeopleTracker().run('set', {'foo': 'bar'}, distinct_id='x')
+        self.assertParams({
+            '$distinct_id': 'x',
+            '$token': 'testtesttest',
+            '$set': {'foo': 'bar'},
+        })
+
+
+class PreserializeTest(TasksTestCase):
+
+    def setUp(self):
+        super(PreserializeTest, self).setUp()
+        mp_settings.MIXPANEL_PRESERIALIZE = True
+
+    def tearDown(self):
+        mp_settings.MIXPANEL_PRESERIALIZE = False
+        super(PreserializeTest, self).tearDown()
+
+    def test_event(self):
+        with eager_tasks():
+            result = event_tracker.delay('event_foo', {
+                'when': datetime(2017, 5, 1, 12, 30),
+                'amount': Decimal('11.77'),
+            })
+        self.assertTrue(result.result)
+        self.assertParams({
+            'event': 'event_foo',
+            'properties': {'token': 'testtesttest', 'amount': 11.77,
+                           'when': '2017-05-01T12:30:00'},
+        }, stamped=True)
+
+    def test_fails_when_queued(self):
+        self.assertRaises(TypeError, event_tracker.delay, 'event_foo',
+                          {'foo': object()})
+
+    @patch('celery.task.Task.apply_async')
+    def test_message_carries_encoded_event(self, apply_async):
+        event_tracker.delay('event_foo', {'$insert_id': 'abc'}, test=True)
+        args, kwargs = apply_async.call_args[0][:2]
+        self.assertEqual(kwargs, {'encoded': True, 'test': True})
+        self.assertEqual(args[0], 'event_foo')
+        text, insert_id = args[1]
+        self.assertEqual(insert_id, 'abc')
+        self.assertEqual(json.loads(text), {
+            'event': 'event_foo',
+            'properties': {'token': 'testtesttest', '$insert_id': 'abc'},
+        })
+
+    def test_sent_event_skipped(self):
+        EventTracker().run('event_foo', {'$insert_id': 'abc'})
+        with eager_tasks():
+            event_tracker.delay('event_foo', {'$insert_id': 'abc'})
+        self.assertEqual(len(self.conn.request_call_args), 1)
+
+    def test_batch(self):
+        with eager_tasks():
+            batch_event_tracker.delay([
+                ('event_foo', {'when': datetime(2017, 5, 1)}),
+                ('event_bar', {}),
+            ], token='xxx')
+        self.assertBatchParams([
+            {'event': 'event_foo',
+             'properties': {'token': 'xxx', 'when': '2017-05-01T00:00:00'}},
+            {'event': 'event_bar', 'properties': {'token': 'xxx'}},
+        ], stamped=True)
+
+    @patch.object(BatchEventTracker, 'retry')
+    def test_batch_retry_keeps_encoded_events(self, retry):
+        self.response.status = 503
+        events = [['{"event":"event_foo","properties":{}}', None]]
+        BatchEventTracker().run(events, encoded=True)
+        self.assertEqual(retry.call_args[1]['args'][0], events)
+
+    def test_people(self):
+        with eager_tasks():
+            people_tracker.delay('set', {'foo': 'bar'}, distinct_id='x')
+        self.assertParams({
+            '$distinct_id': 'x',
+            '$token': 'testtesttest',
+            '$set': {'foo': 'bar'},
+        })
+
+    def test_people_batch(self):
+        with eager_tasks():
+            people_tracker.batch([
+                ('set', {'foo': 'bar'}, {'distinct_id': 'x'}),
+            ])
+        self.assertBatchParams([
+            {'$distinct_id': 'x', '$token': 'testtesttest',
+             '$set': {'foo': 'bar'}},
+        ])
+
+    def test_funnel_encoded_by_worker(self):
+        with eager_tasks():
+            funnel_tracker.delay('f', 's', 'g', {'distinct_id': 'x'})
+        self.assertParams({
+            'event': 'mp_funnel',
+            'properties': {'distinct_id': 'x', 'funnel': 'f', 'goal': 'g',
+                           'step': 's', 'token': 'testtesttest'},
+        }, stamped=True)
+
+
+@patch('celery.task.Task.apply_async')
+class SamplingTest(TasksTestCase):
+
+    def setUp(self):
+        super(SamplingTest, self).setUp()
+        mp_settings.MIXPANEL_SAMPLE_RATES = {'page_scroll': 0.1}
+        mp_settings.MIXPANEL_INSERT_ID = False
+
+    def tearDown(self):
+        mp_settings.MIXPANEL_SAMPLE_RATES = {}
+        mp_settings.MIXPANEL_RATE_LIMIT = None
+        mp_settings.MIXPANEL_INSERT_ID = True
+        rate_limiter.clear()
+        super(SamplingTest, self).tearDown()
+
+    @patch('mixpanel.sampling.random.random', lambda: 0.5)
+    def test_sampled_out_not_queued(self, apply_async):
+        result = event_tracker.delay('page_scroll', {})
+        self.assertFalse(apply_async.called)
+        self.assertTrue(result.id)
+        self.assertFalse(result.get())
+        event_tracker.delay('purchase', {'amount': 1})
+        self.assertEqual(apply_async.call_args[0][0],
+                         ['purchase', {'amount': 1}])
+
+    @patch('mixpanel.sampling.random.random', lambda: 0.05)
+    def test_sample_rate_attached(self, apply_async):
+        event_tracker.delay('page_scroll', {'depth': 3})
+        self.assertEqual(apply_async.call_args[0][0], [
+            'page_scroll', {'depth': 3, '$sample_rate': 0.1},
+        ])
+
+    def test_rate_limited_per_token(self, apply_async):
+        mp_settings.MIXPANEL_RATE_LIMIT = 1
+        event_tracker.delay('foo', {})
+        self.assertFalse(event_tracker.delay('foo', {}).get())
+        event_tracker.delay('foo', {}, token='other')
+        event_tracker.delay('foo', {'token': 'third'})
+        self.assertEqual(apply_async.call_count, 3)
+
+    def test_retries_never_dropped(self, apply_async):
+        mp_settings.MIXPANEL_RATE_LIMIT = 1
+        event_tracker.delay('foo', {})
+        event_tracker.apply_async(('foo', {}), retries=1)
+        self.assertEqual(apply_async.call_count, 2)
+
+    @patch('mixpanel.sampling.random.random', lambda: 0.5)
+    def test_batch_filtered(self, apply_async):
+        batch_event_tracker.delay([('page_scroll', {}), ('purchase', {})])
+        self.assertEqual(apply_async.call_args[0][0],
+                         [[('purchase', {})]])
+        result = batch_event_tracker.delay([('page_scroll', {})])
+        self.assertFalse(result.get())
+        self.assertEqual(apply_async.call_count, 1)
+
+    @patch('mixpanel.sampling.random.random', lambda: 0.5)
+    def test_imports_never_dropped(self, apply_async):
+        mp_settings.MIXPANEL_RATE_LIMIT = 1
+        for i in range(3):
+            event_importer.delay([('page_scroll', {'time': 1})])
+        self.assertEqual(apply_async.call_count, 3)
+        self.assertEqual(apply_async.call_args[0][0],
+                         [[('page_scroll', {'time': 1})]])
+
+    def test_people_and_funnels_never_dropped(self, apply_async):
+        mp_settings.MIXPANEL_RATE_LIMIT = 1
+        for i in range(3):
+            people_tracker.delay('set', {'distinct_id': 'x'})
+            people_tracker.batch([('set', {}, {'distinct_id': 'x'})])
+            funnel_tracker.delay('funnel', 'step', 'goal',
+                                 {'distinct_id': 'x'})
+        self.assertEqual(apply_async.call_count, 9)
+
+
+@patch('celery.task.Task.apply_async')
+class RoutingTest(TasksTestCase):
+
+    def setUp(self):
+        super(RoutingTest, self).setUp()
+        mp_settings.MIXPANEL_QUEUES = {
+            'high': 'mixpanel.high',
+            'normal': 'mixpanel',
+            'bulk': 'mixpanel.bulk',
+        }
+
+    def tearDown(self):
+        mp_settings.MIXPANEL_QUEUES = {}
+        super(RoutingTest, self).tearDown()
+
+    def queue(self, apply_async):
+        return apply_async.call_args[1].get('queue')
+
+    def test_event_default_lane(self, apply_async):
+        event_tracker.delay('page_view', {})
+        self.assertEqual(self.queue(apply_async), 'mixpanel')
+
+    def test_track_charge_high(self, apply_async):
+        people_tracker.delay('track_charge', {'amount': 10},
+                             distinct_id='x')
+        self.assertEqual(self.queue(apply_async), 'mixpanel.high')
+        people_tracker.delay('set', {}, distinct_id='x')
+        self.assertEqual(self.queue(apply_async), 'mixpanel')
+
+    def test_batch_takes_most_urgent_lane(self, apply_async):
+        people_tracker.batch([
+            ('set', {}, {'distinct_id': 'x'}),
+            ('track_charge', {'amount': 10}, {'distinct_id': 'x'}),
+        ])
+        self.assertEqual(self.queue(apply_async), 'mixpanel.high')
+
+    def test_event_lanes(self, apply_async):
+        mp_settings.MIXPANEL_LANES = {'page_scroll': 'bulk'}
+        try:
+            event_tracker.delay('page_scroll', {})
+        finally:
+            mp_settings.MIXPANEL_LANES = {'track_charge': 'high'}
+        self.assertEqual(self.queue(apply_async), 'mixpanel.bulk')
+
+    def test_import_bulk(self, apply_async):
+        EventImporter.delay([('event_foo', {'time': 1})])
+        self.assertEqual(self.queue(apply_async), 'mixpanel.bulk')
+
+    def test_explicit_queue_kept(self, apply_async):
+        event_tracker.apply_async(('page_view', {}), queue='other')
+        self.assertEqual(self.queue(apply_async), 'other')
+
+    def test_unnamed_lane_uses_default_queue(self, apply_async):
+        mp_settings.MIXPANEL_QUEUES = {'high': 'mixpanel.high'}
+        event_tracker.delay('page_view', {})
+        self.assertNotIn('queue', apply_async.call_args[1])
+
+
+@patch('celery.task.Task.apply_async')
+class CompactMessagesTest(TasksTestCase):
+
+    def setUp(self):
+        super(CompactMessagesTest, self).setUp()
+        mp_settings.MIXPANEL_COMPACT_MESSAGES = True
+        mp_settings.MIXPANEL_INSERT_ID = False
+
+    def tearDown(self):
+        mp_settings.MIXPANEL_COMPACT_MESSAGES = False
+        mp_settings.MIXPANEL_INSERT_ID = True
+        super(CompactMessagesTest, self).tearDown()
+
+    def queued(self, apply_async):
+        return apply_async.call_args[0][:2]
+
+    def test_default_token_dropped(self, apply_async):
+        event_tracker.delay('event_foo', {'token': 'testtesttest', 'a': 1},
+                            token='testtesttest')
+        self.assertEqual(self.queued(apply_async),
+                         (['event_foo', {'a': 1}], {}))
+
+    def test_other_token_kept(self, apply_async):
+        event_tracker.delay('event_foo', {'token': 'xxx'})
+        self.assertEqual(self.queued(apply_async),
+                         (['event_foo', {'token': 'xxx'}], {}))
+
+    def test_token_argument_wins(self, apply_async):
+        event_tracker.delay('event_foo', {'token': 'testtesttest'},
+                            token='xxx')
+        self.assertEqual(self.queued(apply_async), (
+            ['event_foo', {'token': 'testtesttest'}], {'token': 'xxx'},
+        ))
+
+    def test_properties_keyword(self, apply_async):
+        event_tracker.delay('event_foo',
+                            properties={'token': 'testtesttest'})
+        self.assertEqual(self.queued(apply_async),
+                         (['event_foo'], {'properties': {}}))
+
+    def test_batch(self, apply_async):
+        batch_event_tracker.delay([
+            ('event_foo', {'token': 'testtesttest'}),
+            ('event_bar', {'token': 'xxx'}),
+        ])
+        self.assertEqual(self.queued(apply_async), ([[
+            ('event_foo', {}),
+            ('event_bar', {'token': 'xxx'}),
+        ]], {}))
+
+    def test_people(self, apply_async):
+        people_tracker.delay('set', {'a': 1}, distinct_id='x',
+                             token='testtesttest')
+        self.assertEqual(self.queued(apply_async), (
+            ['set', {'a': 1}], {'distinct_id': 'x'},
+        ))
+
+    def test_people_batch(self, apply_async):
+        people_tracker.batch([
+            ('set', {'a': 1}, {'distinct_id': 'x', 'token': 'testtesttest'}),
+        ])
+        self.assertEqual(self.queued(apply_async), (
+            [[('set', {'a': 1}, {'distinct_id': 'x'})]], {},
+        ))
+
+    def test_token_put_back(self, apply_async):
+        event_tracker.delay('event_foo', {'token': 'testtesttest'})
+        args, kwargs = self.queued(apply_async)
+        EventTracker().run(*args, **kwargs)
+        self.assertParams({
+            'event': 'event_foo',
+            'properties': {'token': 'testtesttest'},
+        })
+
+
+class PeopleBatchTrackerTest(TasksTestCase):
+
+    def test_run(self):
+        result = PeopleBatchTracker().run([
+            ('set', {'foo': 'bar'}, {'distinct_id': 'x'}),
+            ('unset', ['baz'], {'distinct_id': 'y', 'token': 'xxx'}),
+            ('add', {'distinct_id': 'z', 'n': 1}, {'ip': '1.2.3.4'}),
+        ])
+        self.assertTrue(result)
+        self.assertEqual(self.conn.request_call_args[0][1],
+                         mp_settings.MIXPANEL_PEOPLE_ENDPOINT)
+        self.assertBatchParams([
+            {'$distinct_id': 'x', '$token': 'testtesttest',
+             '$set': {'foo': 'bar'}},
+            {'$distinct_id': 'y', '$token': 'xxx', '$unset': ['baz']},
+            {'$distinct_id': 'z', '$token': 'testtesttest',
+             '$ip': '1.2.3.4', '$add': {'n': 1}},
+        ])
+
+    def test_task_kwargs_apply_to_every_update(self):
+        PeopleBatchTracker().run([
+            ('set', {'foo': 'bar'}, {'distinct_id': 'x'}),
+            ('set', {'foo': 'baz'}, {'distinct_id': 'y', 'token': 'yyy'}),
+        ], token='xxx')
+        self.assertBatchParams([
+            {'$distinct_id': 'x', '$token': 'xxx', '$set': {'foo': 'bar'}},
+            {'$distinct_id': 'y', '$token': 'yyy', '$set': {'foo': 'baz'}},
+        ])
+
+    def test_chunks(self):
+        mp_settings.MIXPANEL_BATCH_SIZE = 2
+        try:
+            PeopleBatchTracker().run([
+                ('set', {'n': i}, {'distinct_id': 'x'}) for i in range(3)
+            ])
+        finally:
+            mp_settings.MIXPANEL_BATCH_SIZE = 50
+        self.assertEqual(len(self.conn.request_call_args), 2)
+
+    @patch('mixpanel.tasks.deadletter.send')
+    def test_invalid_updates_dead_lettered(self, send):
+        result = PeopleBatchTracker().run([
+            ('set', {'a': 1}, {'distinct_id': 'x'}),
+            ('bogus', {}, {'distinct_id': 'x'}),
+            ('set', {'a': 1}, {}),
+            ('set', {'a': 2}, {'distinct_id': 'y'}),
+        ])
+        self.assertFalse(result)
+        self.assertEqual(send.call_count, 2)
+        self.assertEqual(send.call_args[0][1], ['set', {'a': 1}, {}])
+        self.assertBatchParams([
+            {'$distinct_id': 'x', '$token': 'testtesttest', '$set': {'a': 1}},
+            {'$distinct_id': 'y', '$token': 'testtesttest', '$set': {'a': 2}},
+        ])
+
+    @patch('mixpanel.tasks.deadletter.send')
+    @patch.object(PeopleBatchTracker, 'apply_async')
+    def test_batch_drops_invalid_updates(self, apply_async, send):
+        people_tracker.batch([
+            ('set', {'a': 1}, {'distinct_id': 'x'}),
+            ('set', {'a': 1}, {}),
+        ])
+        self.assertEqual(send.call_count, 1)
+        self.assertEqual(apply_async.call_args[0][0], ([
+            ('set', {'a': 1}, {'distinct_id': 'x'}),
+        ],))
+
+    @patch.object(PeopleBatchTracker, 'retry')
+    def test_failed_batch_retried(self, retry):
+        self.response.status = 503
+        updates = [('set', {'foo': 'bar'}, {'distinct_id': 'x'})]
+        PeopleBatchTracker().run(updates)
+        self.assertEqual(retry.call_args[1]['args'][0], updates)
+
+    def test_batch(self):
+        with eager_tasks():
+            result = people_tracker.batch([
+                ('set', {'foo': 'bar'}, {'distinct_id': 'x'}),
+            ])
+        self.assertTrue(result)
+        self.assertBatchParams([
+            {'$distinct_id': 'x', '$token': 'testtesttest',
+             '$set': {'foo': 'bar'}},
+        ])
+
+    def test_instantiated_people_batch_tracker_delay(self):
+        with eager_tasks():
+            people_batch_tracker.delay([
+                ('set', {'foo': 'bar'}, {'distinct_id': 'x'}),
+            ])
+        self.assertBatchParams([
+            {'$distinct_id': 'x', '$token': 'testtesttest',
+             '$set': {'foo': 'bar'}},
+        ])
+
+
 class BrokenRequestsTest(TasksTestCase):
 
     def test_failed_request(self):
@@ -363,6 +1214,221 @@ class BrokenRequestsTest(TasksTestCase):
         self.assertNotEqual(result.traceback, None)
 
 
+class RetryTest(TasksTestCase):
+
+    @patch.object(EventTracker, 'retry')
+    def test_server_error_retried(self, retry):
+        self.response.status = 503
+        self.response.reason = 'Service Unavailable'
+        EventTracker().run('event_foo')
+        self.assertEqual(retry.call_count, 1)
+        exc = retry.call_args[1]['exc']
+        self.assertIsInstance(exc, EventTracker.FailedEventRequest)
+        self.assertEqual(exc.status, 503)
+        self.assertTrue(0 <= retry.call_args[1]['countdown'] <= 10)
+
+    @patch.object(EventTracker, 'retry')
+    def test_retry_after_honored(self, retry):
+        self.response.status = 429
+        self.response.reason = 'Too Many Requests'
+        self.response.headers = {'Retry-After': '120'}
+        EventTracker().run('event_foo')
+        self.assertEqual(retry.call_args[1]['countdown'], 120)
+
+    @patch.object(EventTracker, 'retry')
+    def test_client_error_not_retried(self, retry):
+        self.response.status = 400
+        self.response.reason = 'Bad Request'
+        with self.assertRaises(EventTracker.RejectedEventRequest):
+            EventTracker().run('event_foo')
+        self.assertFalse(retry.called)
+
+    @patch.object(BatchEventTracker, 'retry')
+    def test_batch_client_error_not_retried(self, retry):
+        self.response.status = 413
+        self.response.reason = 'Request Entity Too Large'
+        with self.assertRaises(EventTracker.RejectedEventRequest):
+            BatchEventTracker().run([('event_foo', {})])
+        self.assertFalse(retry.called)
+
+
+class CircuitBreakerTest(TasksTestCase):
+
+    def tearDown(self):
+        circuit_breaker.reset()
+        super(CircuitBreakerTest, self).tearDown()
+
+    @patch.object(EventTracker, 'retry')
+    def test_opens_after_failures(self, retry):
+        self.response.status = 503
+        for i in range(circuit_breaker.min_calls):
+            EventTracker().run('event_foo')
+        self.assertEqual(circuit_breaker.state, OPEN)
+
+    @patch.object(EventTracker, 'retry')
+    def test_open_circuit_fails_fast(self, retry):
+        circuit_breaker._open()
+        EventTracker().run('event_foo')
+        self.assertEqual(self.conn.request_call_args, [])
+        exc = retry.call_args[1]['exc']
+        self.assertIsInstance(exc, EventTracker.CircuitOpen)
+        self.assertTrue(retry.call_args[1]['countdown'] > 0)
+
+    def test_rejections_dont_open_circuit(self):
+        self.response.status = 400
+        for i in range(circuit_breaker.min_calls):
+            with self.assertRaises(EventTracker.RejectedEventRequest):
+                EventTracker().run('event_foo')
+        self.assertNotEqual(circuit_breaker.state, OPEN)
+
+    def test_unexpected_error_ends_trial(self):
+        with patch('mixpanel.circuit._now', return_value=100):
+            circuit_breaker._open()
+        with patch('mixpanel.circuit._now',
+                   return_value=100 + circuit_breaker.reset_timeout):
+            with patch.object(EventTracker, '_send',
+                              side_effect=RuntimeError('boom')):
+                with self.assertRaises(RuntimeError):
+                    EventTracker()._send_request(self.conn, 'data=x')
+            # The failed trial opened the breaker again, rather than
+            # leaving it waiting for the trial forever.
+            self.assertEqual(circuit_breaker.state, OPEN)
+            self.assertFalse(circuit_breaker._trial_running)
+
+    def test_disabled(self):
+        circuit_breaker._open()
+        mp_settings.MIXPANEL_CIRCUIT_BREAKER = False
+        try:
+            self.assertTrue(EventTracker().run('event_foo'))
+        finally:
+            mp_settings.MIXPANEL_CIRCUIT_BREAKER = True
+
+
+class SpoolTest(TasksTestCase):
+
+    def setUp(self):
+        super(SpoolTest, self).setUp()
+        mp_settings.MIXPANEL_SPOOL_DIR = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(mp_settings.MIXPANEL_SPOOL_DIR)
+        mp_settings.MIXPANEL_SPOOL_DIR = None
+        circuit_breaker.reset()
+        super(SpoolTest, self).tearDown()
+
+    def spooled(self):
+        spool = get_spool()
+        spool.seal()
+        paths = spool.claim()
+        records = [record for path in paths for record in spool.read(path)]
+        for path in paths:
+            spool.unclaim(path)
+        return records
+
+    @patch.object(EventTracker, 'retry')
+    def test_failure_retried_before_max_retries(self, retry):
+        self.response.status = 503
+        EventTracker().run('event_foo')
+        self.assertTrue(retry.called)
+        self.assertEqual(self.spooled(), [])
+
+    @patch.object(EventTracker, 'retry')
+    def test_spooled_when_circuit_open(self, retry):
+        circuit_breaker._open()
+        self.assertFalse(EventTracker().run('event_foo'))
+        self.assertFalse(retry.called)
+        self.assertEqual(self.spooled(), [(
+            'mixpanel.tasks.EventTracker',
+            {'event': 'event_foo', 'properties': {'token': 'testtesttest'}},
+            None,
+        )])
+
+    @patch.object(EventTracker, 'retry')
+    def test_encoded_event_spooled_decoded(self, retry):
+        circuit_breaker._open()
+        EventTracker().run('event_foo', [
+            '{"event":"event_foo","properties":{"token":"xxx"}}', None,
+        ], encoded=True)
+        self.assertEqual(self.spooled(), [(
+            'mixpanel.tasks.EventTracker',
+            {'event': 'event_foo', 'properties': {'token': 'xxx'}},
+            None,
+        )])
+
+    @patch.object(BatchEventTracker, 'retry')
+    def test_batch_spooled_after_max_retries(self, retry):
+        self.response.status = 503
+        mp_settings.MIXPANEL_BATCH_SIZE = 1
+        try:
+            with patch.object(BatchEventTracker, 'request') as request:
+                request.retries = BatchEventTracker.max_retries
+                BatchEventTracker().run([('event_a', {}), ('event_b', {})])
+        finally:
+            mp_settings.MIXPANEL_BATCH_SIZE = 50
+        self.assertFalse(retry.called)
+        self.assertEqual(
+            [params['event'] for name, params, test in self.spooled()],
+            ['event_a', 'event_b'],
+        )
+
+    def test_drain(self):
+        get_spool().write('mixpanel.tasks.EventTracker', [
+            {'event': 'event_a', 'properties': {'token': 'testtesttest'}},
+            {'event': 'event_b', 'properties': {'token': 'testtesttest'}},
+        ])
+        self.assertEqual(SpoolDrainer().run(), 2)
+        self.assertBatchParams([
+            {'event': 'event_a', 'properties': {'token': 'testtesttest'}},
+            {'event': 'event_b', 'properties': {'token': 'testtesttest'}},
+        ])
+        self.assertEqual(os.listdir(mp_settings.MIXPANEL_SPOOL_DIR), [])
+
+    def test_drain_failure_respools(self):
+        get_spool().write('mixpanel.tasks.EventTracker', [
+            {'event': 'event_a', 'properties': {'token': 'testtesttest'}},
+        ])
+        self.response.status = 503
+        self.assertEqual(SpoolDrainer().run(), 0)
+        self.assertEqual(len(self.spooled()), 1)
+
+    def test_drain_rejection_dead_letters(self):
+        get_spool().write('mixpanel.tasks.EventTracker', [
+            {'event': 'event_a', 'properties': {'token': 'testtesttest'}},
+        ])
+        self.response.status = 400
+        with patch('mixpanel.tasks.deadletter.send') as send:
+            self.assertEqual(SpoolDrainer().run(), 0)
+        self.assertEqual(send.call_count, 1)
+        self.assertEqual(self.spooled(), [])
+
+    def test_drain_error_unclaims(self):
+        get_spool().write('mixpanel.tasks.EventTracker', [
+            {'event': 'event_a', 'properties': {'token': 'testtesttest'}},
+        ])
+        with patch.object(SpoolDrainer, '_replay',
+                          side_effect=RuntimeError('boom')):
+            with self.assertRaises(RuntimeError):
+                SpoolDrainer().run()
+        self.assertEqual(len(self.spooled()), 1)
+
+    @patch.object(EventTracker, 'retry')
+    def test_test_flag_kept(self, retry):
+        circuit_breaker._open()
+        EventTracker().run('event_foo', test=True)
+        self.assertEqual(self.spooled()[0][2], True)
+        circuit_breaker.reset()
+        SpoolDrainer().run()
+        self.assertEqual(self.get_body_dict()['test'], '1')
+
+    def test_no_drain_while_circuit_open(self):
+        get_spool().write('mixpanel.tasks.EventTracker', [
+            {'event': 'event_a', 'properties': {'token': 'testtesttest'}},
+        ])
+        circuit_breaker._open()
+        self.assertEqual(SpoolDrainer().run(), 0)
+        self.assertEqual(self.conn.request_call_args, [])
+
+
 class FunnelEventTrackerTest(TasksTestCase):
 
     def test_afp_validation(self):
@@ -459,4 +1525,4 @@ class FunnelEventTrackerTest(TasksTestCase):
                 'goal': 'test_goal',
                 'step': 'test_step',
                 'token': 'testtesttest'}
-        })
+        }, stamped=True)
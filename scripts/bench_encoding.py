@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""
+Microbenchmark of the per-event cost of encoding Mixpanel request data.
+
+Compares the stdlib ``json.dumps`` the trackers used to call with every
+installed backend of ``mixpanel.encoding``, with and without
+super-properties, for single events and for batches.
+
+Usage: python scripts/bench_encoding.py [--number N] [--batch-size N]
+"""
+from __future__ import absolute_import, print_function, unicode_literals
+
+import argparse
+import base64
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from mixpanel import encoding  # noqa: E402
+
+SUPER_PROPERTIES = {
+    'app': 'web',
+    'app_version': '4.12.0',
+    'environment': 'production',
+    'region': 'eu-west-1',
+    'plan': 'enterprise',
+    'experiment_group': 'control',
+}
+
+
+def make_event(i):
+    return {
+        'event': 'page_view',
+        'properties': {
+            'token': '0123456789abcdef0123456789abcdef',
+            'distinct_id': 'user-%d' % i,
+            'path': '/products/%d' % i,
+            'referrer': 'https://www.example.com/search?q=widgets',
+            'time': 1500000000 + i,
+            '$insert_id': '%032x' % i,
+        },
+    }
+
+
+def stdlib_baseline(params):
+    merged = dict(SUPER_PROPERTIES)
+    if isinstance(params, list):
+        params = [dict(p, properties=dict(merged, **p['properties']))
+                  for p in params]
+    else:
+        params = dict(params, properties=dict(merged, **params['properties']))
+    return base64.b64encode(json.dumps(params).encode('utf8'))
+
+
+def bench(label, func, params, number, events):
+    seconds = min(timeit.repeat(lambda: func(params), number=number,
+                                repeat=3))
+    per_event = seconds / (number * events) * 1e6
+    print('%-40s %8.2f us/event' % (label, per_event))
+    return per_event
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--number', type=int, default=20000)
+    parser.add_argument('--batch-size', type=int, default=50)
+    args = parser.parse_args()
+
+    single = make_event(0)
+    batch = [make_event(i) for i in range(args.batch_size)]
+    backends = []
+    for name in encoding.BACKENDS:
+        try:
+            encoding.load_backend(name)
+        except ImportError:
+            print('%s: not installed' % name)
+            continue
+        backends.append(name)
+
+    for label, params, number, events in (
+            ('single event', single, args.number, 1),
+            ('batch of %d' % len(batch), batch,
+             max(1, args.number // len(batch)), len(batch))):
+        print('\n%s, %d super-properties' % (label, len(SUPER_PROPERTIES)))
+        baseline = bench('json.dumps, merged properties (before)',
+                         stdlib_baseline, params, number, events)
+        for name in backends:
+            encoding.dumps = encoding.load_backend(name)
+            encoder = encoding.EventEncoder(SUPER_PROPERTIES)
+            cost = bench(
+                'mixpanel.encoding with %s' % name,
+                lambda p: base64.b64encode(encoder.encode(p)),
+                params, number, events,
+            )
+            print('%40s %8.2fx' % ('speedup', baseline / cost))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+"""
+Benchmark of gzip compressing batched request bodies: CPU time spent
+against bytes saved, for batches of events with rich properties at
+several compression levels.
+
+Usage: python scripts/bench_gzip.py [--number N]
+"""
+from __future__ import absolute_import, print_function, unicode_literals
+
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from mixpanel.tasks import batch_event_tracker, gzip_compress  # noqa: E402
+
+LEVELS = (1, 6, 9)
+
+
+def make_event(i, rng):
+    return {
+        'event': rng.choice(['page_view', 'signup', 'purchase', 'search']),
+        'properties': {
+            'token': '0123456789abcdef0123456789abcdef',
+            'distinct_id': 'user-%d' % rng.randint(1, 10 ** 6),
+            '$insert_id': '%032x' % rng.getrandbits(128),
+            'time': 1500000000 + rng.randint(0, 10 ** 6),
+            'path': '/products/%d' % rng.randint(1, 10 ** 4),
+            'referrer': 'https://www.example.com/search?q=widgets',
+            'browser': rng.choice(['Chrome', 'Firefox', 'Safari']),
+            'os': rng.choice(['Windows', 'Mac OS X', 'Linux', 'iOS']),
+            'screen_width': rng.choice([1280, 1440, 1920]),
+            'experiments': ['exp-%d' % rng.randint(1, 20) for _ in range(3)],
+            'cart_total': round(rng.uniform(0, 500), 2),
+            'utm_source': rng.choice(['google', 'newsletter', 'twitter']),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--number', type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    print('%-8s %-6s %10s %10s %7s %12s' % (
+        'events', 'level', 'bytes', 'gzipped', 'ratio', 'us/request'))
+    for size in (1, 10, 50, 200):
+        params = [make_event(i, rng) for i in range(size)]
+        body = batch_event_tracker._encode_params(params, None)
+        data = body.encode('ascii')
+        for level in LEVELS:
+            compressed = gzip_compress(data, level)
+            seconds = min(timeit.repeat(
+                lambda: gzip_compress(data, level),
+                number=args.number, repeat=3,
+            ))
+            print('%-8d %-6d %10d %10d %6.1f%% %12.1f' % (
+                size, level, len(data), len(compressed),
+                100.0 * len(compressed) / len(data),
+                seconds / args.number * 1e6,
+            ))
+
+
+if __name__ == '__main__':
+    main()